@@ -0,0 +1,438 @@
+'''asyncio client for the Canvas REST API
+
+Requires the optional aiohttp dependency (pip install coursework[async]).
+
+The helpers here mirror the blocking ones in the rest of
+coursework.canvas (get_id_resources, new_id_resource,
+update_endpoint) and take and return the same larc Endpoint objects,
+so results can be handed straight to the blocking code. Listings are
+memoized in the same cache as the blocking getters.
+
+All requests go through one aiohttp session whose connector and
+semaphore bound the number of requests in flight, and through the same
+adaptive throttle.RateLimiter as the blocking session, so a
+multi-course sync can run on a single event loop:
+
+>>> async def main(api):
+...     async with aio.AsyncClient(api):
+...         courses = await aio.courses(api())
+...         pages = await aio.amap(aio.pages, courses)
+>>> aio.run(main(coursework.canvas.api.get_api_from_config()))
+
+'''
+import json
+import asyncio
+import logging
+import contextvars
+from typing import Callable, Iterable
+
+from toolz.curried import (
+    pipe, merge,
+)
+
+from larc.common import do_nothing
+from larc.rest import (
+    Api, Endpoint, IdResourceEndpoint, ResponseError, namespace_data,
+    empty_dict, memoize_resources, cache_has_key, cache_get, cache_remove,
+)
+
+from .resources import PER_PAGE, numbered_page_urls
+from .api import RATE_LIMITED_ATTEMPTS
+from .retry import RetryPolicy, RETRY_STATUSES, retry_after
+from .throttle import RateLimiter, is_rate_limited
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+DEFAULT_MAX_IN_FLIGHT = 100
+GET_KW = frozenset({'data', 'json'})
+
+_client = contextvars.ContextVar('coursework_aio_client', default=None)
+
+def current_client() -> 'AsyncClient':
+    client = _client.get()
+    if client is None:
+        raise RuntimeError(
+            'No AsyncClient is active. Use "async with AsyncClient(api):"'
+        )
+    return client
+
+class Response:
+    def __init__(self, url: str, status_code: int, headers, content: bytes,
+                 links):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.links = links
+
+    @property
+    def text(self):
+        return self.content.decode(errors='replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+    def link(self, rel: str):
+        return pipe(
+            self.links.get(rel, {}).get('url'),
+            lambda url: str(url) if url else None,
+        )
+
+def query_params(data: dict):
+    '''Flatten request data the way larc's Endpoint does
+    (e.g. {'include[]': ['a', 'b']} -> [('include[]', 'a'),
+    ('include[]', 'b')])
+
+    '''
+    params = []
+    for key, value in (namespace_data(data) or {}).items():
+        if isinstance(value, (list, tuple)):
+            params.extend((key, str(v)) for v in value)
+        else:
+            params.append((key, str(value)))
+    return params
+
+def checked_get_kw(get_kw: dict):
+    '''The keyword arguments for a GET, which the async client (unlike
+    requests) limits to data and json
+    '''
+    get_kw = get_kw or {}
+    unknown = set(get_kw) - GET_KW
+    if unknown:
+        raise TypeError(
+            f'Unsupported get_kw for the async client: {sorted(unknown)}'
+            f' (only {sorted(GET_KW)} are accepted)'
+        )
+    return get_kw
+
+async def acquire(limiter: RateLimiter):
+    '''Acquire a slot from the (threading-based) limiter without
+    blocking the event loop
+    '''
+    if limiter.try_acquire():
+        return
+    acquiring = asyncio.ensure_future(asyncio.to_thread(limiter.acquire))
+    try:
+        await asyncio.shield(acquiring)
+    except asyncio.CancelledError:
+        # The thread still takes its slot, so hand it back once it has
+        acquiring.add_done_callback(
+            lambda f: f.cancelled() or f.exception() or limiter.release()
+        )
+        raise
+
+class AsyncClient:
+    def __init__(self, api: Api, *,
+                 max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+                 retry: RetryPolicy = None, low_water: float = 150.0,
+                 limiter: RateLimiter = None):
+        if aiohttp is None:
+            raise ImportError(
+                'The asyncio Canvas client requires aiohttp'
+                ' (pip install coursework[async])'
+            )
+        self.api = api
+        self.max_in_flight = max_in_flight
+        self.retry = retry or RetryPolicy()
+        self.limiter = limiter or RateLimiter(
+            initial=min(10, max_in_flight), maximum=max_in_flight,
+            low_water=low_water,
+        )
+        self.session = None
+        self._semaphore = None
+        self._token = None
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_in_flight),
+            headers={'Authorization': f'Bearer {self.api.auth.token}'},
+        )
+        self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        self._token = _client.set(self)
+        return self
+
+    async def __aexit__(self, *exc):
+        _client.reset(self._token)
+        await self.session.close()
+
+    async def request(self, method: str, url: str, *, data: dict = None,
+                      json: dict = None) -> Response:
+        params = query_params(data) if data and method == 'GET' else None
+        form = query_params(data) if data and method != 'GET' else None
+        attempt = rate_limited = 0
+        while True:
+            # The limiter may hold a request back until Canvas's bucket
+            # refills, so wait on it before taking a semaphore slot
+            await acquire(self.limiter)
+            response = error = None
+            try:
+                async with self._semaphore:
+                    async with self.session.request(
+                            method, url, params=params, data=form,
+                            json=json) as resp:
+                        response = Response(
+                            str(resp.url), resp.status, resp.headers,
+                            await resp.read(), resp.links,
+                        )
+            except (aiohttp.ClientConnectionError,
+                    asyncio.TimeoutError) as e:
+                error = e
+            finally:
+                self.limiter.release(response)
+
+            if response is not None and is_rate_limited(response):
+                # Refused before it did anything, so requeue it whatever
+                # the method
+                rate_limited += 1
+                log.warning(
+                    f'[AsyncClient] Rate limited ({rate_limited}/'
+                    f'{RATE_LIMITED_ATTEMPTS}): {method} {url}'
+                )
+                if rate_limited >= RATE_LIMITED_ATTEMPTS:
+                    return response
+                after = retry_after(response)
+                if after:
+                    await asyncio.sleep(min(after, self.retry.max_backoff))
+                continue
+
+            attempt += 1
+            retryable = (
+                error is not None or
+                response.status_code in RETRY_STATUSES
+            )
+            if not (retryable and attempt <= self.retry.max_retries and
+                    self.retry.retries_method(method)):
+                if error is not None:
+                    raise error
+                return response
+
+            delay = self.retry.delay(attempt, response)
+            log.warning(
+                f'[AsyncClient] Retrying {method} {url} in {delay:.1f}s'
+                f' (attempt {attempt}/{self.retry.max_retries}):'
+                f' {error or response.status_code}'
+            )
+            await asyncio.sleep(delay)
+
+    def get(self, url, **kw):
+        return self.request('GET', url, **kw)
+
+    def post(self, url, **kw):
+        return self.request('POST', url, **kw)
+
+    def put(self, url, **kw):
+        return self.request('PUT', url, **kw)
+
+    def delete(self, url, **kw):
+        return self.request('DELETE', url, **kw)
+
+async def iter_pages(endpoint: Endpoint, **request_kw):
+    '''Yield the decoded JSON of each page of a Canvas listing in order
+
+    As with the blocking getters, if Canvas gives a numbered "last"
+    link, the remaining pages are fetched concurrently.
+
+    '''
+    client = current_client()
+
+    def checked(response):
+        if response.status_code != 200:
+            content = response.content.decode()
+            raise ResponseError(
+                f'Response code error: {response.status_code}\n\n'
+                f'{content[:200]}\n'
+            )
+        return response.json()
+
+    data = merge({'per_page': PER_PAGE}, request_kw.get('data') or {})
+    response = await client.get(
+        endpoint.url, **merge(request_kw, {'data': data}),
+    )
+    yield checked(response)
+
+    urls = numbered_page_urls(response.link('next'), response.link('last'))
+    if urls is not None:
+        # The page links already carry the query string
+        responses = await amap(lambda url: client.get(url), urls)
+        for response in responses:
+            yield checked(response)
+        return
+
+    url = response.link('next')
+    while url:
+        response = await client.get(url)
+        yield checked(response)
+        url = response.link('next')
+
+def get_id_resources(resource_name: str, *, form_key: str = None,
+                     id_key: str = 'id', meta_f=empty_dict,
+                     unpack_f=do_nothing, single_unpack_f=do_nothing,
+                     help=None, memo=False, data: dict = None):
+    async def getter(parent_endpoint: Endpoint, *, do_memo=True):
+        if (memo and do_memo) and cache_has_key(parent_endpoint,
+                                                resource_name):
+            return cache_get(parent_endpoint, resource_name)
+
+        resources = []
+        async for page in iter_pages(parent_endpoint(resource_name),
+                                     data=data):
+            resources.extend(
+                IdResourceEndpoint(
+                    parent_endpoint(resource_name), d, form_key, id_key,
+                    meta_f=meta_f, unpack_f=unpack_f,
+                    single_unpack_f=single_unpack_f,
+                )
+                for d in unpack_f(page)
+            )
+        return memoize_resources(
+            parent_endpoint, resource_name, tuple(resources)
+        )
+    getter.__doc__ = help or ''
+    return getter
+
+def new_id_resource(resource_name: str, *, form_key: str = None,
+                    id_key: str = 'id', get_kw=None, help: str = None,
+                    meta_f=empty_dict, unpack_f=do_nothing,
+                    single_unpack_f=do_nothing,
+                    post_unpack_f=do_nothing,
+                    body_transform=do_nothing):
+    get_kw = checked_get_kw(get_kw)
+
+    async def creator(parent_endpoint: Endpoint, body: dict):
+        client = current_client()
+        body = dict(body_transform(body))
+        body = {form_key: body} if form_key is not None else body
+        response = await client.post(
+            parent_endpoint(resource_name).url, json=body,
+        )
+        if response.status_code in range(200, 300):
+            post_data = post_unpack_f(response.json())
+            new_response = await client.get(
+                parent_endpoint(resource_name, post_data[id_key]).url,
+                **get_kw,
+            )
+            if new_response.status_code in range(200, 300):
+                cache_remove(parent_endpoint, resource_name)
+                return IdResourceEndpoint(
+                    parent_endpoint(resource_name), new_response.json(),
+                    form_key=form_key, id_key=id_key, meta_f=meta_f,
+                    unpack_f=unpack_f, single_unpack_f=single_unpack_f,
+                )
+            response = new_response
+
+        log.error(
+            f'There was an error creating {resource_name} object:\n'
+            f'  body: {body}\n'
+            f'  form_key: {form_key}\n'
+            f'  id_key: {id_key}\n'
+            'Response:\n'
+            f'{response.content[:1000]}'
+        )
+    creator.__doc__ = help or ''
+    return creator
+
+async def refresh(endpoint: IdResourceEndpoint, **get_kw):
+    response = await current_client().get(
+        endpoint.url, **checked_get_kw(get_kw),
+    )
+    return IdResourceEndpoint(
+        endpoint.parent, endpoint.single_unpack_f(response.json()),
+        endpoint.form_key, endpoint.id_key, meta_f=endpoint.meta_f,
+        unpack_f=endpoint.unpack_f,
+        single_unpack_f=endpoint.single_unpack_f,
+    )
+
+async def update_endpoint(endpoint: IdResourceEndpoint, update: dict, *,
+                          body_transform=do_nothing, get_kw=None,
+                          do_refresh=True):
+    update = dict(body_transform(update))
+    response = await current_client().put(
+        endpoint.url,
+        json=({endpoint.form_key: update}
+              if endpoint.form_key is not None else update),
+    )
+    if response.status_code in range(200, 300):
+        if do_refresh:
+            return await refresh(endpoint, **checked_get_kw(get_kw))
+        return endpoint
+
+    log.error(
+        f'There was an error after updating endpoint {endpoint.url}:\n'
+        f'Response code: {response.status_code}\n'
+        'Response:\n'
+        f'{response.content[:1000]}'
+    )
+    return endpoint
+
+async def amap(func: Callable, iterable: Iterable, *iterables):
+    '''Concurrently await func over the given iterables, returning a
+    tuple of results in order. The client's semaphore bounds how many
+    requests are actually in flight.
+
+    '''
+    return tuple(await asyncio.gather(*(
+        func(*args) for args in zip(iterable, *iterables)
+    )))
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+# ----------------------------------------------------------------------
+# Async equivalents of the resource helpers in course, page, quiz,
+# module and assignment
+# ----------------------------------------------------------------------
+
+COURSE_INCLUDE = {'include[]': ['term', 'total_students', 'syllabus_body']}
+
+def courses(api_endpoint: Endpoint, *, do_memo=True):
+    from .course import default_course_meta_f
+    return get_id_resources(
+        'courses', form_key='course', memo=True, data=COURSE_INCLUDE,
+        meta_f=default_course_meta_f,
+    )(api_endpoint, do_memo=do_memo)
+
+pages = get_id_resources(
+    'pages', form_key='wiki_page', id_key='url', memo=True,
+)
+new_page = new_id_resource('pages', form_key='wiki_page', id_key='url')
+
+quizzes = get_id_resources('quizzes', form_key='quiz', memo=True)
+new_quiz = new_id_resource('quizzes', form_key='quiz')
+questions = get_id_resources('questions', form_key='question')
+new_question = new_id_resource('questions', form_key='question')
+
+modules = get_id_resources('modules', form_key='module', memo=True)
+new_module = new_id_resource('modules', form_key='module')
+items = get_id_resources(
+    'items', form_key='module_item', memo=True,
+    data={'include[]': ['content_details']},
+)
+new_item = new_id_resource('items', form_key='module_item')
+
+assignment_groups = get_id_resources('assignment_groups', memo=True)
+new_assignment_group = new_id_resource('assignment_groups')
+
+async def assignments(course: Endpoint, *, do_memo=True):
+    return tuple(
+        a for a in await _assignments(course, do_memo=do_memo)
+        if not a.data['is_quiz_assignment']
+    )
+_assignments = get_id_resources(
+    'assignments', form_key='assignment', memo=True,
+)
+
+def new_assignment(course: Endpoint, body: dict):
+    from .assignment import transform_assignment_params
+    return new_id_resource(
+        'assignments', form_key='assignment',
+        body_transform=transform_assignment_params,
+    )(course, body)
+
+files = get_id_resources('files', memo=True)
+folders = get_id_resources('folders', memo=True)
@@ -1,6 +1,10 @@
+import time
 import logging
+import threading
+import urllib.parse
 
 import requests
+import requests.adapters
 from toolz.curried import (
     curry,
 )
@@ -9,12 +13,239 @@ from larc.rest import (
     Api, TokenAuth,
 )
 
+from .throttle import RateLimiter, is_rate_limited
+from .retry import (
+    RetryPolicy, CircuitBreaker, is_failure, rewind_body, retry_after,
+)
+from .metrics import Metrics, response_bytes
+from .http_cache import (
+    HttpCache, WRITE_METHODS, request_key, conditional_headers,
+)
+
 log = logging.getLogger(__name__)
 log.addHandler(logging.NullHandler())
 
+# The CLI sync commands run 10 outer workers, each of which may fan
+# out to 5 inner workers, so up to 50 threads can be talking to
+# Canvas at once.
+DEFAULT_POOL_SIZE = 50
+
+# Number of times a request refused with "Rate Limit Exceeded" is put
+# back in the limiter's queue before the refusal is returned
+RATE_LIMITED_ATTEMPTS = 5
+
+class CanvasSession(requests.Session):
+    '''Session that sends every request through a per-host RateLimiter
+    and CircuitBreaker shared by all threads, retrying transient
+    failures according to its RetryPolicy
+
+    If given an HttpCache, GET responses are served from and revalidated
+    against it. Every request is recorded in the session's Metrics.
+
+    A request may pass retry=RetryPolicy(...) to override the session's
+    policy (e.g. to retry a POST that is safe to repeat).
+
+    '''
+    def __init__(self, *, max_in_flight: int = DEFAULT_POOL_SIZE,
+                 retry: RetryPolicy = None, cache: HttpCache = None):
+        super().__init__()
+        self.max_in_flight = max_in_flight
+        self.retry = retry or RetryPolicy()
+        self.cache = cache
+        self.metrics = Metrics()
+        self.limiters = {}
+        self.breakers = {}
+        self._hosts_lock = threading.Lock()
+
+    def _per_host(self, table: dict, url: str, factory):
+        host = urllib.parse.urlsplit(url).netloc
+        with self._hosts_lock:
+            if host not in table:
+                table[host] = factory(host)
+            return table[host]
+
+    def limiter(self, url: str) -> RateLimiter:
+        return self._per_host(
+            self.limiters, url,
+            lambda host: RateLimiter(maximum=self.max_in_flight),
+        )
+
+    def breaker(self, url: str) -> CircuitBreaker:
+        return self._per_host(self.breakers, url, CircuitBreaker)
+
+    def request(self, method, url, *a, **kw):
+        method = method.upper()
+        start = time.monotonic()
+        try:
+            response = self.cached_request(method, url, *a, **kw)
+        except Exception:
+            self.metrics.record(
+                method, url, 'error', time.monotonic() - start,
+            )
+            raise
+
+        if getattr(response, 'from_cache', False):
+            status = '304' if getattr(response, 'revalidated', False) else (
+                'cache'
+            )
+            nbytes = 0
+        else:
+            status, nbytes = response.status_code, response_bytes(response)
+        self.metrics.record(
+            method, url, status, time.monotonic() - start,
+            nbytes=nbytes, retries=getattr(response, 'retries', 0),
+        )
+        return response
+
+    def cached_request(self, method, url, *a, **kw):
+        if self.cache is None or kw.get('stream'):
+            return self.send_with_policy(method, url, *a, **kw)
+
+        if method in WRITE_METHODS:
+            response = self.send_with_policy(method, url, *a, **kw)
+            if response.status_code in range(200, 300):
+                self.cache.invalidate(url)
+            return response
+
+        if method != 'GET':
+            return self.send_with_policy(method, url, *a, **kw)
+
+        key = request_key(url, kw)
+        entry = self.cache.get(key)
+        if entry is not None:
+            if self.cache.fresh(entry):
+                return entry.response()
+            kw['headers'] = conditional_headers(entry, kw.get('headers'))
+
+        response = self.send_with_policy(method, url, *a, **kw)
+        if entry is not None and response.status_code == 304:
+            self.cache.revalidated(entry)
+            cached = entry.response()
+            cached.revalidated = True
+            return cached
+        if response.status_code == 200:
+            self.cache.put(key, response)
+        return response
+
+    def send_with_policy(self, method, url, *a, retry: RetryPolicy = None,
+                         **kw):
+        retry = retry or self.retry
+        limiter = self.limiter(url)
+        breaker = self.breaker(url)
+        attempt = rate_limited = 0
+        while True:
+            breaker.before()
+            limiter.acquire()
+            response = error = None
+            try:
+                response = super().request(method, url, *a, **kw)
+            except requests.exceptions.RequestException as e:
+                error = e
+            except BaseException:
+                breaker.abandon()
+                raise
+            finally:
+                limiter.release(response)
+            # Recorded for every response, including refusals for the
+            # rate limit (which the limiter handles), so a half-open
+            # trial never stays in flight
+            breaker.record(not is_failure(response, error))
+
+            if response is not None and is_rate_limited(response):
+                rate_limited += 1
+                log.warning(
+                    f'[CanvasSession] Rate limited ({rate_limited}/'
+                    f'{RATE_LIMITED_ATTEMPTS}): {method} {url}'
+                )
+                if rate_limited < RATE_LIMITED_ATTEMPTS and rewind_body(kw):
+                    # The limiter holds the request back until the
+                    # bucket refills, unless Canvas says to wait longer
+                    after = retry_after(response)
+                    response.close()
+                    if after:
+                        time.sleep(min(after, retry.max_backoff))
+                    continue
+                response.retries = attempt + rate_limited - 1
+                return response
+
+            attempt += 1
+            if (retry.should_retry(method, attempt, response, error)
+                    and rewind_body(kw)):
+                delay = retry.delay(attempt, response)
+                log.warning(
+                    f'[CanvasSession] Retrying {method} {url} in'
+                    f' {delay:.1f}s (attempt {attempt}/'
+                    f'{retry.max_retries}):'
+                    f' {error or response.status_code}'
+                )
+                if response is not None:
+                    response.close()
+                time.sleep(delay)
+                continue
+
+            if error is not None:
+                raise error
+            response.retries = attempt + rate_limited - 1
+            return response
+
+def new_session(pool_size: int = DEFAULT_POOL_SIZE, *,
+                retry: RetryPolicy = None,
+                cache: HttpCache = None) -> requests.Session:
+    '''Create a CanvasSession whose connection pools are sized for the
+    given level of concurrency
+
+    The pools block (rather than open throwaway connections) when all
+    connections to a host are busy, so keep-alive connections to the
+    Canvas API host and the file upload/download hosts are reused
+    instead of re-handshaking TLS on every request.
+
+    '''
+    session = CanvasSession(
+        max_in_flight=pool_size, retry=retry, cache=cache,
+    )
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=10, pool_maxsize=pool_size, pool_block=True,
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+_session = None
+_session_lock = threading.Lock()
+def get_session() -> requests.Session:
+    '''Return the process-wide Session shared by every Api object and
+    every raw (non-Api) request (e.g. file uploads and downloads)
+
+    '''
+    global _session
+    with _session_lock:
+        if _session is None:
+            from ..config import (
+                get_pool_size, get_retry_post, get_http_cache,
+            )
+            cache_config = get_http_cache()
+            _session = new_session(
+                get_pool_size() or DEFAULT_POOL_SIZE,
+                retry=RetryPolicy(retry_post=bool(get_retry_post())),
+                cache=(
+                    HttpCache(**cache_config)
+                    if cache_config is not None else None
+                ),
+            )
+        return _session
+
+def reset_session():
+    '''Close and discard the process-wide Session
+    '''
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+
 @curry
 def get_api(base_url, token, *, session: requests.Session = None):
-    return Api(base_url, TokenAuth(token), session or requests.Session())
+    return Api(base_url, TokenAuth(token), session or get_session())
 
 def get_api_from_config(config: dict = None):
     from ..config import get_base_url, get_token
@@ -0,0 +1,214 @@
+'''Content-addressed index of a course's files
+
+Maps the content hash of a local file to the Canvas file holding that
+content, so that templates (file_link, image_link, image_anchor) upload
+each distinct file once per course and otherwise link to it without
+any request of their own.
+
+The index is built (once per course per process) from the course's
+file listing and the file-hashes store (see file_hash). Files uploaded
+by older versions under a hashed name (<stem>-<md5><suffix>, see
+common.hashed_path) are indexed by the hash in their name. Hashes made
+with an algorithm other than the configured one (see hashing) are
+matched by rehashing the local file with that algorithm.
+
+When a course lacks a file whose content is in the index of another
+course (e.g. another section being synced by the same command), Canvas
+copies it across (see file.copy_file) rather than the bytes being
+uploaded again. Only courses already indexed in this process are
+searched: the file-hashes store maps file uuids to hashes, not hashes
+to courses, so finding the content anywhere else would mean listing
+the files of every course.
+
+>>> asset_url(course, Path('images/diagram.png'))
+
+'''
+import re
+import logging
+import threading
+from pathlib import Path
+
+from larc.rest import IdResourceEndpoint
+
+from ..common import hash_from_path
+from ..hashing import ALGORITHMS, digest_algorithm, prefixed
+from . import file_hash
+from .file import copy_file, files, upload_course_file
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+HASHED_NAME_RE = re.compile(
+    rf'-(?:({"|".join(ALGORITHMS)})-)?([0-9a-f]{{32}})(\.[^.]*)?$'
+)
+
+def name_hash(filename: str):
+    match = HASHED_NAME_RE.search(filename or '')
+    if match:
+        return prefixed(match.group(2), match.group(1) or 'md5')
+
+class AssetIndex:
+    def __init__(self, course: IdResourceEndpoint):
+        self.course = course
+        self._by_hash = None
+        self._lock = threading.RLock()
+
+    def _build(self):
+        hashes = file_hash.get_file_hashes(self.course.api)
+        by_hash = {}
+        for f in files(self.course):
+            content_hash = (
+                hashes.get(f.data.get('uuid'))
+                or name_hash(f.data.get('filename'))
+            )
+            if content_hash:
+                by_hash.setdefault(content_hash, f.data)
+        log.debug(
+            f'[AssetIndex] {len(by_hash)} files indexed for course'
+            f' {self.course.data.get("name")}'
+        )
+        return by_hash
+
+    @property
+    def built(self):
+        return self._by_hash is not None
+
+    @property
+    def by_hash(self):
+        with self._lock:
+            if self._by_hash is None:
+                self._by_hash = self._build()
+            return self._by_hash
+
+    def get(self, content_hash: str):
+        '''The data of the Canvas file with this content, or None
+        '''
+        with self._lock:
+            return self.by_hash.get(content_hash)
+
+    def algorithms(self):
+        '''The algorithms of the hashes in the index
+        '''
+        # A snapshot, since add() may change the index meanwhile
+        with self._lock:
+            return {digest_algorithm(h) for h in self.by_hash}
+
+    def find(self, path: Path, content_hash: str):
+        '''The data of the Canvas file with the content of the local file
+        at path (whose hash is content_hash), under whichever algorithm
+        the Canvas file's hash was made with, or None
+        '''
+        data = self.get(content_hash)
+        if data is None:
+            others = self.algorithms() - {digest_algorithm(content_hash)}
+            for alg in sorted(others & set(ALGORITHMS)):
+                try:
+                    data = self.get(hash_from_path(path, alg))
+                except ValueError:
+                    continue
+                if data is not None:
+                    break
+        return data
+
+    def add(self, content_hash: str, data: dict):
+        with self._lock:
+            # Uploading replaces a file of the same name in the folder,
+            # so whatever content that file had is no longer there
+            replaced = [
+                h for h, d in self.by_hash.items()
+                if d.get('display_name') == data.get('display_name')
+                and d.get('folder_id') == data.get('folder_id')
+            ]
+            for h in replaced:
+                del self.by_hash[h]
+            self.by_hash[content_hash] = data
+
+    def upload(self, path: Path, content_hash: str, *, force: bool = False):
+        '''Upload the file at path unless its content is already in the
+        course (or force is given), returning the Canvas file data. If
+        another course has the content, Canvas copies it from there.
+        '''
+        with hash_lock(content_hash):
+            if not force and self.find(path, content_hash):
+                return self.find(path, content_hash)
+            source = (
+                None if force else find_elsewhere(self, path, content_hash)
+            )
+            file_ep = source and copy_file(self.course, source['id'])
+            if file_ep:
+                log.info(
+                    f'[AssetIndex] copied {path.name} from file'
+                    f' {source["id"]}'
+                )
+            else:
+                file_ep = upload_course_file(self.course, path)
+            if not file_ep:
+                return None
+            # The course's memoized file listing no longer has them all
+            files.reset_cache(self.course)
+            file_hash.set_file_hash(file_ep, content_hash)
+            self.add(content_hash, file_ep.data)
+            return file_ep.data
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+def course_index(course: IdResourceEndpoint) -> AssetIndex:
+    with _indexes_lock:
+        if course.url not in _indexes:
+            _indexes[course.url] = AssetIndex(course)
+        return _indexes[course.url]
+
+# content hash -> lock, so that concurrent renders of the same content
+# (in one course or several) upload it only once
+_hash_locks = {}
+def hash_lock(content_hash: str):
+    with _indexes_lock:
+        return _hash_locks.setdefault(content_hash, threading.Lock())
+
+def find_elsewhere(index: AssetIndex, path: Path, content_hash: str):
+    '''The data of a file with the content of the local file at path in
+    a course other than index's, or None
+
+    Only the courses whose indexes this process has already built are
+    searched (see the module docstring); no other course is listed.
+    '''
+    with _indexes_lock:
+        others = [i for i in _indexes.values() if i is not index]
+    for other in others:
+        data = other.built and other.find(path, content_hash)
+        if data:
+            return data
+
+def reset():
+    with _indexes_lock:
+        _indexes.clear()
+        _hash_locks.clear()
+
+def asset_file(course: IdResourceEndpoint, path: Path, *,
+               force_upload: bool = False):
+    '''The Canvas file with the content of the local file at path,
+    uploading (or copying) it if the course doesn't have it yet (or
+    None if that failed)
+    '''
+    index = course_index(course)
+    content_hash = hash_from_path(path)
+    data = None if force_upload else index.find(path, content_hash)
+    if data is None:
+        log.info(
+            f'[asset_url]{" -FORCE-" if force_upload else ""}'
+            f' uploading file: {path}'
+        )
+        data = index.upload(path, content_hash, force=force_upload)
+    if data:
+        return IdResourceEndpoint(
+            course.api('files'), data, form_key=None, id_key='id',
+        )
+
+def asset_url(course: IdResourceEndpoint, path: Path, *,
+              force_upload: bool = False):
+    '''URL of the Canvas file with the content of the local file at
+    path, uploading (or copying) it if the course doesn't have it yet
+    (or None if that failed)
+    '''
+    file_ep = asset_file(course, path, force_upload=force_upload)
+    return file_ep.data['url'] if file_ep else None
@@ -8,7 +8,6 @@ import logging
 import tempfile
 import pprint
 
-import requests
 from toolz.curried import (
     compose, filter, pipe, map, curry, merge, first,
 )
@@ -20,18 +19,23 @@ from larc.common import (
 )
 from larc import common as lcommon
 from larc.rest import (
-    get_id_resources, new_id_resource, update_endpoint, IdResourceEndpoint,
+    new_id_resource, update_endpoint, IdResourceEndpoint,
 )
 from larc import yaml
 from larc.parallel import thread_map
 
+from .resources import get_id_resources
 from .course import (
     course_resource_docstring, create_course_resource_docstring,
 )
-from .metadata import get_metadata, set_metadata
+from .api import get_session
+from .metadata import get_metadata, update_metadata
+from .fingerprint import is_current, with_fingerprint
 from ..common import (
-    hash_from_content, hash_from_dict, resolve_path,
+    hash_from_dict, resolve_path, text_hash_from_path,
 )
+from ..hashing import same_content
+from .. import config
 from .. import templates
 
 log = logging.getLogger(__name__)
@@ -174,7 +178,9 @@ def sync_assignment_groups_from_path(course: IdResourceEndpoint,
             map(vdo(lambda d, h, ep: log_info(
                 f'... setting hash: {h}'
             ))),
-            map(vdo(lambda d, h, ep: set_metadata(ep, {'hash': h}))),
+            map(vdo(lambda d, h, ep: update_metadata(
+                ep, lambda md: merge(md, {'hash': h}),
+            ))),
             tuple,
         )
 
@@ -193,10 +199,13 @@ def sync_assignment_groups_from_path(course: IdResourceEndpoint,
     for data in group_data:
         ep, h = name_to_ep[data['name']]
         data_hash = hash_from_dict(data)
-        if h != data_hash:
+        if not same_content(h, data_hash,
+                            lambda alg: hash_from_dict(data, alg)):
             log_info(f'Updating group: {data["name"]}')
             update_endpoint(ep, data)
-            set_metadata(ep, {'hash': data_hash})
+            update_metadata(
+                ep, lambda md: merge(md, {'hash': data_hash}),
+            )
 
 # ----------------------------------------------------------------------
 #
@@ -279,6 +288,11 @@ def sync_assignment_from_path(course: IdResourceEndpoint, course_root: str,
     #     if 'use_rubric_for_grading' not in assign_data:
     #         assign_data['use_rubric_for_grading'] = True
 
+    if config.get_content_fingerprints():
+        return sync_fingerprinted_assignment(
+            course, course_root, path, assign_data, group_ep, html,
+        )
+
     assignment = find_assignment(course, name)
     if not assignment:
         # Need to create new
@@ -292,10 +306,11 @@ def sync_assignment_from_path(course: IdResourceEndpoint, course_root: str,
     assign_md = get_metadata(assignment)
 
     path = resolve_path(course_root, path)
-    content_hash = hash_from_content(path.read_text())
+    content_hash = text_hash_from_path(path)
     extant_hash = assign_md.get('hash')
 
-    if not content_hash == extant_hash:
+    if not same_content(extant_hash, content_hash,
+                        lambda alg: text_hash_from_path(path, alg)):
         if group_ep:
             log_info(
                 f"Found assignment group for {name}: {group_ep.data['name']}"
@@ -308,8 +323,9 @@ def sync_assignment_from_path(course: IdResourceEndpoint, course_root: str,
             f'Updating assignment "{name}" at {path}:\n'
             f'{pprint.pformat(assign_data)}'
         )
-        assign_md['hash'] = content_hash
-        set_metadata(assignment, assign_md)
+        update_metadata(
+            assignment, lambda md: merge(md, {'hash': content_hash}),
+        )
         
         return update_assignment(
             assignment, merge(assign_data, {'description': str(html)}),
@@ -317,6 +333,45 @@ def sync_assignment_from_path(course: IdResourceEndpoint, course_root: str,
         )
     return assignment
 
+def sync_fingerprinted_assignment(course: IdResourceEndpoint,
+                                  course_root: str, path: Union[str, Path],
+                                  assign_data: dict,
+                                  group_ep: IdResourceEndpoint, html):
+    '''Sync an assignment whose description carries its source's content
+    hash, so that an unchanged assignment costs nothing beyond the
+    (shared) listing of the course's assignments
+
+    '''
+    name = assign_data['name']
+    path = resolve_path(course_root, path)
+    content_hash = text_hash_from_path(path)
+    assign_data = merge(assign_data, {
+        'description': with_fingerprint(str(html), content_hash),
+    })
+    if group_ep:
+        assign_data['assignment_group_id'] = group_ep.data['id']
+
+    assignment = pipe(
+        assignments(course),
+        filter(lambda a: a.data['name'] == name),
+        lcommon.maybe_first,
+    )
+    if not assignment:
+        log.info(
+            '[sync_assignment_from_path] Creating new assignment:'
+            f' "{name}" from {path}'
+        )
+        return new_assignment(course, assign_data)
+
+    if is_current(assignment.data.get('description'), content_hash,
+                  lambda alg: text_hash_from_path(path, alg)):
+        return assignment
+
+    log.info(
+        f'[sync_assignment_from_path] Updating assignment "{name}" at {path}'
+    )
+    return update_assignment(assignment, assign_data)
+
 @curry
 def sync_assignments_from_path(course: IdResourceEndpoint, course_root: str,
                                assignments_root: str, *,
@@ -353,7 +408,7 @@ def save_attachments(submission: IdResourceEndpoint,
         map(lcommon.get_many_t(['filename', 'url'])),
         filter(all),
         map_func(lcommon.vcall(lambda f, u: (
-            Path(output_dir, f).expanduser(), requests.get(u)
+            Path(output_dir, f).expanduser(), get_session().get(u)
         ))),
         lcommon.vfilter(lambda p, r: r.status_code in range(200, 300)),
         lcommon.vmap(lambda p, r: (
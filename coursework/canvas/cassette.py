@@ -0,0 +1,270 @@
+'''Record and replay Canvas HTTP traffic
+
+A cassette is a JSON list of request/response pairs (the same layout
+as the cassettes under tests/canvas/cassettes). Recording mounts a
+transport adapter on a Session that passes each request through to
+the real adapter and saves the exchange. Replaying mounts an adapter
+that answers from the cassette without touching the network, either
+instantly or with each response's originally recorded latency.
+
+>>> session = coursework.canvas.api.get_session()
+>>> with cassette.recording(session, 'sync-quiz.json'):
+...     coursework.canvas.quiz.sync_quiz_from_path(course, root, path)
+>>> with cassette.replaying(session, 'sync-quiz.json'):
+...     coursework.canvas.quiz.sync_quiz_from_path(course, root, path)
+
+Credentials (Authorization and cookie headers, Canvas' session
+headers) are redacted when recording. Streamed responses (e.g. file
+downloads) are recorded without their body unless it is small.
+
+'''
+import json
+import time
+import base64
+import logging
+import threading
+import contextlib
+import urllib.parse
+from pathlib import Path
+from collections import defaultdict
+from typing import Union
+
+import requests
+import requests.adapters
+from requests.structures import CaseInsensitiveDict
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+REDACTED = 'REDACTED'
+REDACT_HEADERS = {
+    'authorization', 'proxy-authorization', 'cookie', 'set-cookie',
+    'x-session-id', 'x-canvas-meta',
+}
+
+# Largest body of a stream=True response that is read in to be recorded
+MAX_STREAMED_BODY = 2**20
+
+# Describe the recorded (encoded) body, not the decoded one we store
+DROP_RESPONSE_HEADERS = {
+    'content-encoding', 'transfer-encoding', 'content-length',
+}
+
+class CassetteMiss(requests.exceptions.RequestException):
+    '''No recorded response for a request. Not a connection error, so
+    it is neither retried nor counted against the circuit breaker.
+    '''
+
+def encode_body(body: Union[bytes, str, None]):
+    '''JSON bodies are stored decoded so cassettes stay readable and
+    editable; anything else as text or base64
+
+    '''
+    if body is None or body == b'':
+        return None
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    try:
+        return json.loads(body)
+    except ValueError:
+        pass
+    try:
+        return {'text': body.decode('utf-8')}
+    except UnicodeDecodeError:
+        return {'base64': base64.b64encode(body).decode()}
+
+def decode_body(body):
+    if body is None:
+        return b''
+    if isinstance(body, dict) and set(body) == {'text'}:
+        return body['text'].encode('utf-8')
+    if isinstance(body, dict) and set(body) == {'base64'}:
+        return base64.b64decode(body['base64'])
+    return json.dumps(body).encode('utf-8')
+
+def normalized_url(url: str):
+    parts = urllib.parse.urlsplit(url)
+    query = urllib.parse.urlencode(sorted(
+        urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+    ))
+    return urllib.parse.urlunsplit(parts._replace(query=query))
+
+def entry_keys(method: str, url: str):
+    '''Keys a request is matched on, most specific first. The path-only
+    key lets cassettes replay against a different host or after query
+    parameters (e.g. per_page) change.
+
+    '''
+    return [
+        (method.upper(), normalized_url(url)),
+        (method.upper(), urllib.parse.urlsplit(url).path),
+    ]
+
+def redacted(headers):
+    return {
+        k: REDACTED if k.lower() in REDACT_HEADERS else v
+        for k, v in headers.items()
+    }
+
+def streamed_length(response: requests.Response):
+    try:
+        return int(response.headers['Content-Length'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def load(path: Union[str, Path]):
+    return json.loads(Path(path).expanduser().read_text())
+
+def save(path: Union[str, Path], entries: list):
+    path = Path(path).expanduser()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(entries, indent=4))
+
+class RecordingAdapter(requests.adapters.BaseAdapter):
+    def __init__(self, adapter: requests.adapters.BaseAdapter):
+        super().__init__()
+        self.adapter = adapter
+        self.entries = []
+        self._lock = threading.Lock()
+
+    def send(self, request: requests.PreparedRequest, **kw):
+        start = time.monotonic()
+        response = self.adapter.send(request, **kw)
+        length = streamed_length(response)
+        keep_body = not kw.get('stream') or response._content_consumed or (
+            length is not None and length <= MAX_STREAMED_BODY
+        )
+        content = response.content if keep_body else None
+        elapsed = time.monotonic() - start
+
+        body = request.body
+        if hasattr(body, 'read'):
+            # Streamed upload; not worth keeping
+            body = None
+        entry = {
+            'request': {
+                'method': request.method,
+                'url': request.url,
+                'path': urllib.parse.urlsplit(request.url).path,
+                'headers': redacted(request.headers),
+                'body': encode_body(body),
+            },
+            'response': {
+                'status_code': response.status_code,
+                'headers': redacted(response.headers),
+                'body': encode_body(content),
+                'elapsed': round(elapsed, 4),
+            },
+        }
+        if not keep_body:
+            # Left for the caller to stream; replays with an empty body
+            entry['response']['streamed'] = True
+        with self._lock:
+            self.entries.append(entry)
+        return response
+
+    def close(self):
+        self.adapter.close()
+
+class ReplayAdapter(requests.adapters.BaseAdapter):
+    '''Answers requests from recorded entries, in recorded order for
+    each request. Once a request's entries are used up, its last
+    response is repeated.
+
+    timing: "none" to answer instantly or "original" to wait each
+    response's recorded latency
+
+    '''
+    def __init__(self, entries: list, *, timing: str = 'none'):
+        super().__init__()
+        self.timing = timing
+        self.queues = defaultdict(list)
+        self.last = {}
+        self.misses = []
+        self._lock = threading.Lock()
+        for entry in entries:
+            request = entry['request']
+            for key in entry_keys(request['method'], request['url']):
+                self.queues[key].append(entry)
+
+    def next_entry(self, request: requests.PreparedRequest):
+        with self._lock:
+            for key in entry_keys(request.method, request.url):
+                if self.queues.get(key):
+                    entry = self.queues[key].pop(0)
+                    # Don't also hand it out under its other key
+                    for other in entry_keys(entry['request']['method'],
+                                            entry['request']['url']):
+                        if other != key:
+                            self.queues[other] = [
+                                e for e in self.queues[other]
+                                if e is not entry
+                            ]
+                    self.last[key] = entry
+                    return entry
+                if key in self.last:
+                    return self.last[key]
+            self.misses.append((request.method, request.url))
+
+    def send(self, request: requests.PreparedRequest, **kw):
+        entry = self.next_entry(request)
+        if entry is None:
+            raise CassetteMiss(
+                f'No recorded response for {request.method} {request.url}',
+                request=request,
+            )
+        recorded = entry['response']
+        if self.timing == 'original':
+            time.sleep(recorded.get('elapsed', 0))
+
+        response = requests.Response()
+        response.status_code = int(recorded['status_code'])
+        response.headers = CaseInsensitiveDict({
+            k: v for k, v in (recorded.get('headers') or {}).items()
+            if k.lower() not in DROP_RESPONSE_HEADERS
+        })
+        response._content = decode_body(recorded.get('body'))
+        # The body is all here: stream=True requests read it from memory
+        response._content_consumed = True
+        response.encoding = requests.utils.get_encoding_from_headers(
+            response.headers
+        ) or 'utf-8'
+        response.url = request.url
+        response.request = request
+        response.reason = 'Replayed'
+        return response
+
+    def close(self):
+        pass
+
+@contextlib.contextmanager
+def mounted(session: requests.Session, adapter_f):
+    '''Temporarily replace the session's http(s) adapters with
+    adapter_f(original_adapter)
+    '''
+    originals = dict(session.adapters)
+    adapter = adapter_f(session.get_adapter('https://'))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    try:
+        yield adapter
+    finally:
+        session.adapters.clear()
+        session.adapters.update(originals)
+
+@contextlib.contextmanager
+def recording(session: requests.Session, path: Union[str, Path]):
+    with mounted(session, RecordingAdapter) as adapter:
+        try:
+            yield adapter
+        finally:
+            save(path, adapter.entries)
+            log.info(f'Recorded {len(adapter.entries)} requests to {path}')
+
+@contextlib.contextmanager
+def replaying(session: requests.Session, path: Union[str, Path], *,
+              timing: str = 'none'):
+    entries = load(path)
+    with mounted(session,
+                 lambda _: ReplayAdapter(entries, timing=timing)) as adapter:
+        yield adapter
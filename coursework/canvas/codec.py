@@ -0,0 +1,149 @@
+'''Compressed encoding of large custom_data values
+
+Values whose JSON is at least COMPRESS_THRESHOLD bytes are stored as a
+header carrying a version marker, the compression used (zstd if the
+zstandard package is installed, otherwise zlib) and the base64 of the
+compressed JSON. When that is more than CHUNK_SIZE characters, the
+base64 is split across extra keys and the header records how many
+there are and the hash of the whole.
+
+Each write of a chunked value gets a new generation, named in its
+header and in its chunk keys (<key>--chunk-<generation>-<i>). The new
+chunks are written before the header that refers to them, and the old
+generation's chunks are only deleted after it, so a reader holding
+either header finds its chunks (see user.set_data). Chunk keys that no
+header refers to are garbage (see chunk_owner and metadata_gc).
+
+Anything without the marker is a plain value, so data written before
+the codec existed (or below the threshold) reads back unchanged.
+
+>>> header, chunks = encode('file-hashes', hashes)
+>>> decode(header, chunks.get)
+
+'''
+import json
+import uuid
+import zlib
+import base64
+import hashlib
+import logging
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+MARKER = 'coursework-codec/1'
+COMPRESS_THRESHOLD = 8 * 1024
+CHUNK_SIZE = 64 * 1024
+
+class CodecError(Exception):
+    pass
+
+def compress(raw: bytes):
+    if zstandard is not None:
+        return 'zstd', zstandard.ZstdCompressor().compress(raw)
+    return 'zlib', zlib.compress(raw, 9)
+
+def decompress(alg: str, content: bytes):
+    if alg == 'zlib':
+        return zlib.decompress(content)
+    if alg == 'zstd':
+        if zstandard is None:
+            raise CodecError(
+                'This value was compressed with zstd, which requires the'
+                ' zstandard package (pip install coursework[zstd])'
+            )
+        return zstandard.ZstdDecompressor().decompress(content)
+    raise CodecError(f'Unknown compression: {alg}')
+
+def new_generation():
+    return uuid.uuid4().hex[:12]
+
+def chunk_key(key: str, i: int, generation: str = None):
+    # Values chunked before generations were added have none
+    if generation is None:
+        return f'{key}--chunk-{i}'
+    return f'{key}--chunk-{generation}-{i}'
+
+def is_chunk_key(key: str):
+    return '--chunk-' in key
+
+def chunk_owner(key: str):
+    '''The key whose value a chunk key is part of
+    '''
+    return key.rsplit('--chunk-', 1)[0]
+
+def chunk_keys(key: str, stored):
+    '''The chunk keys that the value stored at key refers to
+    '''
+    if not is_encoded(stored) or 'chunks' not in stored:
+        return []
+    return [
+        chunk_key(key, i, stored.get('generation'))
+        for i in range(stored['chunks'])
+    ]
+
+def may_be_chunked(value):
+    '''Whether value may have been stored in chunks. Compressed base64
+    is at most about 4/3 the size of its input, so JSON under half of
+    CHUNK_SIZE never is.
+    '''
+    if value is None:
+        return False
+    raw = json.dumps(value, separators=(',', ':')).encode('utf-8')
+    return len(raw) >= CHUNK_SIZE // 2
+
+def is_encoded(value):
+    return isinstance(value, dict) and value.get('codec') == MARKER
+
+def encode(key: str, value):
+    '''(value or header to store at key, {chunk key: chunk})
+    '''
+    raw = json.dumps(value, separators=(',', ':')).encode('utf-8')
+    if len(raw) < COMPRESS_THRESHOLD:
+        return value, {}
+
+    alg, content = compress(raw)
+    text = base64.b64encode(content).decode('ascii')
+    header = {'codec': MARKER, 'alg': alg, 'bytes': len(raw)}
+    if len(text) <= CHUNK_SIZE:
+        return dict(header, data=text), {}
+
+    chunks = [
+        text[i:i + CHUNK_SIZE] for i in range(0, len(text), CHUNK_SIZE)
+    ]
+    generation = new_generation()
+    log.debug(
+        f'[codec] {key}: {len(raw)} bytes in {len(chunks)} chunks'
+        f' (generation {generation})'
+    )
+    header = dict(
+        header, chunks=len(chunks), generation=generation,
+        md5=hashlib.md5(text.encode('ascii')).hexdigest(),
+    )
+    return header, dict(zip(chunk_keys(key, header), chunks))
+
+def decode(key: str, stored, get_chunk):
+    '''The value at key, given what is stored there and a function from
+    chunk key to chunk (or None)
+    '''
+    if not is_encoded(stored):
+        return stored
+
+    if 'chunks' in stored:
+        chunks = [get_chunk(k) for k in chunk_keys(key, stored)]
+        if not all(isinstance(c, str) for c in chunks):
+            raise CodecError(f'{key}: missing chunks')
+        text = ''.join(chunks)
+        if hashlib.md5(text.encode('ascii')).hexdigest() != stored['md5']:
+            raise CodecError(f'{key}: chunks do not match their header')
+    else:
+        text = stored['data']
+
+    return json.loads(
+        decompress(stored['alg'], base64.b64decode(text)).decode('utf-8')
+    )
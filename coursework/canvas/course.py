@@ -13,6 +13,7 @@ from larc import yaml
 from larc import rest
 
 from .. import config
+from .resources import get_id_resources
 
 log = logging.getLogger(__name__)
 log.addHandler(logging.NullHandler())
@@ -78,7 +79,7 @@ course_by_id = rest.get_id_resource(
     meta_f=default_course_meta_f,
 )
 
-courses = rest.get_id_resources(
+courses = get_id_resources(
     'courses', form_key='course', memo=True,
     data={'include[]': [
         'term', 'total_students',
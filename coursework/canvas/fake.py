@@ -0,0 +1,1029 @@
+'''In-process fake of the parts of the Canvas REST API that coursework
+uses
+
+FakeCanvas keeps courses, pages, assignments, assignment groups,
+quizzes and their questions, modules and their items, files and
+folders (including the two-step upload and server-side copies), course
+users and the users/self custom_data store in memory. It is served
+through a requests transport adapter mounted on a Session, so the
+whole sync engine runs against it unchanged:
+
+>>> canvas = fake.FakeCanvas(latency=0.05)
+>>> course = canvas.add_course('CSC 101 Programming 01')
+>>> with fake.serving(coursework.canvas.api.get_session(), canvas):
+...     api = coursework.canvas.api.get_api(canvas.base_url, 'token')
+...     page = coursework.canvas.page.new_page(
+...         coursework.canvas.course.course_by_id(api(), course['id']),
+...         {'title': 'Intro'},
+...     )
+>>> canvas.requests.most_common()
+
+Listings are paginated with numbered Link headers (per_page defaults
+to 10 and is capped at 100, as in Canvas). Every response carries
+X-Request-Cost and X-Rate-Limit-Remaining headers from a leaky
+bucket; once the bucket is empty requests are answered with
+"403 Forbidden (Rate Limit Exceeded)". GET responses carry an ETag and
+honor If-None-Match.
+
+write_course_dir lays out a synthetic course directory (pages,
+assignments, quizzes, slides and modules.yml) of a given size, for
+benchmarks of the coursework-sync-* commands (see
+coursework.cli.bench).
+
+'''
+import re
+import json
+import math
+import time
+import email
+import http
+import random
+import hashlib
+import logging
+import datetime
+import itertools
+import threading
+import contextlib
+import urllib.parse
+from pathlib import Path
+from collections import Counter, defaultdict
+from typing import Union, Callable
+
+import requests
+import requests.adapters
+from requests.structures import CaseInsensitiveDict
+from toolz.curried import (
+    pipe, merge, dissoc,
+)
+
+from larc import yaml
+
+from .metrics import path_template, API_PREFIX
+from .cassette import mounted
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+FAKE_HOST = 'canvas.fake'
+DEFAULT_BASE_URL = f'https://{FAKE_HOST}/api/v1'
+
+DEFAULT_PER_PAGE = 10
+MAX_PER_PAGE = 100
+
+BUCKET_CAPACITY = 700.0
+PREFLIGHT_COST = 50.0
+
+# Collections that may be nested under each kind of resource
+CHILDREN = {
+    'courses': {'pages', 'assignments', 'assignment_groups', 'quizzes',
+                'modules', 'users'},
+    'quizzes': {'questions'},
+    'modules': {'items'},
+}
+
+FORM_KEYS = {
+    'courses': 'course',
+    'pages': 'wiki_page',
+    'assignments': 'assignment',
+    'quizzes': 'quiz',
+    'questions': 'question',
+    'modules': 'module',
+    'items': 'module_item',
+}
+
+ID_KEYS = {
+    'pages': 'url',
+}
+
+# Collections whose members Canvas keeps in a 1..n "position" order
+POSITIONED = {'modules', 'items', 'assignment_groups', 'questions'}
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+def now():
+    return datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def slugify(title: str):
+    return re.sub(r'[^a-z0-9]+', '-', str(title).lower()).strip('-') or 'page'
+
+def key_path(key: str):
+    '''"wiki_page[title]" -> ["wiki_page", "title"], "include[]" ->
+    ["include", ""]
+    '''
+    name, _, rest = key.partition('[')
+    return [name] + (re.findall(r'\[([^\]]*)\]', '[' + rest) if rest else [])
+
+def unflatten(pairs):
+    '''Rails-style form/query parameters to nested data
+
+    >>> unflatten([('include[]', 'a'), ('include[]', 'b'),
+    ...            ('wiki_page[title]', 'T')])
+    {'include': ['a', 'b'], 'wiki_page': {'title': 'T'}}
+
+    '''
+    result = {}
+    for key, value in pairs:
+        *path, last = key_path(key)
+        if last == '' and path:
+            node = result
+            for part in path[:-1]:
+                node = node.setdefault(part, {})
+            node.setdefault(path[-1], []).append(value)
+        else:
+            node = result
+            for part in path:
+                node = node.setdefault(part, {})
+            node[last] = value
+    return result
+
+def body_bytes(body):
+    if body is None:
+        return b''
+    if isinstance(body, str):
+        return body.encode('utf-8')
+    if isinstance(body, bytes):
+        return body
+    if hasattr(body, 'read'):
+        return body.read()
+    return b''.join(
+        chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+        for chunk in body
+    )
+
+def multipart_fields(content_type: str, body: bytes):
+    '''(fields, files) of a multipart/form-data body, where files maps
+    field name to (filename, content)
+    '''
+    message = email.message_from_bytes(
+        f'Content-Type: {content_type}\r\n\r\n'.encode() + body
+    )
+    fields, files = {}, {}
+    for part in message.walk():
+        if part.is_multipart():
+            continue
+        name = part.get_param('name', header='content-disposition')
+        content = part.get_payload(decode=True) or b''
+        filename = part.get_filename()
+        if filename is not None:
+            files[name] = (filename, content)
+        else:
+            fields[name] = content.decode('utf-8')
+    return fields, files
+
+def request_params(request: requests.PreparedRequest):
+    '''Query string and body parameters of a request, merged (as Rails
+    does), along with the flat query pairs for pagination links
+    '''
+    parts = urllib.parse.urlsplit(request.url)
+    pairs = urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+    content_type = request.headers.get('Content-Type', '') or ''
+    params = unflatten(pairs)
+    files = {}
+    body = body_bytes(request.body)
+    if content_type.startswith('application/json') and body:
+        params = merge(params, json.loads(body))
+    elif content_type.startswith('application/x-www-form-urlencoded'):
+        form = urllib.parse.parse_qsl(body.decode(), keep_blank_values=True)
+        pairs = pairs + form
+        params = merge(params, unflatten(form))
+    elif content_type.startswith('multipart/form-data'):
+        fields, files = multipart_fields(content_type, body)
+        params = merge(params, fields)
+    return params, pairs, files
+
+class LeakyBucket:
+    '''Canvas' rate limiting: each request's cost is added to a bucket
+    that leaks at a constant rate. A request is refused when the
+    bucket, plus a preflight charge for the request itself, is full.
+
+    '''
+    def __init__(self, capacity: float = BUCKET_CAPACITY,
+                 leak_rate: float = 10.0,
+                 preflight: float = PREFLIGHT_COST):
+        self.capacity = capacity
+        self.leak_rate = leak_rate
+        self.preflight = preflight
+        self.level = 0.0
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _leak(self):
+        t = time.monotonic()
+        self.level = max(0.0, self.level - (t - self.updated) * self.leak_rate)
+        self.updated = t
+
+    def start(self):
+        with self._lock:
+            self._leak()
+            if self.level + self.preflight > self.capacity:
+                return False
+            self.level += self.preflight
+            return True
+
+    def finish(self, cost: float):
+        with self._lock:
+            self._leak()
+            self.level = max(0.0, self.level + cost - self.preflight)
+            return self.remaining()
+
+    def remaining(self):
+        return max(0.0, self.capacity - self.level)
+
+class FakeCanvas:
+    '''In-memory Canvas state and request handling
+
+    Args:
+
+      base_url (str): API base URL to serve (default
+        https://canvas.fake/api/v1)
+
+      latency (Union[float, Callable]): seconds to wait before
+        answering each request, or a function of (method, url)
+        returning it
+
+      max_per_page (int): largest per_page honored in listings
+
+      numbered_last (bool): include a numbered "last" link when
+        paginating (Canvas omits it for some listings)
+
+      rate_limit (bool): simulate the leaky-bucket rate limit
+
+      request_cost (float): bucket cost of each request
+
+      upload_redirect (bool): take upload content on a separate
+        storage host, which answers with a redirect to a
+        create_success endpoint that must be fetched with the API's
+        credentials to confirm the upload (as Canvas does with S3)
+
+    '''
+    def __init__(self, *, base_url: str = DEFAULT_BASE_URL,
+                 latency: Union[float, Callable] = 0.0,
+                 max_per_page: int = MAX_PER_PAGE,
+                 numbered_last: bool = True,
+                 rate_limit: bool = True,
+                 bucket_capacity: float = BUCKET_CAPACITY,
+                 leak_rate: float = 10.0,
+                 request_cost: float = 0.1,
+                 upload_redirect: bool = False):
+        self.base_url = base_url.rstrip('/')
+        parts = urllib.parse.urlsplit(self.base_url)
+        self.origin = f'{parts.scheme}://{parts.netloc}'
+        self.upload_redirect = upload_redirect
+        self.upload_origin = (
+            f'{parts.scheme}://uploads.{parts.netloc}' if upload_redirect
+            else self.origin
+        )
+        self.latency = latency
+        self.max_per_page = max_per_page
+        self.numbered_last = numbered_last
+        self.bucket = (
+            LeakyBucket(bucket_capacity, leak_rate) if rate_limit else None
+        )
+        self.request_cost = request_cost
+
+        self.requests = Counter()
+        self.collections = defaultdict(dict)
+        self.files = {}
+        self.folders = {}
+        self.file_content = {}
+        self.uploads = {}
+        self.file_courses = {}
+        self.enrollments = {}
+        self.settings = defaultdict(dict)
+        self.custom_data = {}
+
+        self._ids = itertools.count(1000)
+        self._lock = threading.RLock()
+
+        self.user = self.new_user('Fake Teacher')
+
+    # ------------------------------------------------------------------
+    # Seeding state
+    # ------------------------------------------------------------------
+
+    def next_id(self):
+        return next(self._ids)
+
+    def new_user(self, name: str):
+        uid = self.next_id()
+        return {
+            'id': uid, 'name': name, 'sortable_name': name,
+            'short_name': name, 'login_id': slugify(name),
+        }
+
+    def add_course(self, name: str, *, course_code: str = None,
+                   students: int = 0,
+                   groups=('Assignments', 'Quizzes')):
+        '''Add a course (with a root folder, the teacher, some number of
+        students and assignment groups), returning its data
+        '''
+        with self._lock:
+            cid = self.next_id()
+            course = {
+                'id': cid, 'name': name,
+                'course_code': course_code or name,
+                'workflow_state': 'unpublished',
+                'term': {'id': 1, 'name': 'Default Term'},
+                'total_students': students,
+                'syllabus_body': '',
+                'created_at': now(),
+            }
+            self.collections[('courses',)][str(cid)] = course
+            self.add_folder(cid, 'course files', None)
+
+            users = self.collections[('courses', str(cid), 'users')]
+            users[str(self.user['id'])] = self.user
+            self.enrollments[(cid, self.user['id'])] = 'teacher'
+            for i in range(students):
+                student = self.new_user(f'Student {i + 1:03d}')
+                users[str(student['id'])] = student
+                self.enrollments[(cid, student['id'])] = 'student'
+
+            for group in groups:
+                self.create(('courses', str(cid), 'assignment_groups'),
+                            {'name': group})
+            return course
+
+    def add_folder(self, course_id: int, name: str, parent_id: int = None):
+        with self._lock:
+            fid = self.next_id()
+            parent = self.folders.get(parent_id)
+            full_name = f'{parent["full_name"]}/{name}' if parent else name
+            self.folders[fid] = {
+                'id': fid, 'name': name, 'full_name': full_name,
+                'parent_folder_id': parent_id, 'context_type': 'Course',
+                'context_id': course_id, 'files_count': 0,
+                'folders_count': 0, 'created_at': now(),
+            }
+            return self.folders[fid]
+
+    def root_folder(self, course_id: int):
+        return next(
+            f for f in self.folders.values()
+            if f['context_id'] == course_id and f['parent_folder_id'] is None
+        )
+
+    def folder_by_path(self, course_id: int, path: str):
+        '''Find or create (like Canvas) the folder at path under the
+        course's root folder
+        '''
+        folder = self.root_folder(course_id)
+        for name in filter(None, str(path).strip('/').split('/')):
+            child = next((
+                f for f in self.folders.values()
+                if f['parent_folder_id'] == folder['id'] and
+                f['name'] == name
+            ), None)
+            folder = child or self.add_folder(course_id, name, folder['id'])
+        return folder
+
+    def add_file(self, course_id: int, folder_id: int, name: str,
+                 content: bytes, content_type: str = None):
+        '''Store a file, replacing any file of the same name in the
+        folder (Canvas' default on_duplicate=overwrite)
+        '''
+        with self._lock:
+            for old in [f for f in self.files.values()
+                        if f['folder_id'] == folder_id and
+                        f['display_name'] == name]:
+                self.delete_file(old['id'])
+            fid = self.next_id()
+            uuid = hashlib.sha1(
+                f'{fid}-{random.random()}'.encode()
+            ).hexdigest()[:40]
+            self.files[fid] = {
+                'id': fid, 'uuid': uuid, 'folder_id': folder_id,
+                'display_name': name, 'filename': name,
+                'content-type': content_type or 'application/octet-stream',
+                'size': len(content),
+                'url': f'{self.origin}/files/{fid}/download'
+                       f'?download_frd=1&verifier={uuid}',
+                'created_at': now(), 'updated_at': now(),
+                'locked': False, 'hidden': False,
+            }
+            self.file_content[fid] = content
+            self.file_courses[fid] = course_id
+            return self.files[fid]
+
+    def delete_file(self, fid: int):
+        self.file_content.pop(fid, None)
+        self.file_courses.pop(fid, None)
+        return self.files.pop(fid, None)
+
+    # ------------------------------------------------------------------
+    # Generic collections
+    # ------------------------------------------------------------------
+
+    def members(self, coll: tuple):
+        values = list(self.collections[coll].values())
+        if coll[-1] in POSITIONED:
+            values.sort(key=lambda d: d.get('position') or 0)
+        return values
+
+    def renumber(self, coll: tuple, moved: dict = None, position=None):
+        values = [v for v in self.members(coll) if v is not moved]
+        if moved is not None:
+            index = min(max(int(position or len(values) + 1) - 1, 0),
+                        len(values))
+            values.insert(index, moved)
+        for i, value in enumerate(values, 1):
+            value['position'] = i
+
+    def new_member(self, coll: tuple, body: dict):
+        name = coll[-1]
+        parent_id = coll[-2] if len(coll) > 1 else None
+        rid = self.next_id()
+        if name == 'pages':
+            title = body.get('title') or 'Untitled'
+            url = slugify(title)
+            existing = self.collections[coll]
+            n = 2
+            while url in existing:
+                url, n = f'{slugify(title)}-{n}', n + 1
+            return merge(
+                {'body': '', 'published': False, 'front_page': False,
+                 'editing_roles': 'teachers'},
+                body,
+                {'page_id': rid, 'url': url, 'title': title,
+                 'created_at': now(), 'updated_at': now()},
+            )
+        if name == 'assignments':
+            groups = self.members(coll[:-1] + ('assignment_groups',))
+            return merge(
+                {'description': '', 'points_possible': 0,
+                 'submission_types': ['none'], 'published': False,
+                 'assignment_group_id': groups[0]['id'] if groups else None,
+                 'is_quiz_assignment': False},
+                body,
+                {'id': rid, 'course_id': int(parent_id),
+                 'created_at': now(), 'updated_at': now()},
+            )
+        if name == 'quizzes':
+            return merge(
+                {'title': 'Unnamed Quiz', 'description': '',
+                 'quiz_type': 'assignment', 'question_count': 0,
+                 'published': False, 'points_possible': 0},
+                body,
+                {'id': rid, 'created_at': now(), 'updated_at': now()},
+            )
+        if name == 'questions':
+            return merge(
+                {'question_name': 'Question', 'question_text': '',
+                 'question_type': 'multiple_choice_question',
+                 'points_possible': 1, 'answers': []},
+                body,
+                {'id': rid, 'quiz_id': int(parent_id)},
+            )
+        if name == 'modules':
+            return merge(
+                {'name': 'Module', 'published': False,
+                 'items_count': 0, 'unlock_at': None},
+                body,
+                {'id': rid},
+            )
+        if name == 'items':
+            return merge(
+                {'title': '', 'type': 'SubHeader', 'indent': 0,
+                 'content_details': {}},
+                body,
+                {'id': rid, 'module_id': int(parent_id)},
+            )
+        if name == 'assignment_groups':
+            return merge(
+                {'name': 'Assignments', 'group_weight': 0, 'rules': {}},
+                body,
+                {'id': rid},
+            )
+        return merge(body, {'id': rid})
+
+    def create(self, coll: tuple, body: dict):
+        with self._lock:
+            member = self.new_member(coll, body)
+            id_key = ID_KEYS.get(coll[-1], 'id')
+            self.collections[coll][str(member[id_key])] = member
+            if coll[-1] in POSITIONED:
+                self.renumber(coll, member, body.get('position'))
+            self.counted(coll)
+            return member
+
+    def update(self, coll: tuple, rid: str, body: dict):
+        with self._lock:
+            member = self.collections[coll][rid]
+            if coll[-1] == 'items' and 'module_id' in body and (
+                    int(body['module_id']) != member['module_id']):
+                # Move the item to another module
+                module_id = str(body['module_id'])
+                if module_id not in self.collections[coll[:-2]]:
+                    raise HttpError(404, 'The specified resource does not'
+                                         ' exist.')
+                target = coll[:-2] + (module_id, 'items')
+                del self.collections[coll][rid]
+                self.renumber(coll)
+                member['module_id'] = int(body['module_id'])
+                self.collections[target][rid] = member
+                self.renumber(target, member, body.get('position'))
+                self.counted(coll)
+                self.counted(target)
+                body = dissoc(body, 'module_id', 'position')
+            elif coll[-1] in POSITIONED and 'position' in body:
+                self.renumber(coll, member, body['position'])
+                body = dissoc(body, 'position')
+            member.update(body)
+            if 'updated_at' in member:
+                member['updated_at'] = now()
+            return member
+
+    def delete(self, coll: tuple, rid: str):
+        with self._lock:
+            member = self.collections[coll].pop(rid)
+            if coll[-1] in POSITIONED:
+                self.renumber(coll)
+            self.counted(coll)
+            return member
+
+    def counted(self, coll: tuple):
+        '''Keep the parent's count of its members up to date
+        '''
+        if coll[-1] in {'questions', 'items'}:
+            parent = self.collections[coll[:-2]].get(coll[-2])
+            key = {'questions': 'question_count', 'items': 'items_count'}
+            if parent is not None:
+                parent[key[coll[-1]]] = len(self.collections[coll])
+
+    def resolve(self, parts: list):
+        '''Check that every (collection, id) pair along parts exists
+        '''
+        for i in range(0, len(parts), 2):
+            known = (
+                parts[i] in CHILDREN.get(parts[i - 2], ()) if i else
+                parts[i] == 'courses'
+            )
+            if not known or (i + 1 < len(parts) and parts[i + 1] not in
+                             self.collections[tuple(parts[:i + 1])]):
+                raise HttpError(404, 'The specified resource does not'
+                                     ' exist.')
+
+    # ------------------------------------------------------------------
+    # Request handling
+    # ------------------------------------------------------------------
+
+    def paginate(self, url: str, pairs: list, values: list, params: dict):
+        try:
+            per_page = int(params.get('per_page') or DEFAULT_PER_PAGE)
+            page = int(params.get('page') or 1)
+        except ValueError:
+            raise HttpError(400, 'invalid per_page or page')
+        per_page = max(1, min(per_page, self.max_per_page))
+        page = max(page, 1)
+        n_pages = max(1, math.ceil(len(values) / per_page))
+
+        base = urllib.parse.urlsplit(url)._replace(query='', fragment='')
+        kept = [(k, v) for k, v in pairs if k not in {'page', 'per_page'}]
+        def link(p, rel):
+            query = urllib.parse.urlencode(
+                kept + [('page', str(p)), ('per_page', str(per_page))]
+            )
+            return f'<{urllib.parse.urlunsplit(base._replace(query=query))}>;' \
+                   f' rel="{rel}"'
+
+        rels = [link(page, 'current')]
+        if page < n_pages:
+            rels.append(link(page + 1, 'next'))
+        if page > 1:
+            rels.append(link(page - 1, 'prev'))
+        rels.append(link(1, 'first'))
+        if self.numbered_last:
+            rels.append(link(n_pages, 'last'))
+
+        chunk = values[(page - 1) * per_page:page * per_page]
+        return chunk, {'Link': ','.join(rels)}
+
+    def handle_custom_data(self, method: str, scope: list, params: dict):
+        ns = params.get('ns')
+        if not ns:
+            raise HttpError(400, 'invalid namespace')
+        with self._lock:
+            data = self.custom_data.setdefault(ns, {})
+            if method == 'GET':
+                node = data
+                for key in scope:
+                    if not isinstance(node, dict) or key not in node:
+                        raise HttpError(400, 'no data for scope')
+                    node = node[key]
+                return {'data': node}
+            if method == 'PUT':
+                if 'data' not in params:
+                    raise HttpError(400, 'no data specified')
+                value = params['data']
+                if not scope:
+                    if not isinstance(value, dict):
+                        raise HttpError(400, 'no data specified')
+                    self.custom_data[ns] = value
+                    return {'data': value}
+                node = data
+                for key in scope[:-1]:
+                    if not isinstance(node.get(key), dict):
+                        node[key] = {}
+                    node = node[key]
+                node[scope[-1]] = value
+                return {'data': value}
+            if method == 'DELETE':
+                node = data
+                for key in scope[:-1]:
+                    if not isinstance(node, dict) or key not in node:
+                        raise HttpError(400, 'no data for scope')
+                    node = node[key]
+                if not scope:
+                    self.custom_data[ns] = {}
+                    return {'data': data}
+                if scope[-1] not in node:
+                    raise HttpError(400, 'no data for scope')
+                return {'data': node.pop(scope[-1])}
+        raise HttpError(405, 'method not allowed')
+
+    def handle_files(self, method: str, parts: list, params: dict):
+        with self._lock:
+            if parts[0] == 'courses':
+                cid = int(parts[1])
+                if method == 'POST':
+                    # Step 1 of an upload
+                    if 'parent_folder_id' in params:
+                        folder = self.folders.get(
+                            int(params['parent_folder_id'])
+                        )
+                        if folder is None:
+                            raise HttpError(404, 'folder not found')
+                    else:
+                        folder = self.folder_by_path(
+                            cid, params.get('parent_folder_path', '')
+                        )
+                    token = hashlib.sha1(
+                        f'{self.next_id()}-{random.random()}'.encode()
+                    ).hexdigest()
+                    self.uploads[token] = {
+                        'course_id': cid, 'folder_id': folder['id'],
+                        'name': params.get('name'),
+                        'content_type': params.get('content_type'),
+                    }
+                    return {
+                        'upload_url': (
+                            f'{self.upload_origin}/files_api/{token}'
+                        ),
+                        'upload_params': {
+                            'filename': params.get('name'),
+                            'content_type': params.get('content_type') or
+                            'application/octet-stream',
+                        },
+                        'file_param': 'file',
+                    }
+                return [
+                    f for fid, f in self.files.items()
+                    if self.file_courses.get(fid) == cid
+                ]
+            if parts[0] == 'folders' and len(parts) == 3:
+                fid = int(parts[1])
+                if fid not in self.folders:
+                    raise HttpError(404, 'folder not found')
+                if parts[2] == 'copy_file':
+                    if method != 'POST':
+                        raise HttpError(405, 'method not allowed')
+                    source_id = int(params['source_file_id'])
+                    if source_id not in self.files:
+                        raise HttpError(404, 'source file not found')
+                    source = self.files[source_id]
+                    folder = self.folders[fid]
+                    return self.add_file(
+                        folder['context_id'], fid, source['display_name'],
+                        self.file_content[source_id],
+                        source['content-type'],
+                    )
+                if parts[2] == 'files':
+                    return [f for f in self.files.values()
+                            if f['folder_id'] == fid]
+                return [f for f in self.folders.values()
+                        if f['parent_folder_id'] == fid]
+            # files/:id
+            fid = int(parts[1])
+            if fid not in self.files:
+                raise HttpError(404, 'The specified resource does not'
+                                     ' exist.')
+            if method == 'DELETE':
+                return self.delete_file(fid)
+            if method == 'PUT':
+                self.files[fid].update(params)
+            return self.files[fid]
+
+    def handle_api(self, method: str, parts: list, params: dict):
+        if parts[:2] == ['users', 'self'] or parts[:2] == [
+                'users', str(self.user['id'])]:
+            if len(parts) == 2:
+                return self.user
+            if parts[2] == 'custom_data':
+                return self.handle_custom_data(method, parts[3:], params)
+            raise HttpError(404, 'The specified resource does not exist.')
+
+        if parts[0] in {'files', 'folders'} or (
+                len(parts) == 3 and parts[0] == 'courses' and
+                parts[2] in {'files', 'folders'}):
+            if parts[0] == 'courses':
+                self.resolve(parts[:2])
+                if parts[2] == 'folders':
+                    cid = int(parts[1])
+                    return [f for f in self.folders.values()
+                            if f['context_id'] == cid]
+            elif parts[0] == 'folders' and len(parts) == 2:
+                fid = int(parts[1])
+                if fid not in self.folders:
+                    raise HttpError(404, 'folder not found')
+                return self.folders[fid]
+            return self.handle_files(method, parts, params)
+
+        if parts[0] == 'courses' and len(parts) == 3 and (
+                parts[2] == 'settings'):
+            self.resolve(parts[:2])
+            settings = self.settings[parts[1]]
+            if method == 'PUT':
+                settings.update(params)
+            return settings
+
+        self.resolve(parts)
+        name = parts[-1] if len(parts) % 2 else parts[-2]
+        form_key = FORM_KEYS.get(name)
+        body = params.get(form_key, params) if form_key else params
+        if not isinstance(body, dict):
+            body = {}
+        body = dissoc(body, 'ns', 'per_page', 'page', 'include')
+
+        if len(parts) % 2:
+            coll = tuple(parts)
+            if method == 'GET':
+                values = self.members(coll)
+                if name == 'users' and params.get('enrollment_type'):
+                    types = params['enrollment_type']
+                    types = [types] if isinstance(types, str) else types
+                    cid = int(parts[1])
+                    values = [
+                        u for u in values
+                        if self.enrollments.get((cid, u['id'])) in types
+                    ]
+                if name == 'pages' and 'body' not in (
+                        params.get('include') or []):
+                    values = [dissoc(v, 'body') for v in values]
+                return values
+            if method == 'POST' and len(parts) > 1:
+                return self.create(coll, body)
+            raise HttpError(405, 'method not allowed')
+
+        coll, rid = tuple(parts[:-1]), parts[-1]
+        if method == 'GET':
+            return self.collections[coll][rid]
+        if method == 'PUT':
+            if name == 'courses' and params.get('event') == 'offer':
+                body = merge(body, {'workflow_state': 'available'})
+            return self.update(coll, rid, body)
+        if method == 'DELETE':
+            member = self.delete(coll, rid)
+            return (204, None) if name == 'questions' else member
+        raise HttpError(405, 'method not allowed')
+
+    def handle(self, request: requests.PreparedRequest):
+        '''(status, headers, body) for a request, where body is JSON-able
+        data or bytes
+        '''
+        method = request.method.upper()
+        parts = urllib.parse.urlsplit(request.url)
+        params, pairs, files = request_params(request)
+
+        if parts.path.startswith('/files_api/'):
+            token = parts.path.rsplit('/', 1)[-1]
+            with self._lock:
+                upload = self.uploads.pop(token, None)
+                if upload is None or 'file' not in files:
+                    raise HttpError(400, 'invalid upload')
+                filename, content = files['file']
+                file = self.add_file(
+                    upload['course_id'], upload['folder_id'],
+                    upload['name'] or filename, content,
+                    upload['content_type'],
+                )
+            if self.upload_redirect:
+                return 303, {'Location': (
+                    f'{self.base_url}/files/{file["id"]}/create_success'
+                    f'?uuid={file["uuid"]}'
+                )}, b''
+            return 201, {}, file
+
+        match = re.match(r'^.*/files/(\d+)/create_success$', parts.path)
+        if match:
+            fid = int(match.group(1))
+            if not request.headers.get('Authorization'):
+                raise HttpError(401, 'user authorization required')
+            if fid not in self.files or (
+                    params.get('uuid') != self.files[fid]['uuid']):
+                raise HttpError(404, 'file not found')
+            return 200, {}, self.files[fid]
+
+        match = re.match(r'^/files/(\d+)/download$', parts.path)
+        if match:
+            fid = int(match.group(1))
+            if fid not in self.files:
+                raise HttpError(404, 'file not found')
+            return 200, {
+                'Content-Type': self.files[fid]['content-type'],
+            }, self.file_content[fid]
+
+        if API_PREFIX not in parts.path:
+            raise HttpError(404, 'not found')
+        path_parts = pipe(
+            parts.path.split(API_PREFIX, 1)[1].strip('/').split('/'),
+            lambda ps: [urllib.parse.unquote(p) for p in ps if p],
+        )
+        if not path_parts:
+            raise HttpError(404, 'not found')
+
+        result = self.handle_api(method, path_parts, params)
+        if isinstance(result, tuple):
+            status, result = result
+            return status, {}, result
+        if method == 'GET' and isinstance(result, list):
+            result, headers = self.paginate(
+                request.url, pairs, result, params
+            )
+            return 200, headers, result
+        return (201 if method == 'POST' else 200), {}, result
+
+    def respond(self, request: requests.PreparedRequest):
+        self.requests[(request.method.upper(),
+                       path_template(request.url))] += 1
+
+        latency = (self.latency(request.method, request.url)
+                   if callable(self.latency) else self.latency)
+
+        headers = {}
+        if self.bucket is not None and not self.bucket.start():
+            status, body = 403, b'403 Forbidden (Rate Limit Exceeded)\n'
+            headers['X-Rate-Limit-Remaining'] = '0.0'
+            headers['Content-Type'] = 'text/plain'
+        else:
+            if latency:
+                time.sleep(latency)
+            try:
+                status, extra, body = self.handle(request)
+                headers.update(extra)
+            except HttpError as error:
+                status = error.status
+                body = {'errors': [{'message': error.message}]}
+            except (KeyError, ValueError, TypeError) as error:
+                log.debug(f'[FakeCanvas] bad request: {error!r}')
+                status = 400
+                body = {'errors': [{'message': f'bad request: {error}'}]}
+            if self.bucket is not None:
+                cost = self.request_cost + latency
+                remaining = self.bucket.finish(cost)
+                headers['X-Request-Cost'] = f'{cost:.4f}'
+                headers['X-Rate-Limit-Remaining'] = f'{remaining:.4f}'
+
+        if not isinstance(body, bytes):
+            body = b'' if body is None else json.dumps(body).encode('utf-8')
+            if body:
+                headers.setdefault(
+                    'Content-Type', 'application/json; charset=utf-8'
+                )
+        if request.method.upper() == 'GET' and status == 200:
+            etag = f'W/"{hashlib.md5(body).hexdigest()}"'
+            headers['ETag'] = etag
+            if request.headers.get('If-None-Match') == etag:
+                status, body = 304, b''
+
+        response = requests.Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict(headers)
+        response._content = body
+        # The body is all here: stream=True requests read it from memory
+        response._content_consumed = True
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        response.reason = http.HTTPStatus(status).phrase
+        return response
+
+    def reset_counts(self):
+        self.requests.clear()
+
+    @property
+    def total_requests(self):
+        return sum(self.requests.values())
+
+class FakeCanvasAdapter(requests.adapters.BaseAdapter):
+    def __init__(self, canvas: FakeCanvas):
+        super().__init__()
+        self.canvas = canvas
+
+    def send(self, request: requests.PreparedRequest, **kw):
+        return self.canvas.respond(request)
+
+    def close(self):
+        pass
+
+@contextlib.contextmanager
+def serving(session: requests.Session, canvas: FakeCanvas):
+    '''Answer every request made through session from canvas
+    '''
+    with mounted(session, lambda _: FakeCanvasAdapter(canvas)) as adapter:
+        yield adapter
+
+# ----------------------------------------------------------------------
+# Synthetic course directories
+# ----------------------------------------------------------------------
+
+# Smallest valid PNG (1x1, transparent)
+PNG_1X1 = bytes.fromhex(
+    '89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+    '1f15c4890000000d49444154789c6360000002000154a24f5d00000000'
+    '49454e44ae426082'
+)
+
+def write_course_dir(path: Union[str, Path], course: dict, *,
+                     pages: int = 10, assignments: int = 10,
+                     quizzes: int = 5, questions: int = 5,
+                     slides: int = 0, images: int = 0):
+    '''Lay out a synthetic course directory for the given (fake) course
+    data: course.yml, pages/, assignments/, quizzes/, slides/ and a
+    modules.yml that puts every page, assignment and quiz in a module.
+    The first `images` pages each embed an uploaded image.
+
+    '''
+    root = Path(path).expanduser()
+    for name in ['pages', 'assignments', 'quizzes', 'slides', 'images']:
+        Path(root, name).mkdir(parents=True, exist_ok=True)
+    Path(root, 'course.yml').write_text(yaml.dump(
+        {'id': course['id'], 'name': course['name']}
+    ))
+
+    page_titles = []
+    for i in range(1, pages + 1):
+        title = f'Page {i:03d}'
+        page_titles.append(title)
+        image = ''
+        if i <= images:
+            Path(root, 'images', f'image-{i:03d}.png').write_bytes(
+                PNG_1X1 + i.to_bytes(4, 'big')
+            )
+            image = (
+                f"\n{{{{ image_link('images/image-{i:03d}.png') }}}}\n"
+            )
+        Path(root, 'pages', f'page-{i:03d}.md').write_text(
+            f'---\ntitle: {title}\n---\n\n# {title}\n\n'
+            f'Some *content* for page {i}.\n{image}'
+        )
+
+    assignment_names = []
+    for i in range(1, assignments + 1):
+        name = f'Assignment {i:03d}'
+        assignment_names.append(name)
+        Path(root, 'assignments', f'assign-{i:03d}.md').write_text(
+            f'---\nname: {name}\npoints_possible: 10\n'
+            'submission_types: [text, upload]\n'
+            'assignment_group: assign\n---\n\n'
+            f'Instructions for assignment {i}.\n'
+        )
+
+    quiz_titles = []
+    for i in range(1, quizzes + 1):
+        title = f'Quiz {i:03d}'
+        quiz_titles.append(title)
+        Path(root, 'quizzes', f'quiz-{i:03d}.yml').write_text(
+            yaml.dump({
+                'title': title,
+                'description': f'Quiz number {i}',
+                'assignment_group': 'quiz',
+                'questions': [
+                    {'text': f'Question {q} of quiz {i}?',
+                     'answers': [{'t': 'Right', 'w': 1},
+                                 {'t': 'Wrong', 'w': 0}]}
+                    for q in range(1, questions + 1)
+                ],
+            })
+        )
+
+    for i in range(1, slides + 1):
+        Path(root, 'slides', f'slide-{i:03d}.md').write_text(
+            f'# Slides {i:03d}\n\nFirst slide\n\n---\n\n# Second\n\n'
+            '- one\n- two\n'
+        )
+
+    Path(root, 'modules.yml').write_text(yaml.dump([
+        {'name': f'Module {m + 1:02d}',
+         'items': (
+             [{'page': t} for t in page_titles[m::4]] +
+             [{'assign': n} for n in assignment_names[m::4]] +
+             [{'quiz': t} for t in quiz_titles[m::4]]
+         )}
+        for m in range(4)
+    ]))
+
+    return root
@@ -4,8 +4,10 @@
 from pathlib import Path
 import typing as T
 import logging
+import threading
+import time
+import urllib.parse
 
-import requests
 import toolz.curried as _
 from toolz.curried import (
     pipe, filter, do, map,
@@ -15,13 +17,17 @@ from larc.common import (
     maybe_first, is_int,
 )
 from larc.rest import (
-    IdResourceEndpoint, get_id_resources,
+    IdResourceEndpoint,
 )
 from larc.parallel import thread_map
 
 from ..common import hashed_path
 
+from .resources import get_id_resources
 from .course import course_resource_docstring
+from .api import get_session
+from .retry import RetryPolicy
+from .multipart import MultipartFile
 
 log = logging.getLogger(__name__)
 log.addHandler(logging.NullHandler())
@@ -63,6 +69,158 @@ def course_files_matching_path(course: IdResourceEndpoint, path: str):
         tuple,
     )
 
+def copy_file(course: IdResourceEndpoint, source_file_id: int,
+              folder_id: int = None):
+    '''Copy a Canvas file (from any course the user can read) into a
+    folder of the course (its root folder by default) on the Canvas
+    side, replacing any file of the same name there, returning the new
+    file (or None)
+    '''
+    if folder_id is None:
+        folder_id = root_folder(course).data['id']
+    resp = course.api('folders', folder_id, 'copy_file').post(data={
+        'source_file_id': source_file_id,
+        'on_duplicate': 'overwrite',
+    })
+    if resp.status_code in range(200, 300):
+        return IdResourceEndpoint(
+            course.api('files'), resp.json(), form_key=None, id_key='id',
+        )
+    log.error(
+        f'There was an error copying file {source_file_id} to course'
+        f' {course.data.get("name")}:\n'
+        f'  code: {resp.status_code}\n'
+        'Response:\n'
+        f'{resp.content[:1000]}'
+    )
+
+# Default limits on concurrent upload steps: the "notify" and
+# confirmation requests go to the Canvas API (and its rate limit), the
+# transfers to the storage host (and the uplink)
+NOTIFY_WORKERS = 4
+TRANSFER_WORKERS = 8
+# (connect, read) seconds for a transfer
+TRANSFER_TIMEOUT = (30, 600)
+# The storage host keeps the file under the key in the upload params,
+# so resending a transfer replaces it rather than duplicating it
+TRANSFER_RETRY = RetryPolicy(retry_post=True)
+
+class UploadSlots(T.NamedTuple):
+    notify: threading.BoundedSemaphore
+    transfer: threading.BoundedSemaphore
+    # Enough threads to fill both
+    workers: int
+
+_slots = None
+_slots_lock = threading.Lock()
+def upload_slots() -> UploadSlots:
+    '''The notify and transfer semaphores shared by every upload in the
+    process
+    '''
+    global _slots
+    with _slots_lock:
+        if _slots is None:
+            from ..config import get_upload_concurrency
+            notify, transfer = get_upload_concurrency() or (
+                NOTIFY_WORKERS, TRANSFER_WORKERS,
+            )
+            _slots = UploadSlots(
+                threading.BoundedSemaphore(notify),
+                threading.BoundedSemaphore(transfer),
+                notify + transfer,
+            )
+        return _slots
+
+def reset_upload_slots():
+    global _slots
+    with _slots_lock:
+        _slots = None
+
+class UploadReport(T.NamedTuple):
+    files: int
+    failed: int
+    bytes: int
+    seconds: float
+
+    @property
+    def throughput(self):
+        '''Bytes per second
+        '''
+        return self.bytes / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return (
+            f'{self.files} files uploaded ({self.bytes:,} bytes) in'
+            f' {self.seconds:.1f}s, {self.throughput / 2**20:.2f} MiB/s'
+            + (f', {self.failed} failed' if self.failed else '')
+        )
+
+def notify_upload(course: IdResourceEndpoint, path: Path,
+                  parent_dir: str = None, *, hashed=False):
+    '''Step 1: tell Canvas about the file, returning the upload_url
+    and upload_params to send it with (or None)
+    '''
+    post_data = {
+        'name': hashed_path(path).name if hashed else path.name,
+        'size': path.stat().st_size,
+    }
+
+    if parent_dir is None:
+        post_data['parent_folder_id'] = root_folder(course).data['id']
+    elif is_int(parent_dir):
+        post_data['parent_folder_id'] = parent_dir
+    else:
+        post_data['parent_folder_path'] = str(parent_dir)
+
+    init_resp = course('files').post(data=post_data)
+    if init_resp.status_code in range(200, 300):
+        return init_resp.json()
+
+    log.error(
+        f'There was an error initiating file upload:\n'
+        f'  post data: {post_data}\n'
+        f'  code: {init_resp.status_code}\n'
+        'Response:\n'
+        f'{init_resp.content[:1000]}'
+    )
+
+def transfer_file(upload_info: dict, path: Path):
+    '''Step 2: stream the file to the storage host as a multipart
+    body, without following the confirmation redirect. Transient
+    failures are retried, rewinding the body.
+    '''
+    with MultipartFile(upload_info['upload_params'],
+                       upload_info.get('file_param') or 'file',
+                       path) as body:
+        return get_session().post(
+            upload_info['upload_url'], data=body,
+            headers={'Content-Type': body.content_type},
+            allow_redirects=False, timeout=TRANSFER_TIMEOUT,
+            retry=TRANSFER_RETRY,
+        )
+
+def confirm_upload(course: IdResourceEndpoint, upload_resp):
+    '''Step 3: the uploaded file's data, following the redirect to
+    Canvas if the storage host sent one. The API's credentials (dropped
+    by requests when a redirect changes host) are sent only if the
+    redirect is to the API's host.
+    '''
+    if upload_resp.is_redirect:
+        location = upload_resp.headers['Location']
+        same_host = (
+            urllib.parse.urlsplit(location).netloc ==
+            urllib.parse.urlsplit(course.api.base_url).netloc
+        )
+        if not same_host:
+            log.warning(
+                f'[confirm_upload] Not sending credentials to {location}'
+            )
+        upload_resp = get_session().get(
+            location, auth=course.api.auth if same_host else None,
+        )
+    if upload_resp.status_code in range(200, 300):
+        return upload_resp.json()
+
 def upload_course_file(course: IdResourceEndpoint, path: str,
                        parent_dir: str = None, *, hashed=False):
     '''Upload a file to a course
@@ -81,68 +239,63 @@ def upload_course_file(course: IdResourceEndpoint, path: str,
       redirect needs to be followed to complete the upload, or the
       file may not appear.
 
+    The Canvas API steps and the transfer each take a slot of their own
+    (see upload_slots), so a few API requests keep many transfers busy.
+
     '''
     path = Path(path).expanduser().resolve()
+    slots = upload_slots()
 
-    post_data = {
-        'name': hashed_path(path).name if hashed else path.name,
-        'size': path.stat().st_size,
-    }
-
-    if parent_dir is None:
-        post_data['parent_folder_id'] = root_folder(course).data['id']
-    elif is_int(parent_dir):
-        post_data['parent_folder_id'] = parent_dir
-    else:
-        post_data['parent_folder_path'] = str(parent_dir)
-
-    # Notify Canvas API
-    init_resp = course('files').post(data=post_data)
-    if init_resp.status_code in range(200, 300):
-        upload_info = init_resp.json()
-
-        url = upload_info['upload_url']
-        params = upload_info['upload_params']
+    with slots.notify:
+        upload_info = notify_upload(
+            course, path, parent_dir, hashed=hashed,
+        )
+    if not upload_info:
+        return None
 
-        # Upload file
-        with path.open('rb') as rfp:
-            upload_resp = requests.post(
-                url, data=params,
-                files={'file': rfp}
-            )
+    with slots.transfer:
+        upload_resp = transfer_file(upload_info, path)
 
-        if upload_resp.status_code in range(200, 300):
+    if upload_resp.is_redirect or upload_resp.status_code in range(200, 300):
+        with slots.notify:
+            data = confirm_upload(course, upload_resp)
+        if data:
             return IdResourceEndpoint(
                 course.api('files'),  # Files are in their own URL
                                       # space (i.e. not in course
                                       # tree)
-                upload_resp.json(),
+                data,
                 form_key=None, id_key='id',
             )
 
-        # Upload went wrong
-        log.error(
-            f'There was an error uploading file:\n'
-            f'  url: {url}\n'
-            f'  params: {params}\n'
-            f'  code: {upload_resp.status_code}\n'
-            'Response:\n'
-            f'{upload_resp.content[:1000]}'
-        )
-    else:
-        # Initialization went wrong
-        log.error(
-            f'There was an error initiating file upload:\n'
-            f'  post data: {post_data}\n'
-            f'  code: {init_resp.status_code}\n'
-            'Response:\n'
-            f'{init_resp.content[:1000]}'
-        )
+    # Upload went wrong
+    log.error(
+        f'There was an error uploading file:\n'
+        f'  url: {upload_info["upload_url"]}\n'
+        f'  params: {upload_info["upload_params"]}\n'
+        f'  code: {upload_resp.status_code}\n'
+        'Response:\n'
+        f'{upload_resp.content[:1000]}'
+    )
 
 def upload_course_files(course: IdResourceEndpoint, paths: T.Sequence[str],
                         pmap=thread_map, **upload_kw):
-    return _.pipe(
+    '''Upload the files, as many at once as the upload slots allow,
+    logging the throughput achieved
+    '''
+    paths = tuple(Path(p).expanduser().resolve() for p in paths)
+    start = time.monotonic()
+    results = _.pipe(
         paths,
-        pmap(upload_course_file(course, **upload_kw)),
+        pmap(lambda p: upload_course_file(course, p, **upload_kw),
+             max_workers=upload_slots().workers),
         tuple,
     )
+    report = UploadReport(
+        sum(1 for r in results if r),
+        sum(1 for r in results if not r),
+        sum(p.stat().st_size for p, r in zip(paths, results) if r),
+        time.monotonic() - start,
+    )
+    log.info(f'[upload_course_files] {report}')
+    return results
@@ -1,60 +1,150 @@
+'''Content hashes of Canvas files, stored in the user's custom_data
+
+Remote files are hashed as they stream in, CHUNK_SIZE bytes at a time,
+so memory use is bounded by the number of files hashed at once (each
+worker holds one chunk) rather than by their size.
+set_hashes_for_courses skips files that already have a hash and
+checkpoints its progress at most every CHECKPOINT_INTERVAL seconds, so
+an interrupted run picks up where it stopped. (All the hashes live
+under one key, so each checkpoint rewrites them all, hence the
+interval rather than a count of files.)
+
+'''
+from typing import Union, List
+import time
+import logging
+
+from toolz.curried import (
+    pipe, map, filter, merge, concat, unique, partition_all,
+)
+
+from larc.rest import (
+    Api, IdResourceEndpoint,
+)
+from larc.parallel import thread_map as pmap
+
+from ..common import hash_from_path
+from .. import hashing
+from .api import get_session
+from .file import files
+from . import metadata
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
 def hash_from_content(content: Union[bytes, str]):
-    return hashlib.md5(
+    return hashing.digest(
         content if type(content) is bytes else content.encode('utf-8')
-    ).hexdigest()
-
-def compute_file_hash(file: IdResourceEndpoint):
-    return hash_from_content(
-        requests.get(file.data['url']).content
     )
 
+CHUNK_SIZE = 2**20
+HASH_WORKERS = 8
+BATCH_SIZE = 50
+CHECKPOINT_INTERVAL = 60.0
+
+def compute_file_hash(file: IdResourceEndpoint, *,
+                      chunk_size: int = CHUNK_SIZE):
+    '''Digest of a Canvas file's content (see hashing), streamed chunk
+    by chunk (or None if it could not be downloaded)
+    '''
+    algorithm = hashing.algorithm()
+    hasher = hashing.new_hasher(algorithm)
+    with get_session().get(file.data['url'], stream=True) as response:
+        if response.status_code not in range(200, 300):
+            log.error(
+                f'Could not download {file.data.get("display_name")}'
+                f' ({response.status_code})'
+            )
+            return None
+        for chunk in response.iter_content(chunk_size):
+            hasher.update(chunk)
+    return hashing.prefixed(hasher.hexdigest(), algorithm)
+
+# Kept in the metadata store, so reads come from its (single) namespace
+# load and concurrent writes are merged rather than lost
 _FILE_HASHES_KEY = 'file-hashes'
-def _get_file_hashes(api: Api):
-    hashes = get_data(api, _FILE_HASHES_KEY)
-    if hashes is None:
-        hashes = {}
-        _set_file_hashes(api, hashes)
-    return hashes
+def get_file_hashes(api: Api) -> dict:
+    '''Every stored content hash, by Canvas file uuid
+    '''
+    return metadata.store(api).get(_FILE_HASHES_KEY) or {}
 
-def _set_file_hashes(api: Api, hashes: dict):
-    set_data(api, _FILE_HASHES_KEY, hashes)
+def _update_file_hashes(api: Api, hashes: dict):
+    return metadata.store(api).update(
+        _FILE_HASHES_KEY, lambda extant: merge(extant, hashes), {},
+    )
 
 def get_file_hash(file: IdResourceEndpoint):
-    hashes = _get_file_hashes(file.api)
+    hashes = get_file_hashes(file.api)
     uuid = file.data['uuid']
     return hashes.get(uuid)
 
 def set_file_hash(file: IdResourceEndpoint, file_hash: str):
-    hashes = _get_file_hashes(file.api)
-    uuid = file.data['uuid']
-    hashes[uuid] = file_hash
-    _set_file_hashes(file, hashes)
+    _update_file_hashes(file.api, {file.data['uuid']: file_hash})
 
 def set_file_hash_from_path(file: IdResourceEndpoint, path: str):
-    file_hash = hash_from_content(path.read_bytes())
+    file_hash = hash_from_path(path)
     set_file_hash(file, file_hash)
 
 def set_file_hashes(files: List[IdResourceEndpoint], hashes: List[str]):
     if files and hashes and len(files) == len(hashes):
-        hash_db = _get_file_hashes(files[0].api)
-        for f, h in zip(files, hashes):
-            uuid = f.data['uuid']
-            hash_db[uuid] = h
-        _set_file_hashes(files[0].api, hash_db)
+        _update_file_hashes(files[0].api, {
+            f.data['uuid']: h for f, h in zip(files, hashes)
+        })
         return True
     return False
 
-def set_hashes_for_courses(courses: List[IdResourceEndpoint]):
-    return pipe(
+def set_hashes_for_courses(courses: List[IdResourceEndpoint], *,
+                           resume: bool = True,
+                           max_workers: int = HASH_WORKERS,
+                           chunk_size: int = CHUNK_SIZE,
+                           batch_size: int = BATCH_SIZE,
+                           checkpoint_interval: float = CHECKPOINT_INTERVAL):
+    '''Hash every file of the courses (skipping those already hashed,
+    unless resume is False), batch_size files at a time, and store the
+    hashes, checkpointing at most every checkpoint_interval seconds.
+    Returns the new hashes by file uuid.
+
+    '''
+    courses = tuple(courses)
+    if not courses:
+        return {}
+    api = courses[0].api
+
+    done = get_file_hashes(api) if resume else {}
+    todo = pipe(
         courses,
         pmap(files),
-        map(lambda file_eps: pipe(
-            file_eps,
-            pmap(lambda f: (f, compute_file_hash(f))),
-            tuple
-        )),
-        filter(None),
-        map(lambda hashes: set_file_hashes(*zip(*hashes))),
-        tuple
+        concat,
+        filter(lambda f: f.data.get('uuid')),
+        filter(lambda f: f.data['uuid'] not in done),
+        unique(key=lambda f: f.data['uuid']),
+        tuple,
+    )
+    log.info(
+        f'[set_hashes_for_courses] Hashing {len(todo)} files'
+        f' ({len(done)} already hashed) with {max_workers} workers'
     )
 
+    hashed = {}
+    checkpointed = time.monotonic()
+    for batch in partition_all(batch_size, todo):
+        results = pipe(
+            batch,
+            pmap(lambda f: (f, compute_file_hash(f, chunk_size=chunk_size)),
+                 max_workers=max_workers),
+            filter(lambda fh: fh[1]),
+            tuple,
+        )
+        if results:
+            set_file_hashes(*map(list, zip(*results)))
+        if time.monotonic() - checkpointed >= checkpoint_interval:
+            metadata.store(api).flush()
+            checkpointed = time.monotonic()
+        hashed.update({f.data['uuid']: h for f, h in results})
+        log.info(
+            f'[set_hashes_for_courses] ... {len(hashed)} of {len(todo)}'
+            ' files hashed'
+        )
+    if hashed:
+        metadata.store(api).flush()
+    return hashed
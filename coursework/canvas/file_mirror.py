@@ -0,0 +1,195 @@
+'''Mirror of a course's files on local disk
+
+mirror_course_files rebuilds the course's folder tree under a local
+directory and downloads its files into it, streaming each to a
+temporary file beside its destination (hashing it on the way) and
+renaming it into place once complete, so an interrupted run never
+leaves a partial file behind.
+
+A file is skipped when its local copy has the content hash recorded
+for it in the file-hashes store (see file_hash). Downloads record the
+hash of what they fetched, there and in the local hash cache (see
+hash_cache), so a re-run transfers only the files that changed on
+Canvas and reads only the local files that changed on disk.
+
+>>> result = mirror_course_files(course, Path('~/mirror/csc101'))
+>>> result.downloaded, result.skipped
+
+'''
+import os
+import logging
+import tempfile
+from pathlib import Path, PurePosixPath
+from typing import NamedTuple, Tuple
+
+from toolz.curried import pipe, filter, partition_all
+
+from larc.rest import IdResourceEndpoint
+from larc.parallel import thread_map as pmap
+
+from ..common import hash_from_path
+from .. import hash_cache, hashing
+from .api import get_session
+from .file import files, folders
+from . import file_hash
+from . import metadata
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+DOWNLOAD_WORKERS = 4
+CHUNK_SIZE = 2**20
+CHECKPOINT_EVERY = 50
+
+class MirrorResult(NamedTuple):
+    downloaded: Tuple[Path, ...]
+    skipped: Tuple[Path, ...]
+    failed: Tuple[Path, ...]
+    bytes: int
+
+def folder_paths(course: IdResourceEndpoint):
+    '''Relative local path of each of the course's folders, by folder id
+    '''
+    course_folders = folders(course, do_memo=False)
+    root = next(
+        (f for f in course_folders if f.data['parent_folder_id'] is None),
+        None,
+    )
+    root_name = PurePosixPath(root.data['full_name']) if root else None
+
+    def relative(full_name):
+        path = PurePosixPath(full_name)
+        if root_name is not None and (
+                path == root_name or root_name in path.parents):
+            return path.relative_to(root_name)
+        return path
+
+    return {
+        f.data['id']: Path(*relative(f.data['full_name']).parts)
+        for f in course_folders
+    }
+
+def safe_name(name: str):
+    return name.replace('/', '_').replace('\0', '_') or '_'
+
+def local_path(root: Path, folder_paths: dict, file: IdResourceEndpoint):
+    folder = folder_paths.get(file.data.get('folder_id'), Path())
+    name = file.data.get('display_name') or file.data.get('filename')
+    return Path(root, folder, safe_name(name))
+
+def is_current(path: Path, file: IdResourceEndpoint, stored_hash: str):
+    '''Whether the local copy at path has the content whose hash is
+    recorded for the Canvas file
+    '''
+    if not stored_hash or not path.is_file():
+        return False
+    size = file.data.get('size')
+    if size is not None and path.stat().st_size != size:
+        return False
+    return hashing.same_content(
+        stored_hash, hash_from_path(path),
+        lambda alg: hash_from_path(path, alg),
+    )
+
+def download_file(file: IdResourceEndpoint, path: Path, *,
+                  chunk_size: int = CHUNK_SIZE):
+    '''Stream a Canvas file to path (atomically replacing whatever is
+    there), returning its content hash, or None if it could not be
+    downloaded
+    '''
+    path.parent.mkdir(parents=True, exist_ok=True)
+    algorithm = hashing.algorithm()
+    hasher = hashing.new_hasher(algorithm)
+
+    fd, tmp_name = tempfile.mkstemp(
+        dir=path.parent, prefix=f'.{path.name}.', suffix='.part',
+    )
+    try:
+        with os.fdopen(fd, 'wb') as wfp:
+            with get_session().get(file.data['url'], stream=True) as response:
+                if response.status_code not in range(200, 300):
+                    log.error(
+                        f'[file_mirror] Could not download'
+                        f' {file.data.get("display_name")}'
+                        f' ({response.status_code})'
+                    )
+                    os.unlink(tmp_name)
+                    return None
+                for chunk in response.iter_content(chunk_size):
+                    wfp.write(chunk)
+                    hasher.update(chunk)
+            wfp.flush()
+            os.fsync(wfp.fileno())
+        os.replace(tmp_name, path)
+    except BaseException:
+        if os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+        raise
+
+    hexdigest = hasher.hexdigest()
+    hash_cache.remember(path, algorithm, hexdigest)
+    return hashing.prefixed(hexdigest, algorithm)
+
+def mirror_course_files(course: IdResourceEndpoint, root: Path, *,
+                        max_workers: int = DOWNLOAD_WORKERS,
+                        chunk_size: int = CHUNK_SIZE,
+                        checkpoint_every: int = CHECKPOINT_EVERY,
+                        dry_run: bool = False) -> MirrorResult:
+    '''Bring the local mirror of the course's files under root up to
+    date, downloading max_workers files at a time and recording their
+    hashes every checkpoint_every downloads
+
+    '''
+    root = Path(root).expanduser().resolve()
+    paths = folder_paths(course)
+    stored = file_hash.get_file_hashes(course.api)
+
+    planned = [
+        (f, local_path(root, paths, f))
+        for f in files(course, do_memo=False)
+    ]
+    for path in set(paths.values()):
+        if not dry_run:
+            Path(root, path).mkdir(parents=True, exist_ok=True)
+
+    skipped, todo = [], []
+    for f, path in planned:
+        if is_current(path, f, stored.get(f.data.get('uuid'))):
+            skipped.append(path)
+        else:
+            todo.append((f, path))
+    log.info(
+        f'[file_mirror] {course.data.get("name")}: {len(todo)} files to'
+        f' download, {len(skipped)} up to date'
+    )
+    if dry_run:
+        return MirrorResult(
+            tuple(p for _, p in todo), tuple(skipped), (),
+            sum(f.data.get('size') or 0 for f, _ in todo),
+        )
+
+    downloaded, failed, total = [], [], 0
+    for batch in partition_all(checkpoint_every, todo):
+        results = pipe(
+            batch,
+            pmap(lambda fp: (*fp, download_file(
+                fp[0], fp[1], chunk_size=chunk_size,
+            )), max_workers=max_workers),
+            tuple,
+        )
+        done = tuple(filter(lambda r: r[2], results))
+        failed.extend(p for _, p, h in results if not h)
+        if done:
+            file_hash.set_file_hashes(
+                [f for f, _, _ in done], [h for _, _, h in done],
+            )
+            metadata.store(course.api).flush()
+        downloaded.extend(p for _, p, _ in done)
+        total += sum(p.stat().st_size for _, p, _ in done)
+        log.info(
+            f'[file_mirror] ... {len(downloaded)} of {len(todo)} files'
+            f' downloaded ({total:,} bytes)'
+        )
+    return MirrorResult(
+        tuple(downloaded), tuple(skipped), tuple(failed), total,
+    )
@@ -0,0 +1,54 @@
+'''Content fingerprints embedded in the bodies of Canvas objects
+
+With content_fingerprints turned on (see config.get_content_fingerprints),
+page bodies and assignment descriptions carry the hash of the source
+file they were rendered from, in a hidden element at the end. Whether
+an object is up to date can then be read off a listing that includes
+bodies, with no request per object and nothing kept in custom_data.
+
+>>> body = with_fingerprint('<p>Hello</p>', 'abc123')
+>>> body_fingerprint(body)
+'abc123'
+
+'''
+import re
+import logging
+
+from ..hashing import same_content
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+# Canvas sanitizes HTML (comments and most data- attributes are
+# dropped), but keeps class, title and style on a span
+FINGERPRINT_TEMPLATE = (
+    '<span class="coursework-fingerprint" title="coursework:{}"'
+    ' style="display: none;"></span>'
+)
+FINGERPRINT_RE = re.compile(
+    r'<span[^>]*class="coursework-fingerprint"[^>]*'
+    r'title="coursework:([0-9a-zA-Z:_-]+)"[^>]*>\s*</span>'
+)
+
+def body_fingerprint(body: str):
+    '''The fingerprint in an HTML body, or None
+    '''
+    match = FINGERPRINT_RE.search(body or '')
+    return match.group(1) if match else None
+
+def strip_fingerprint(body: str):
+    return FINGERPRINT_RE.sub('', body or '')
+
+def with_fingerprint(body: str, fingerprint: str):
+    '''An HTML body carrying (only) the given fingerprint
+    '''
+    return strip_fingerprint(body) + FINGERPRINT_TEMPLATE.format(fingerprint)
+
+def is_current(body: str, fingerprint: str, rehash=None):
+    '''Whether body carries fingerprint, or (given rehash, see
+    hashing.same_content) the same content's hash under another
+    algorithm
+    '''
+    if rehash is None:
+        return body_fingerprint(body) == fingerprint
+    return same_content(body_fingerprint(body), fingerprint, rehash)
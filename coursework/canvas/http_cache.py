@@ -0,0 +1,227 @@
+'''Persistent on-disk cache of Canvas GET responses
+
+Responses are stored in SQLite (by default under ~/.cache/coursework)
+along with their ETag/Last-Modified validators. A cached response that
+is younger than its endpoint's TTL is returned without touching the
+network. Otherwise the request is sent as a conditional request
+(If-None-Match / If-Modified-Since), so an unchanged listing comes back
+as a cheap 304 and the cached body is reused.
+
+Successful writes (POST/PUT/DELETE) invalidate the cached responses of
+the written resource and of the collection listing it (e.g. a PUT to
+courses/1/pages/intro drops the cached courses/1/pages/intro and
+courses/1/pages, but not courses/1/assignments), and the cache is kept
+under a size bound by evicting the least recently used entries.
+
+'''
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+import urllib.parse
+from pathlib import Path
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+def default_cache_path():
+    return Path('~/.cache/coursework/http-cache.sqlite').expanduser()
+
+DEFAULT_MAX_BYTES = 256 * 2**20
+
+# Seconds a cached response is trusted without revalidation, by
+# regex on the URL path. First match wins; anything unmatched is
+# always revalidated.
+DEFAULT_TTLS = (
+    (r'/users/self$', 3600),
+    (r'/courses$', 300),
+    (r'/custom_data', 0),
+)
+
+WRITE_METHODS = frozenset({'POST', 'PUT', 'PATCH', 'DELETE'})
+
+SCHEMA = '''
+create table if not exists responses (
+    key text primary key,
+    url text not null,
+    status integer not null,
+    headers text not null,
+    body blob not null,
+    etag text,
+    last_modified text,
+    stored_at real not null,
+    accessed_at real not null,
+    size integer not null
+);
+create index if not exists responses_url on responses (url);
+create index if not exists responses_accessed on responses (accessed_at);
+'''
+
+def url_path(url: str):
+    return urllib.parse.urlsplit(url).path.rstrip('/')
+
+def collection_path(url: str):
+    '''Path of the collection containing the resource at url
+    (e.g. /api/v1/courses/1/pages/intro -> /api/v1/courses/1/pages)
+
+    '''
+    path = url_path(url)
+    parts = path.split('/')
+    return '/'.join(parts[:-1]) if len(parts) % 2 else path
+
+def invalidated_paths(url: str):
+    '''Paths whose cached responses a write to url makes stale: the
+    written resource and the collection listing it
+    (e.g. /api/v1/courses/1 -> /api/v1/courses/1, /api/v1/courses)
+
+    '''
+    return tuple(dict.fromkeys([url_path(url), collection_path(url)]))
+
+def request_key(url: str, request_kw: dict):
+    auth = request_kw.get('auth')
+    return hashlib.sha256(json.dumps(
+        [url, request_kw.get('params'), request_kw.get('data'),
+         request_kw.get('json'),
+         hashlib.sha256(
+             str(getattr(auth, 'token', '')).encode()
+         ).hexdigest()],
+        sort_keys=True, default=str,
+    ).encode()).hexdigest()
+
+class CachedResponse:
+    def __init__(self, row):
+        (self.key, self.url, self.status, headers, self.body, self.etag,
+         self.last_modified, self.stored_at) = row
+        self.headers = json.loads(headers)
+
+    def age(self, now: float = None):
+        return (time.time() if now is None else now) - self.stored_at
+
+    def response(self) -> requests.Response:
+        response = requests.Response()
+        response.status_code = self.status
+        response.headers = CaseInsensitiveDict(self.headers)
+        response._content = self.body
+        response.url = self.url
+        response.encoding = requests.utils.get_encoding_from_headers(
+            response.headers
+        )
+        response.from_cache = True
+        return response
+
+class HttpCache:
+    def __init__(self, path=None, *, max_bytes: int = DEFAULT_MAX_BYTES,
+                 ttls=DEFAULT_TTLS):
+        self.path = Path(path).expanduser() if path else default_cache_path()
+        self.path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttls = tuple((re.compile(r), float(s)) for r, s in ttls)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self._lock, self._db:
+            self._db.executescript(SCHEMA)
+
+    def ttl(self, url: str):
+        path = url_path(url)
+        for regex, seconds in self.ttls:
+            if regex.search(path):
+                return seconds
+        return 0
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._db.execute(
+                'select key, url, status, headers, body, etag,'
+                ' last_modified, stored_at from responses where key = ?',
+                (key,),
+            ).fetchone()
+            if row is None:
+                return None
+            with self._db:
+                self._db.execute(
+                    'update responses set accessed_at = ? where key = ?',
+                    (time.time(), key),
+                )
+        return CachedResponse(row)
+
+    def fresh(self, entry: CachedResponse):
+        return entry.age() < self.ttl(entry.url)
+
+    def revalidated(self, entry: CachedResponse):
+        '''Canvas answered 304 for this entry, so restart its TTL
+        '''
+        with self._lock, self._db:
+            self._db.execute(
+                'update responses set stored_at = ? where key = ?',
+                (time.time(), entry.key),
+            )
+
+    def put(self, key: str, response: requests.Response):
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if not (etag or last_modified or self.ttl(response.url)):
+            # Nothing to revalidate with and never fresh: pointless
+            return
+        now = time.time()
+        body = response.content
+        with self._lock, self._db:
+            self._db.execute(
+                'insert or replace into responses values'
+                ' (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, response.url, response.status_code,
+                 json.dumps(dict(response.headers)), body, etag,
+                 last_modified, now, now, len(body)),
+            )
+            self._evict()
+
+    def _evict(self):
+        total = self._db.execute(
+            'select coalesce(sum(size), 0) from responses'
+        ).fetchone()[0]
+        while total > self.max_bytes:
+            rows = self._db.execute(
+                'select key, size from responses'
+                ' order by accessed_at limit 100'
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                self._db.execute('delete from responses where key = ?',
+                                 (key,))
+                total -= size
+                if total <= self.max_bytes:
+                    break
+
+    def invalidate(self, url: str):
+        '''Drop the cached responses (with any query string) of the
+        resource at url and of the collection listing it
+        '''
+        parts = urllib.parse.urlsplit(url)
+        with self._lock, self._db:
+            for path in invalidated_paths(url):
+                exact = f'{parts.scheme}://{parts.netloc}{path}'
+                like = exact.replace('%', r'\%').replace('_', r'\_') + '?%'
+                self._db.execute(
+                    "delete from responses where url = ?"
+                    " or url like ? escape '\\'",
+                    (exact, like),
+                )
+
+    def clear(self):
+        with self._lock, self._db:
+            self._db.execute('delete from responses')
+
+def conditional_headers(entry: CachedResponse, headers: dict = None):
+    headers = dict(headers or {})
+    if entry.etag:
+        headers['If-None-Match'] = entry.etag
+    if entry.last_modified:
+        headers['If-Modified-Since'] = entry.last_modified
+    return headers
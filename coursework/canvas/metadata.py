@@ -1,33 +1,423 @@
 '''Storage of API element metadata using the Canvas User object
 custom_data
 
-TODO
+Metadata goes through a write-behind store, one per Canvas instance and
+token. The first read loads the whole coursework namespace in a single
+request, and every later read is answered from memory. Writes only mark
+keys dirty. They are sent when the store is flushed: one PUT per key
+for a few keys, or a single PUT of the whole (freshly re-read and
+merged) namespace for more. The coursework-sync-* commands flush at the
+end of a sync, and anything still dirty is flushed at exit.
 
-'''
+Every flush also writes a new version stamp (VERSION_KEY). The stamp
+is checked before writing and read back after (see
+MetadataStore.flush), and changes made with update_metadata are
+replayed on top of anything written elsewhere in the meantime. With
+the optional local mirror (see metadata_mirror and the metadata_mirror
+config option), a store first reads only that stamp, and only
+downloads the namespace when it differs from the mirrored one.
+
+>>> get_metadata(page).get('hash')
+>>> update_metadata(page, lambda md: merge(md, {'hash': content_hash}))
+>>> flush_all()
 
+'''
+import copy
+import uuid
+import atexit
 import logging
+import threading
+from typing import NamedTuple
 
 from toolz.curried import pipe, map
 from larc.rest import (
-    IdResourceEndpoint,
+    Api, IdResourceEndpoint,
 )
 
 from .user import (
-    get_data, set_data,
+    NAMESPACE, get_data, get_all_data, set_all_data, set_data, delete_data,
 )
+from .metadata_mirror import MetadataMirror, account_key
 
 log = logging.getLogger(__name__)
 log.addHandler(logging.NullHandler())
 
+# Flushing more dirty keys than this is done with a single
+# whole-namespace PUT (which also carries the version stamp)
+PER_KEY_FLUSH_LIMIT = 1
+
+# Changed on every flush, so that mirrors can tell whether the
+# namespace has been written since they last saw it
+VERSION_KEY = 'metadata-version'
+
+# Writes a flush makes before giving up on the namespace being written
+# elsewhere at the same time
+FLUSH_ATTEMPTS = 3
+
+def new_version():
+    return uuid.uuid4().hex
+
+class Dirty(NamedTuple):
+    '''What a flush writes: a copy of a store's dirty state, taken at
+    change number seq
+    '''
+    seq: int
+    base: dict
+    changes: dict
+    deleted: set
+    values: dict
+    version: str
+
+class MetadataStore:
+    def __init__(self, api: Api, *, ns: str = NAMESPACE,
+                 mirror: MetadataMirror = None):
+        self.api = api
+        self.ns = ns
+        self.mirror = mirror
+        self.account = account_key(
+            api.base_url, getattr(api.auth, 'token', None) or '',
+        )
+        self.data = None
+        # For each dirty key: its value when it was loaded (or last
+        # flushed), and the changes made to it since, in order, each
+        # with its change number
+        self.base = {}
+        self.pending = {}
+        # Dirty keys that are to be removed, with the change number of
+        # their removal
+        self.deleted = {}
+        self.seq = 0
+        self._lock = threading.RLock()
+        # Flushes write without holding _lock, one at a time
+        self._flush_lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            if self.data is None:
+                self.data = self._load()
+            return self.data
+
+    def _load(self):
+        if self.mirror is None:
+            return get_all_data(self.api, ns=self.ns)
+
+        version = get_data(self.api, VERSION_KEY, ns=self.ns)
+        if version is not None and (
+                version == self.mirror.version(self.account, self.ns)):
+            log.debug(f'[MetadataStore] mirror is at version {version}')
+            return self.mirror.load(self.account, self.ns)
+
+        log.debug(
+            f'[MetadataStore] mirror is stale (remote version {version}),'
+            ' reloading'
+        )
+        data = get_all_data(self.api, ns=self.ns)
+        self.mirror.replace(
+            self.account, self.ns, data, data.get(VERSION_KEY),
+        )
+        return data
+
+    def get(self, key: str, default=None):
+        with self._lock:
+            return copy.deepcopy(self.load().get(key, default))
+
+    def update(self, key: str, update_f, default=None):
+        '''Atomically (within this process) replace the value at key with
+        update_f(value). The update is replayed on the remote value at
+        flush time if another process has changed the key since it was
+        loaded.
+
+        '''
+        with self._lock:
+            data = self.load()
+            self.base.setdefault(key, copy.deepcopy(data.get(key)))
+            value = update_f(copy.deepcopy(data.get(key, default)))
+            data[key] = copy.deepcopy(value)
+            self.seq += 1
+            self.pending.setdefault(key, []).append(
+                (self.seq, update_f, default)
+            )
+            self.deleted.pop(key, None)
+        return value
+
+    def delete(self, key: str):
+        with self._lock:
+            data = self.load()
+            self.base.setdefault(key, copy.deepcopy(data.get(key)))
+            data.pop(key, None)
+            self.seq += 1
+            self.pending[key] = []
+            self.deleted[key] = self.seq
+
+    def set(self, key: str, value):
+        value = copy.deepcopy(value)
+        return self.update(key, lambda _: copy.deepcopy(value))
+
+    @staticmethod
+    def _replay(changes: list, remote):
+        value = remote
+        for _, update_f, default in changes:
+            value = update_f(copy.deepcopy(
+                default if value is None else value
+            ))
+        return value
+
+    def _dirty(self) -> Dirty:
+        return Dirty(
+            self.seq, copy.deepcopy(self.base),
+            {k: list(v) for k, v in self.pending.items()},
+            set(self.deleted),
+            {
+                k: copy.deepcopy(self.data[k]) for k in self.pending
+                if k not in self.deleted
+            },
+            self.data.get(VERSION_KEY),
+        )
+
+    def _merged(self, remote: dict, dirty: Dirty, version: str):
+        '''The remote namespace with our changes applied: our values
+        where the remote key is as we loaded it, otherwise our changes
+        replayed on the remote value
+        '''
+        changes = {}
+        for key in sorted(dirty.values):
+            if remote.get(key) == dirty.base.get(key):
+                changes[key] = dirty.values[key]
+            else:
+                log.info(
+                    f'[MetadataStore] {key} changed remotely, merging'
+                )
+                changes[key] = self._replay(
+                    dirty.changes[key], remote.get(key),
+                )
+        return dict(
+            {k: v for k, v in remote.items() if k not in dirty.deleted},
+            **changes, **{VERSION_KEY: version},
+        )
+
+    def flush(self):
+        '''Write the dirty keys along with a new version stamp
+
+        Canvas has no conditional writes, so the version stamp is
+        checked on both sides of the write. A few dirty keys are
+        written one by one only if the remote stamp is still the one we
+        loaded. Otherwise (or for many dirty keys) the namespace is
+        re-read, merged (see _merged) and written whole.
+
+        Then the write is read back: the stamp after a whole namespace,
+        or the whole namespace after keys written one by one (which a
+        namespace written elsewhere between the check and the keys
+        could have overwritten). If another process wrote in between
+        and our changes did not survive (see _kept), the namespace is
+        merged again and rewritten, up to FLUSH_ATTEMPTS writes in all.
+
+        The dirty keys are copied under the store's lock and written
+        without it, so other threads keep reading and changing metadata
+        while a flush is out. Their changes stay dirty for the next
+        flush.
+
+        '''
+        with self._flush_lock:
+            with self._lock:
+                if not self.pending:
+                    return True
+                dirty = self._dirty()
+            version = new_version()
+            log.debug(
+                f'[MetadataStore] flushing {len(dirty.values)} keys,'
+                f' deleting {len(dirty.deleted)}'
+            )
+
+            merged = None
+            if len(dirty.changes) <= PER_KEY_FLUSH_LIMIT and (
+                    get_data(self.api, VERSION_KEY, ns=self.ns)
+                    == dirty.version):
+                previous = dict(dirty.base, **{VERSION_KEY: dirty.version})
+                ok = all([
+                    delete_data(self.api, k, ns=self.ns,
+                                previous=previous.get(k))
+                    for k in sorted(dirty.deleted)
+                ] + [
+                    set_data(self.api, k, v, ns=self.ns,
+                             previous=previous.get(k)) is not None
+                    for k, v in dict(
+                        dirty.values, **{VERSION_KEY: version}
+                    ).items()
+                ])
+            else:
+                merged = self._merged(
+                    get_all_data(self.api, ns=self.ns), dirty, version,
+                )
+                ok = set_all_data(self.api, merged, ns=self.ns) is not None
+
+            attempts = 1
+            while ok and not (
+                    merged is not None and self._stamped(version)):
+                remote = get_all_data(self.api, ns=self.ns)
+                if self._kept(remote, dirty, merged):
+                    if remote.get(VERSION_KEY) != version:
+                        # Written over since, but with our changes
+                        merged, version = remote, remote.get(VERSION_KEY)
+                    break
+                if attempts == FLUSH_ATTEMPTS:
+                    log.error(
+                        '[MetadataStore] the namespace keeps being written'
+                        ' elsewhere'
+                    )
+                    ok = False
+                    break
+                attempts += 1
+                log.info(
+                    '[MetadataStore] the namespace was written elsewhere'
+                    ' during the flush, merging again'
+                )
+                version = new_version()
+                merged = self._merged(remote, dirty, version)
+                ok = set_all_data(self.api, merged, ns=self.ns) is not None
+
+            with self._lock:
+                if ok:
+                    self._flushed(dirty, version, merged)
+                else:
+                    log.error(
+                        f'[MetadataStore] could not flush'
+                        f' {len(dirty.changes)} metadata keys'
+                    )
+            return ok
+
+    def _stamped(self, version: str):
+        return get_data(self.api, VERSION_KEY, ns=self.ns) == version
+
+    @staticmethod
+    def _kept(remote: dict, dirty: Dirty, merged: dict = None):
+        '''Whether the remote namespace has what we wrote
+        '''
+        written = dirty.values if merged is None else merged
+        return all(
+            remote.get(k) == written.get(k) for k in dirty.values
+        ) and not any(k in remote for k in dirty.deleted)
+
+    def written(self, values: dict, deleted=()):
+        '''Note keys that were written straight to Canvas, key by key
+        (e.g. the student database shards, see user.sync_students):
+        stamp a new version, so that mirrors elsewhere see the change,
+        and bring the loaded namespace and the local mirror up to date
+        with them. Returns whether the version was stamped.
+
+        '''
+        with self._flush_lock:
+            version = new_version()
+            remote = get_data(self.api, VERSION_KEY, ns=self.ns)
+            ok = set_data(
+                self.api, VERSION_KEY, version, ns=self.ns, previous=remote,
+            ) is not None
+            with self._lock:
+                if self.data is not None:
+                    for key, value in values.items():
+                        if key not in self.pending:
+                            self.data[key] = copy.deepcopy(value)
+                    for key in deleted:
+                        if key not in self.pending:
+                            self.data.pop(key, None)
+                    if ok and self.data.get(VERSION_KEY) == remote:
+                        self.data[VERSION_KEY] = version
+                # Only a mirror that was current is current now
+                if ok and self.mirror is not None and (
+                        self.mirror.version(self.account, self.ns)
+                        == remote):
+                    self.mirror.update(
+                        self.account, self.ns, values, version,
+                        sorted(deleted),
+                    )
+            return ok
+
+    def _flushed(self, dirty: Dirty, version: str, merged: dict = None):
+        '''Forget the changes a flush wrote, keeping those made while
+        it was out
+        '''
+        written = dirty.values if merged is None else merged
+        for key in dirty.changes:
+            later = [c for c in self.pending.get(key, []) if c[0] > dirty.seq]
+            if later or self.deleted.get(key, 0) > dirty.seq:
+                self.base[key] = copy.deepcopy(written.get(key))
+                self.pending[key] = later
+            else:
+                self.base.pop(key, None)
+                self.pending.pop(key, None)
+                self.deleted.pop(key, None)
+
+        if merged is not None:
+            data = copy.deepcopy(merged)
+            for key in self.pending:
+                if key in self.deleted:
+                    data.pop(key, None)
+                elif key not in dirty.changes or (
+                        merged.get(key) == dirty.values.get(key)):
+                    data[key] = self.data[key]
+                else:
+                    data[key] = self._replay(self.pending[key], data.get(key))
+            self.data = data
+        self.data[VERSION_KEY] = version
+
+        if self.mirror is not None and merged is not None:
+            self.mirror.replace(self.account, self.ns, merged, version)
+        elif self.mirror is not None:
+            self.mirror.update(
+                self.account, self.ns, dirty.values, version,
+                sorted(dirty.deleted),
+            )
+
+_stores = {}
+_stores_lock = threading.Lock()
+def store(api: Api) -> MetadataStore:
+    key = (api.base_url, getattr(api.auth, 'token', None))
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = MetadataStore(api, mirror=get_mirror())
+        return _stores[key]
+
+_mirror = None
+def get_mirror():
+    '''The process-wide local mirror, if one is configured
+    '''
+    global _mirror
+    if _mirror is None:
+        from ..config import get_metadata_mirror
+        path = get_metadata_mirror()
+        if path is not None:
+            _mirror = MetadataMirror(path or None)
+    return _mirror
+
+def flush_all():
+    with _stores_lock:
+        stores = tuple(_stores.values())
+    return all([s.flush() for s in stores])
+atexit.register(flush_all)
+
+def reset():
+    '''Flush and forget every store (e.g. to start a new sync from what
+    is on Canvas)
+    '''
+    flush_all()
+    with _stores_lock:
+        _stores.clear()
+
 def md_key(endpoint: IdResourceEndpoint):
     return 'metadata-' + pipe(endpoint.parts, map(str), '-'.join)
 
 def get_metadata(endpoint: IdResourceEndpoint):
-    meta = get_data(endpoint.api, md_key(endpoint))
-    if not meta:
-        set_data(endpoint.api, md_key(endpoint), {})
-        return {}
-    return meta
+    return store(endpoint.api).get(md_key(endpoint)) or {}
 
 def set_metadata(endpoint: IdResourceEndpoint, data: dict):
-    return set_data(endpoint.api, md_key(endpoint), data)
+    return store(endpoint.api).set(md_key(endpoint), data)
+
+def update_metadata(endpoint: IdResourceEndpoint, update_f):
+    '''Change an endpoint's metadata with update_f (metadata dict ->
+    metadata dict). Unlike get_metadata followed by set_metadata, this
+    is safe against other threads and processes changing the same
+    metadata, so update_f should change only what it means to.
+
+    >>> update_metadata(page, lambda md: merge(md, {'hash': content_hash}))
+
+    '''
+    return store(endpoint.api).update(md_key(endpoint), update_f, {})
@@ -0,0 +1,223 @@
+'''Pruning of metadata for Canvas objects that no longer exist
+
+metadata.md_key writes one custom_data key per endpoint
+(metadata-courses-<id>-pages-<url> and so on), and file_hash keeps the
+hash of every file it has seen by uuid. Neither is removed when the
+quiz, page, file or course goes away. Large values are stored in
+chunk keys (see codec), which an interrupted write can leave behind.
+find_orphans lists what is live on Canvas and reports the keys, hash
+entries and chunk keys that no longer match anything; prune removes
+them with a single write of the namespace.
+
+>>> orphans = find_orphans(api)
+>>> orphans.bytes
+>>> prune(api, orphans)
+
+'''
+import json
+import logging
+from typing import NamedTuple, Tuple
+
+from toolz.curried import pipe, map, filter, mapcat
+from larc.rest import Api, ResponseError
+
+from . import codec, metadata
+from .resources import get_id_resources
+from .assignment import assignments, assignment_groups
+from .file import files
+from .file_hash import _FILE_HASHES_KEY
+from .page import pages
+from .quiz import quizzes
+from .user import get_all_raw_data
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+# Course resources that have metadata, and how to list the live ones
+LISTINGS = {
+    'pages': pages,
+    'quizzes': quizzes,
+    'assignments': assignments,
+    'assignment_groups': assignment_groups,
+}
+
+# Every course the user can see, including concluded ones, whose files
+# may still be referenced
+all_courses = get_id_resources(
+    'courses', form_key='course', memo=True, cache_name='courses-all-states',
+    data={'state[]': ['unpublished', 'available', 'completed']},
+)
+
+class Orphan(NamedTuple):
+    key: str
+    course_id: str
+    reason: str
+    bytes: int
+
+class Orphans(NamedTuple):
+    keys: Tuple[Orphan, ...]
+    # uuid -> size of its hash entry
+    file_hashes: dict
+    # chunk key -> its size
+    chunk_keys: dict
+
+    @property
+    def bytes(self):
+        return (
+            sum(o.bytes for o in self.keys) + sum(self.file_hashes.values())
+            + sum(self.chunk_keys.values())
+        )
+
+def entry_size(key, value):
+    '''Bytes a key/value pair takes up in the namespace JSON
+    '''
+    return len(json.dumps({key: value}).encode('utf-8')) - 2
+
+def parse_md_key(key: str):
+    '''(course id, resource name) of a metadata key written by
+    metadata.md_key for a course resource, otherwise None
+    '''
+    parts = key.split('-')
+    if (len(parts) < 5 or parts[0] != 'metadata' or parts[1] != 'courses'
+            or parts[3] not in LISTINGS):
+        return None
+    return parts[2], parts[3]
+
+def course_state(api: Api, course_id: str):
+    '''"live", "gone" (Canvas answers 404) or "unknown"
+    '''
+    status = api('courses', course_id).get().status_code
+    if status == 200:
+        return 'live'
+    if status == 404:
+        return 'gone'
+    log.warning(
+        f'[metadata_gc] Course {course_id} answered {status}, keeping'
+        ' its metadata'
+    )
+    return 'unknown'
+
+def live_keys(api: Api, course_id: str, resource: str):
+    '''The metadata keys of a course's live resources, or None if they
+    could not be listed
+    '''
+    course = api('courses', course_id)
+    try:
+        return pipe(
+            LISTINGS[resource](course, do_memo=False),
+            map(metadata.md_key),
+            set,
+        )
+    except ResponseError:
+        log.warning(
+            f'[metadata_gc] Could not list {resource} of course'
+            f' {course_id}, keeping their metadata'
+        )
+
+def orphaned_keys(api: Api, data: dict):
+    by_course = {}
+    for key in data:
+        parsed = parse_md_key(key)
+        if parsed:
+            by_course.setdefault(parsed[0], {}).setdefault(
+                parsed[1], [],
+            ).append(key)
+
+    orphans = []
+    for course_id, resources in sorted(by_course.items()):
+        state = course_state(api, course_id)
+        if state == 'unknown':
+            continue
+        for resource, keys in sorted(resources.items()):
+            if state == 'gone':
+                live, reason = set(), 'course deleted'
+            else:
+                live, reason = live_keys(api, course_id, resource), (
+                    f'{resource[:-1]} deleted'
+                )
+                if live is None:
+                    continue
+            orphans.extend(
+                Orphan(k, course_id, reason, entry_size(k, data[k]))
+                for k in sorted(keys) if k not in live
+            )
+    return tuple(orphans)
+
+def live_file_uuids(api: Api):
+    '''uuids of every file in every course the user can see, or None if
+    any course's files could not be listed
+    '''
+    try:
+        return pipe(
+            all_courses(api(), do_memo=False),
+            mapcat(lambda c: files(c, do_memo=False)),
+            map(lambda f: f.data.get('uuid')),
+            filter(None),
+            set,
+        )
+    except ResponseError:
+        log.warning(
+            '[metadata_gc] Could not list every course\'s files, keeping'
+            ' all file hashes'
+        )
+
+def orphaned_file_hashes(api: Api, data: dict):
+    hashes = data.get(_FILE_HASHES_KEY) or {}
+    if not hashes:
+        return {}
+    live = live_file_uuids(api)
+    if live is None:
+        return {}
+    return {
+        uuid: entry_size(uuid, h)
+        for uuid, h in sorted(hashes.items()) if uuid not in live
+    }
+
+def orphaned_chunk_keys(stored: dict):
+    '''Chunk keys in the namespace (as stored) that no value's header
+    refers to
+    '''
+    live = set()
+    for key, value in stored.items():
+        if not codec.is_chunk_key(key):
+            live.update(codec.chunk_keys(key, value))
+    return {
+        key: entry_size(key, value)
+        for key, value in sorted(stored.items())
+        if codec.is_chunk_key(key) and key not in live
+    }
+
+def find_orphans(api: Api, *, file_hashes: bool = True) -> Orphans:
+    data = metadata.store(api).load()
+    return Orphans(
+        orphaned_keys(api, data),
+        orphaned_file_hashes(api, data) if file_hashes else {},
+        # The store only has decoded values, without their chunk keys
+        orphaned_chunk_keys(get_all_raw_data(api, ns=metadata.store(api).ns)),
+    )
+
+def prune(api: Api, orphans: Orphans):
+    '''Remove the orphaned keys, chunk keys and file hash entries, in one
+    write of the namespace (see metadata.MetadataStore.flush). Returns
+    whether it succeeded.
+    '''
+    store = metadata.store(api)
+    keys = [o.key for o in orphans.keys] + list(orphans.chunk_keys)
+    for key in keys:
+        store.delete(key)
+    if orphans.file_hashes:
+        store.update(
+            _FILE_HASHES_KEY,
+            lambda hashes: {
+                uuid: h for uuid, h in hashes.items()
+                if uuid not in orphans.file_hashes
+            },
+            {},
+        )
+    ok = store.flush()
+    if ok:
+        log.info(
+            f'[metadata_gc] Pruned {len(keys)} metadata keys and'
+            f' {len(orphans.file_hashes)} file hashes'
+        )
+    return ok
@@ -0,0 +1,111 @@
+'''Local SQLite mirror of the metadata kept in Canvas user custom_data
+
+One row per custom_data key, per Canvas instance, token and namespace,
+along with the version stamp (see metadata.VERSION_KEY) the rows were
+last reconciled with. A MetadataStore with a mirror only downloads the
+namespace when the stamp on Canvas differs from the mirrored one;
+otherwise it reads the mirrored rows.
+
+'''
+import json
+import hashlib
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+def default_mirror_path():
+    return Path('~/.cache/coursework/metadata.sqlite').expanduser()
+
+SCHEMA = '''
+create table if not exists entries (
+    account text not null,
+    ns text not null,
+    key text not null,
+    value text not null,
+    primary key (account, ns, key)
+);
+create table if not exists versions (
+    account text not null,
+    ns text not null,
+    version text,
+    primary key (account, ns)
+);
+'''
+
+def account_key(base_url: str, token: str):
+    '''Rows are kept apart by Canvas instance and by (a hash of) the
+    token, since different tokens may belong to different users
+    '''
+    return hashlib.sha256(
+        f'{base_url}\n{token}'.encode('utf-8')
+    ).hexdigest()
+
+class MetadataMirror:
+    def __init__(self, path=None):
+        self.path = Path(path).expanduser() if path else default_mirror_path()
+        self.path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self._lock, self._db:
+            self._db.executescript(SCHEMA)
+
+    def version(self, account: str, ns: str):
+        with self._lock:
+            row = self._db.execute(
+                'select version from versions where account = ? and ns = ?',
+                (account, ns),
+            ).fetchone()
+        return row[0] if row else None
+
+    def load(self, account: str, ns: str):
+        with self._lock:
+            rows = self._db.execute(
+                'select key, value from entries where account = ? and ns = ?',
+                (account, ns),
+            ).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def replace(self, account: str, ns: str, data: dict, version: str):
+        '''Mirror the whole namespace
+        '''
+        with self._lock, self._db:
+            self._db.execute(
+                'delete from entries where account = ? and ns = ?',
+                (account, ns),
+            )
+            self._db.executemany(
+                'insert into entries values (?, ?, ?, ?)',
+                [(account, ns, k, json.dumps(v)) for k, v in data.items()],
+            )
+            self._set_version(account, ns, version)
+
+    def update(self, account: str, ns: str, data: dict, version: str,
+               deleted=()):
+        '''Mirror changes to (and deletions of) some keys
+        '''
+        with self._lock, self._db:
+            self._db.executemany(
+                'delete from entries where account = ? and ns = ?'
+                ' and key = ?',
+                [(account, ns, k) for k in deleted],
+            )
+            self._db.executemany(
+                'insert or replace into entries values (?, ?, ?, ?)',
+                [(account, ns, k, json.dumps(v)) for k, v in data.items()],
+            )
+            self._set_version(account, ns, version)
+
+    def _set_version(self, account: str, ns: str, version: str):
+        self._db.execute(
+            'insert or replace into versions values (?, ?, ?)',
+            (account, ns, version),
+        )
+
+    def clear(self):
+        with self._lock, self._db:
+            self._db.execute('delete from entries')
+            self._db.execute('delete from versions')
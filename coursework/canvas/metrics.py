@@ -0,0 +1,164 @@
+'''Per-endpoint HTTP metrics
+
+Every request sent through a CanvasSession is recorded under its
+method and a normalized path template, in which the ids are replaced
+with ":id" (e.g. GET courses/:id/quizzes/:id/questions). For each
+template we keep the request count, status codes, latency histogram,
+response bytes and retries.
+
+>>> session = coursework.canvas.api.get_session()
+>>> print(session.metrics.table())
+>>> session.metrics.write_json('metrics.json')
+
+'''
+import json
+import bisect
+import logging
+import threading
+import urllib.parse
+from pathlib import Path
+from collections import Counter
+from typing import Union
+
+import requests
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+# Upper bounds (in seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'),
+)
+
+API_PREFIX = '/api/v1/'
+
+def path_template(url: str):
+    '''Canvas paths alternate collection names and ids, so every other
+    segment after the API prefix is an id ("self" is kept, so calls
+    for the current user stand out)
+
+    >>> path_template('https://x.instructure.com/api/v1/courses/1/pages/intro')
+    'courses/:id/pages/:id'
+
+    '''
+    parts = urllib.parse.urlsplit(url)
+    path = parts.path
+    if API_PREFIX in path:
+        path = path.split(API_PREFIX, 1)[1]
+    else:
+        # Not an API call (e.g. a file upload or download host)
+        return parts.netloc
+    return '/'.join(
+        ':id' if i % 2 and segment != 'self' else segment
+        for i, segment in enumerate(path.strip('/').split('/'))
+    )
+
+def response_bytes(response: requests.Response):
+    if response._content_consumed:
+        return len(response.content or b'')
+    return int(response.headers.get('Content-Length') or 0)
+
+class EndpointStats:
+    def __init__(self):
+        self.count = 0
+        self.statuses = Counter()
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.latency = 0.0
+        self.max_latency = 0.0
+        self.bytes = 0
+        self.retries = 0
+
+    def add(self, status, latency: float, nbytes: int, retries: int):
+        self.count += 1
+        self.statuses[str(status)] += 1
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+        self.latency += latency
+        self.max_latency = max(self.max_latency, latency)
+        self.bytes += nbytes
+        self.retries += retries
+
+    def quantile(self, q: float):
+        '''Upper bound of the histogram bucket holding the q-th quantile
+        '''
+        target = q * self.count
+        seen = 0
+        for bound, n in zip(LATENCY_BUCKETS, self.buckets):
+            seen += n
+            if seen >= target:
+                return min(bound, self.max_latency)
+        return self.max_latency
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'statuses': dict(self.statuses),
+            'latency_total': round(self.latency, 4),
+            'latency_mean': round(self.latency / (self.count or 1), 4),
+            'latency_max': round(self.max_latency, 4),
+            'latency_p50': round(self.quantile(0.5), 4),
+            'latency_p95': round(self.quantile(0.95), 4),
+            'latency_histogram': {
+                str(b): n for b, n in zip(LATENCY_BUCKETS, self.buckets)
+            },
+            'bytes': self.bytes,
+            'retries': self.retries,
+        }
+
+class Metrics:
+    def __init__(self):
+        self.endpoints = {}
+        self._lock = threading.Lock()
+
+    def record(self, method: str, url: str, status, latency: float, *,
+               nbytes: int = 0, retries: int = 0):
+        key = (method.upper(), path_template(url))
+        with self._lock:
+            if key not in self.endpoints:
+                self.endpoints[key] = EndpointStats()
+            self.endpoints[key].add(status, latency, nbytes, retries)
+
+    def reset(self):
+        with self._lock:
+            self.endpoints = {}
+
+    def rows(self):
+        with self._lock:
+            return sorted(
+                ((m, p, s.to_dict()) for (m, p), s in self.endpoints.items()),
+                key=lambda r: (-r[2]['count'], r[1], r[0]),
+            )
+
+    @property
+    def total(self):
+        return sum(s['count'] for _, _, s in self.rows())
+
+    def to_dict(self):
+        return {
+            'total_requests': self.total,
+            'endpoints': [
+                dict(stats, method=m, path=p) for m, p, stats in self.rows()
+            ],
+        }
+
+    def write_json(self, path: Union[str, Path]):
+        Path(path).expanduser().write_text(
+            json.dumps(self.to_dict(), indent=2)
+        )
+
+    def table(self):
+        header = (
+            f'{"count":>6} {"method":<6} {"path":<48} {"mean":>7}'
+            f' {"p95":>7} {"KiB":>9} {"retry":>5} statuses'
+        )
+        lines = [header, '-' * len(header)]
+        for method, path, s in self.rows():
+            statuses = ' '.join(
+                f'{k}:{v}' for k, v in sorted(s['statuses'].items())
+            )
+            lines.append(
+                f'{s["count"]:>6} {method:<6} {path:<48}'
+                f' {s["latency_mean"]:>7.3f} {s["latency_p95"]:>7.3f}'
+                f' {s["bytes"] / 1024:>9.1f} {s["retries"]:>5} {statuses}'
+            )
+        lines.append(f'{self.total:>6} total requests')
+        return '\n'.join(lines)
@@ -16,10 +16,11 @@ from larc.common import (
     maybe_first, vcall,
 )
 from larc.rest import (
-    Endpoint, update_endpoint, get_id_resources, new_id_resource,
+    Endpoint, update_endpoint, new_id_resource,
     total_cache_reset,
 )
 
+from .resources import get_id_resources
 from .course import (
     course_resource_docstring, create_course_resource_docstring,
 )
@@ -6,21 +6,26 @@ from typing import Union
 import logging
 
 from toolz.curried import (
-    curry, compose, pipe, map, do,
+    curry, compose, pipe, map, do, merge, filter,
 )
 
+from larc.common import maybe_first
 from larc.rest import (
-    IdResourceEndpoint, get_id_resources, new_id_resource, update_endpoint,
+    IdResourceEndpoint, new_id_resource, update_endpoint,
 )
 from larc.parallel import thread_map as pmap
 
+from .resources import get_id_resources
 from .course import (
     course_resource_docstring, create_course_resource_docstring,
 )
-from .metadata import get_metadata, set_metadata
+from .metadata import get_metadata, update_metadata
+from .fingerprint import is_current, with_fingerprint
 from ..common import (
-    hash_from_content, resolve_path,
+    resolve_path, text_hash_from_path,
 )
+from ..hashing import same_content
+from .. import config
 from .. import templates
 
 log = logging.getLogger(__name__)
@@ -31,6 +36,13 @@ pages = get_id_resources(
     help=course_resource_docstring('pages'),
 )
 
+# For fingerprinted syncs, which read each page's state off its body
+pages_with_body = get_id_resources(
+    'pages', form_key='wiki_page', id_key='url', memo=True,
+    cache_name='pages-with-body', data={'include[]': 'body'},
+    help=course_resource_docstring('pages'),
+)
+
 new_page = new_id_resource(
     'pages', form_key='wiki_page', id_key='url',
     help=create_course_resource_docstring(
@@ -56,6 +68,9 @@ def sync_page_from_path(course: IdResourceEndpoint, course_root: str,
         )
         return False
 
+    if config.get_content_fingerprints():
+        return sync_fingerprinted_page(course, course_root, path, title, html)
+
     page = find_page(course, title)
     if not page:
         # Need to create new
@@ -70,21 +85,58 @@ def sync_page_from_path(course: IdResourceEndpoint, course_root: str,
     meta = get_metadata(page)
 
     path = resolve_path(course_root, path)
-    content_hash = hash_from_content(path.read_text())
+    content_hash = text_hash_from_path(path)
     extant_hash = meta.get('hash')
 
-    if not content_hash == extant_hash:
+    if not same_content(extant_hash, content_hash,
+                        lambda alg: text_hash_from_path(path, alg)):
         log.info(
             f'[sync_page_from_path] Updating page:\n'
             f'-  title: "{title}"\n'
             f'-   path: {path}\n'
             f'- course: {course.data["name"]}'
         )
-        meta['hash'] = content_hash
-        set_metadata(page, meta)
+        update_metadata(page, lambda md: merge(md, {'hash': content_hash}))
         return update_endpoint(page, {'body': html})
     return page
 
+def sync_fingerprinted_page(course: IdResourceEndpoint, course_root: str,
+                            path: Union[str, Path], title: str, html):
+    '''Sync a page whose body carries its source's content hash, so
+    that an unchanged page costs nothing beyond the (shared) listing of
+    the course's pages with their bodies
+
+    '''
+    path = resolve_path(course_root, path)
+    content_hash = text_hash_from_path(path)
+    body = with_fingerprint(str(html), content_hash)
+
+    page = pipe(
+        pages_with_body(course),
+        filter(lambda p: p.data['title'] == title),
+        maybe_first,
+    )
+    if not page:
+        log.info(
+            f'[sync_page_from_path] Creating new page:\n'
+            f'-  title: "{title}"\n'
+            f'-   path: {path}\n'
+            f'- course: {course.data["name"]}'
+        )
+        return new_page(course, {'title': title, 'body': body})
+
+    if is_current(page.data.get('body'), content_hash,
+                  lambda alg: text_hash_from_path(path, alg)):
+        return page
+
+    log.info(
+        f'[sync_page_from_path] Updating page:\n'
+        f'-  title: "{title}"\n'
+        f'-   path: {path}\n'
+        f'- course: {course.data["name"]}'
+    )
+    return update_endpoint(page, {'body': body})
+
 @curry
 def sync_pages_from_path(course: IdResourceEndpoint, course_root: str,
                          pages_root: str):
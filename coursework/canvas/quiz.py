@@ -6,7 +6,6 @@ from pathlib import Path
 from typing import Union
 import random
 import logging
-import itertools
 
 from toolz.curried import (
     curry, merge, pipe, assoc, dissoc, itemmap, compose, juxt, complement,
@@ -19,18 +18,21 @@ from larc.common import (
     maybe_pipe,
 )
 from larc.rest import (
-    get_id_resources, IdResourceEndpoint, new_id_resource,
-    update_endpoint,
+    IdResourceEndpoint, new_id_resource, update_endpoint,
 )
 from larc import parallel
 
+from .resources import get_id_resources
 from .course import (
     Course, course_resource_docstring, course_id_tuple,
     create_course_resource_docstring,
 )
 from . import assignment
-from .metadata import get_metadata, set_metadata
+from .metadata import (
+    get_metadata, set_metadata, update_metadata, store as metadata_store,
+)
 from .. import common
+from ..hashing import same_content
 from .. import templates
 
 log = logging.getLogger(__name__)
@@ -331,7 +333,7 @@ def process_question(course: Course, course_root: str, question: dict):
 
 @curry
 def process_quiz(course: Course, course_root: str, quiz: dict):
-    rng = random.Random(course_id_tuple(course))
+    rng = random.Random('###'.join(map(str, course_id_tuple(course))))
 
     if 'title' not in quiz:
         log.error('Quiz does not have a title')
@@ -402,15 +404,14 @@ def update_quiz(course: Course, quiz_data: dict):
 
     # Check the stored hash of quiz data to see if something has
     # changed
-    if quiz_md.get('hash') != quiz_hash:
+    if not same_content(quiz_md.get('hash'), quiz_hash,
+                        lambda alg: common.hash_from_dict(quiz_data, alg)):
         log.info(
             '[update_quiz] ... quiz metadata has changed. Updating endpoint.'
         )
         quiz_ep = update_endpoint(quiz_ep, quiz_data)
-        set_metadata(
-            quiz_ep, merge(
-                quiz_md, {'hash': quiz_hash},
-            )
+        update_metadata(
+            quiz_ep, lambda md: merge(md, {'hash': quiz_hash}),
         )
     else:
         log.info(
@@ -419,6 +420,29 @@ def update_quiz(course: Course, quiz_data: dict):
 
     return quiz_ep
 
+def set_question_hashes(quiz_ep: Quiz, hashes: list):
+    return update_metadata(
+        quiz_ep, lambda md: assoc(md, 'questions', {'hashes': list(hashes)}),
+    )
+
+def checkpoint_questions(quiz_ep: Quiz):
+    '''Write the question hashes recorded so far (the checkpoint
+    create_questions resumes from) to Canvas, rather than at the end of
+    the sync
+    '''
+    if not metadata_store(quiz_ep.api).flush():
+        log.error('[checkpoint_questions] Could not checkpoint the questions')
+
+def same_questions(question_data: list, question_hashes: tuple,
+                   stored_hashes: list):
+    '''Whether the stored question hashes are of the given questions
+    (see hashing.same_content)
+    '''
+    return len(question_hashes) == len(stored_hashes) and all(
+        same_content(stored, h, lambda alg, q=q: common.hash_from_dict(q, alg))
+        for q, h, stored in zip(question_data, question_hashes, stored_hashes)
+    )
+
 def create_questions(course: Course, quiz_data: dict):
     '''Ok, so...
 
@@ -438,36 +462,65 @@ def create_questions(course: Course, quiz_data: dict):
     question_data = quiz_data['questions']
 
     quiz_md = get_metadata(quiz_ep)
-    question_md = quiz_md['questions']
+    question_md = quiz_md.setdefault('questions', {'hashes': []})
     question_hashes = pipe(
         question_data,
         map(common.hash_from_dict),
         tuple,
     )
     
-    if all(a == b for a, b in itertools.zip_longest(
-            question_hashes, question_md['hashes'])):
+    if same_questions(question_data, question_hashes,
+                      question_md['hashes']):
         log.info(
             '[create_questions] ... no differences detected in the questions.'
         )
         return question_eps
 
-    if question_eps:
+    # The stored hashes are a checkpoint of the questions created so
+    # far. If they are a prefix of what we want and match what is in
+    # Canvas, then a previous sync died part way through creating the
+    # questions, so pick up where it left off.
+    done = tuple(question_md['hashes'])
+    if (len(done) == len(question_eps) and
+            same_questions(question_data[:len(done)],
+                           question_hashes[:len(done)], done)):
         log.info(
-            '[create_questions] ... questions differ.. deleting'
-            f' {len(question_eps)} existing questions.'
+            f'[create_questions] ... resuming after {len(done)} of'
+            f' {len(question_hashes)} questions.'
         )
-    for q_ep in question_eps:
-        q_ep.delete()
+        question_eps = list(question_eps)
+    else:
+        if question_eps:
+            log.info(
+                '[create_questions] ... questions differ.. deleting'
+                f' {len(question_eps)} existing questions.'
+            )
+        for q_ep in question_eps:
+            q_ep.delete()
+        question_md['hashes'] = []
+        set_question_hashes(quiz_ep, [])
+        checkpoint_questions(quiz_ep)
+        question_eps = []
 
     log.info(
         '[create_questions] Creating new questions'
     )
-    question_eps = [
-        new_question(quiz_ep, q_data) for q_data in question_data
-    ]
-    quiz_md['questions']['hashes'] = question_hashes
-    set_metadata(quiz_ep, quiz_md)
+    try:
+        for q_hash, q_data in zip(question_hashes[len(question_eps):],
+                                  question_data[len(question_eps):]):
+            q_ep = new_question(quiz_ep, q_data)
+            if not q_ep:
+                log.error(
+                    '[create_questions] Stopping after'
+                    f' {len(question_eps)} questions. Re-run the sync to'
+                    ' resume.'
+                )
+                return Null
+            question_eps.append(q_ep)
+            question_md['hashes'] = question_md['hashes'] + [q_hash]
+            set_question_hashes(quiz_ep, question_md['hashes'])
+    finally:
+        checkpoint_questions(quiz_ep)
 
     log.info(
         f'[create_questions] Updating question count: {len(question_data)}'
@@ -0,0 +1,202 @@
+'''Listing of Canvas resources
+
+get_id_resources is a drop-in replacement for larc.rest's version
+(same arguments, same memoization cache) that pages faster. It asks
+for the largest page size Canvas allows. When the first page's Link
+header has a numbered "last" page, it fetches the rest of the pages
+concurrently instead of following the "next" links one round trip at
+a time. Pages are reassembled in order.
+
+Listings that Canvas pages with opaque bookmarks (no numbered "last"
+link) fall back to following the "next" links.
+
+Memoized getters are also single-flight: when several threads ask for
+the same uncached listing at once, only one of them fetches it, and
+the rest wait for and share its result.
+
+'''
+import logging
+import threading
+import urllib.parse
+import concurrent.futures
+
+import requests
+from toolz.curried import (
+    pipe, partial, mapcat,
+)
+
+from larc.common import do_nothing
+from larc.rest import (
+    Endpoint, ResponseError, empty_dict, from_multiple_response,
+    memoize_resources, memoize_key, cache_has_key, cache_get,
+    reset_cache_for_endpoint_by_resource_name,
+)
+from larc.parallel import thread_map
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+PER_PAGE = 100
+PAGE_WORKERS = 8
+
+def links(response: requests.Response) -> dict:
+    return pipe(
+        requests.utils.parse_header_links(response.headers.get('Link', '')),
+        lambda ls: {l.get('rel', '').lower(): l['url'] for l in ls},
+    )
+
+def page_number(url: str):
+    page = pipe(
+        urllib.parse.urlsplit(url).query,
+        urllib.parse.parse_qs,
+        lambda q: q.get('page', [None])[0],
+    )
+    return int(page) if page and page.isdigit() else None
+
+def with_page(url: str, page: int):
+    parts = urllib.parse.urlsplit(url)
+    query = pipe(
+        urllib.parse.parse_qsl(parts.query, keep_blank_values=True),
+        lambda q: [(k, str(page) if k == 'page' else v) for k, v in q],
+        urllib.parse.urlencode,
+    )
+    return urllib.parse.urlunsplit(parts._replace(query=query))
+
+def numbered_page_urls(next_url: str, last_url: str):
+    '''URLs of the pages from next_url through last_url, if both are
+    numbered; otherwise None
+
+    '''
+    if not next_url or not last_url:
+        return None
+    next_page = page_number(next_url)
+    last_page = page_number(last_url)
+    if next_page is None or last_page is None:
+        return None
+    return [with_page(next_url, p) for p in range(next_page, last_page + 1)]
+
+def remaining_page_urls(response: requests.Response):
+    '''URLs of every page after this one, if Canvas gave numbered
+    "next" and "last" links; otherwise None
+
+    '''
+    rels = links(response)
+    return numbered_page_urls(rels.get('next'), rels.get('last'))
+
+def checked(response: requests.Response):
+    if response.status_code != 200:
+        content = response.content.decode()
+        raise ResponseError(
+            f'Response code error: {response.status_code}\n\n'
+            f'{content[:200]}\n'
+            '...\n'
+            '...\n'
+            f'{content[-200:]}'
+        )
+    return response
+
+def iter_responses(endpoint: Endpoint, *, max_workers: int = PAGE_WORKERS,
+                   **requests_kw):
+    '''Yield each page (response) of a Canvas listing in order
+    '''
+    first = checked(endpoint.get(
+        params={'per_page': PER_PAGE}, **requests_kw,
+    ))
+    yield first
+
+    urls = remaining_page_urls(first)
+    if urls is not None:
+        yield from thread_map(
+            lambda url: checked(endpoint.get(url=url, **requests_kw)),
+            urls, max_workers=max_workers,
+        )
+        return
+
+    next_url = links(first).get('next')
+    while next_url:
+        response = checked(endpoint.get(url=next_url, **requests_kw))
+        yield response
+        next_url = links(response).get('next')
+
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+def single_flight(key, fetch):
+    '''Call fetch(), unless another thread is already fetching key, in
+    which case wait for and return that thread's result (or exception)
+
+    '''
+    with _in_flight_lock:
+        future = _in_flight.get(key)
+        leader = future is None
+        if leader:
+            future = _in_flight[key] = concurrent.futures.Future()
+
+    if not leader:
+        log.debug(f'[single_flight] joining in-flight fetch: {key}')
+        return future.result()
+
+    try:
+        result = fetch()
+    except BaseException as error:
+        future.set_exception(error)
+        raise
+    else:
+        future.set_result(result)
+        return result
+    finally:
+        with _in_flight_lock:
+            del _in_flight[key]
+
+def get_id_resources(resource_name: str, *, form_key: str = None,
+                     id_key: str = 'id', meta_f=empty_dict,
+                     unpack_f=do_nothing, single_unpack_f=do_nothing,
+                     help=None, memo=False, cache_name: str = None,
+                     **iter_kw):
+    '''cache_name (default: resource_name) names the memoization cache
+    entry, for listings of the same resource with different parameters
+    (e.g. with and without bodies)
+
+    '''
+    cache_name = cache_name or resource_name
+
+    def fetch(parent_endpoint: Endpoint):
+        endpoint = parent_endpoint(resource_name)
+        return pipe(
+            iter_responses(endpoint, **iter_kw),
+            mapcat(from_multiple_response(
+                endpoint, form_key=form_key, id_key=id_key,
+                meta_f=meta_f, unpack_f=unpack_f,
+                single_unpack_f=single_unpack_f,
+            )),
+            tuple,
+            memoize_resources(parent_endpoint, cache_name),
+        )
+
+    def getter(parent_endpoint: Endpoint, *, do_memo=True):
+        if not (memo and do_memo):
+            return fetch(parent_endpoint)
+
+        def fetch_unless_cached():
+            # Another thread may have filled the cache between our check
+            # and becoming the leader
+            if cache_has_key(parent_endpoint, cache_name):
+                return cache_get(parent_endpoint, cache_name)
+            return fetch(parent_endpoint)
+
+        if cache_has_key(parent_endpoint, cache_name):
+            return cache_get(parent_endpoint, cache_name)
+        return single_flight(
+            memoize_key(parent_endpoint, cache_name),
+            fetch_unless_cached,
+        )
+    getter.__doc__ = help or ''
+
+    getter.reset_cache = partial(
+        reset_cache_for_endpoint_by_resource_name,
+        resource_name=cache_name,
+    )
+    getter.reset_cache.__doc__ = f'''
+    Reset the "{cache_name}" cache for a given Endpoint.
+    '''
+
+    return getter
@@ -0,0 +1,196 @@
+'''Retry and circuit-breaker policy for requests to Canvas
+
+Transient failures (connection errors, timeouts, 429 and 5xx
+responses) are retried with jittered exponential backoff. Only
+idempotent verbs are retried by default; POSTs are retried only when
+the policy allows it, since a POST that reached Canvas before the
+connection dropped may have already created its object.
+
+Each host also gets a CircuitBreaker. After a run of consecutive
+failures the breaker opens and requests to that host fail fast with
+CircuitOpenError, instead of every worker in a thread pool piling
+more load onto a degraded Canvas instance. After a cool-off period a
+single trial request is let through; if it succeeds, the breaker
+closes again.
+
+'''
+import time
+import random
+import logging
+import threading
+import email.utils
+
+import requests
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+RETRY_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'})
+RETRY_ERRORS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+)
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    pass
+
+def retry_after(response: requests.Response):
+    '''Seconds to wait according to the Retry-After header, if any
+    '''
+    if response is None:
+        return None
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        log.warning(f'[retry_after] Ignoring malformed Retry-After: {value}')
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+class RetryPolicy:
+    def __init__(self, *, max_retries: int = 4, backoff: float = 0.5,
+                 max_backoff: float = 30.0, retry_post: bool = False,
+                 statuses=RETRY_STATUSES, rng: random.Random = None):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retry_post = retry_post
+        self.statuses = statuses
+        self.rng = rng or random.Random()
+
+    def retries_method(self, method: str):
+        method = method.upper()
+        return method in IDEMPOTENT_METHODS or (
+            self.retry_post and method in {'POST', 'PATCH'}
+        )
+
+    def should_retry(self, method: str, attempt: int,
+                     response: requests.Response = None,
+                     error: Exception = None):
+        '''Should a request that has been tried attempt times be tried
+        again?
+
+        '''
+        if attempt > self.max_retries or not self.retries_method(method):
+            return False
+        if error is not None:
+            return isinstance(error, RETRY_ERRORS) and not isinstance(
+                error, CircuitOpenError
+            )
+        return response is not None and response.status_code in self.statuses
+
+    def delay(self, attempt: int, response: requests.Response = None):
+        '''"Full jitter" exponential backoff, unless Canvas said how long
+        to wait
+
+        '''
+        after = retry_after(response)
+        if after is not None:
+            return min(after, self.max_backoff)
+        cap = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        return self.rng.uniform(0, cap)
+
+class CircuitBreaker:
+    def __init__(self, name: str, *, failure_threshold: int = 5,
+                 reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def before(self):
+        '''Call before each request; raises CircuitOpenError if the
+        request should not be sent
+
+        '''
+        with self._lock:
+            if self.opened_at is None:
+                return
+            waited = time.monotonic() - self.opened_at
+            if waited >= self.reset_timeout and not self.trial_in_flight:
+                # Half-open: let one trial request through
+                self.trial_in_flight = True
+                return
+            raise CircuitOpenError(
+                f'Circuit open for {self.name} after {self.failures}'
+                f' consecutive failures ({waited:.0f}s ago)'
+            )
+
+    def abandon(self):
+        '''Call instead of record when a request ended without an outcome
+        that says anything about the host (e.g. it raised an error that
+        is not a requests error), so a half-open trial is given up
+        rather than left in flight forever
+
+        '''
+        with self._lock:
+            self.trial_in_flight = False
+
+    def record(self, success: bool):
+        with self._lock:
+            self.trial_in_flight = False
+            if success:
+                if self.opened_at is not None:
+                    log.info(f'[CircuitBreaker] {self.name}: closed')
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    log.error(
+                        f'[CircuitBreaker] {self.name}: opened after'
+                        f' {self.failures} consecutive failures'
+                    )
+                self.opened_at = time.monotonic()
+
+def is_failure(response: requests.Response = None, error: Exception = None):
+    '''Does this outcome count against the host's circuit breaker?
+    '''
+    if error is not None:
+        return isinstance(error, RETRY_ERRORS)
+    return response.status_code >= 500
+
+def rewind_body(request_kw: dict):
+    '''Seek any file objects in a request's body back to the start so the
+    request can be sent again. Returns False if some part of the body
+    cannot be rewound (e.g. it is a generator).
+
+    '''
+    files = request_kw.get('files') or {}
+    bodies = [
+        # requests' (filename, fileobj[, content_type]) form
+        f[1] if isinstance(f, (tuple, list)) and len(f) > 1 else f
+        for f in (files.values() if isinstance(files, dict) else
+                  (f for _, f in files))
+    ]
+    bodies.append(request_kw.get('data'))
+    for body in bodies:
+        if body is None or isinstance(
+                body, (str, bytes, bytearray, dict, list, tuple)):
+            # Sent from memory; nothing to rewind
+            continue
+        if hasattr(body, 'seek') and hasattr(body, 'tell'):
+            seekable = getattr(body, 'seekable', None)
+            if seekable is not None and not seekable():
+                return False
+            body.seek(0)
+            continue
+        if hasattr(body, 'read') or hasattr(body, '__iter__'):
+            return False
+    return True
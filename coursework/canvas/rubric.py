@@ -4,9 +4,10 @@
 import logging
 
 from larc.rest import (
-    IdResourceEndpoint, get_id_resources, new_id_resource,
+    IdResourceEndpoint, new_id_resource,
 )
 
+from .resources import get_id_resources
 from .course import (
     course_resource_docstring, create_course_resource_docstring,
 )
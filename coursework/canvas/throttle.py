@@ -0,0 +1,154 @@
+'''Adaptive, cost-aware throttling of requests to Canvas
+
+Canvas meters each API token with a leaky bucket. Every response
+carries the cost of that request (X-Request-Cost) and the amount left
+in the bucket (X-Rate-Limit-Remaining). When the bucket runs dry,
+Canvas answers with 403 "Rate Limit Exceeded".
+
+A RateLimiter is shared by every thread talking to a given host. It
+bounds the number of requests in flight, growing that bound by one
+per window of successful responses (additive increase) and halving it
+when Canvas signals pressure (multiplicative decrease). Before a
+request is sent, the limiter also estimates what will be left in the
+bucket once the requests already in flight are charged, and holds the
+request back if that would dip below a low-water mark.
+
+'''
+import time
+import logging
+import threading
+
+import requests
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+# Canvas adds a flat pre-flight charge to each request while it is in
+# flight and refills the bucket at roughly this many units per second
+PREFLIGHT_COST = 50.0
+LEAK_RATE = 10.0
+
+def is_rate_limited(response: requests.Response):
+    '''Did Canvas refuse this request because the token's bucket is
+    empty?
+
+    '''
+    if response.status_code == 429:
+        return True
+    return (
+        response.status_code == 403 and
+        'rate limit exceeded' in response.text.lower()
+    )
+
+def header_float(response: requests.Response, name: str):
+    try:
+        return float(response.headers[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+class RateLimiter:
+    def __init__(self, *, initial: int = 10, minimum: int = 1,
+                 maximum: int = 50, low_water: float = 150.0,
+                 decrease: float = 0.5, cooldown: float = 1.0):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.low_water = low_water
+        self.decrease = decrease
+        self.cooldown = cooldown
+
+        self.in_flight = 0
+        self.remaining = None
+        self.remaining_at = 0.0
+        self.cost = 0.0
+        self.last_decrease = 0.0
+
+        self._cond = threading.Condition()
+
+    def estimated_remaining(self, now: float = None):
+        '''Estimate of what will be left in the bucket once every request
+        currently in flight has been charged, or None if Canvas has not
+        reported the bucket level yet
+
+        '''
+        if self.remaining is None:
+            return None
+        now = time.monotonic() if now is None else now
+        refilled = (now - self.remaining_at) * LEAK_RATE
+        charged = self.in_flight * (self.cost + PREFLIGHT_COST)
+        return self.remaining + refilled - charged
+
+    def _wait_time(self):
+        if self.in_flight >= max(int(self.limit), self.minimum):
+            return 1.0
+        remaining = self.estimated_remaining()
+        if remaining is not None and remaining < self.low_water:
+            if not self.in_flight:
+                # Nothing in flight will wake us, so sleep until the
+                # bucket has leaked back up to the low-water mark
+                return (self.low_water - remaining) / LEAK_RATE
+            return 1.0
+        return 0
+
+    def acquire(self):
+        with self._cond:
+            wait = self._wait_time()
+            while wait:
+                log.debug(
+                    f'[RateLimiter] waiting: in flight={self.in_flight}'
+                    f' limit={self.limit:.1f}'
+                    f' remaining={self.estimated_remaining()}'
+                )
+                self._cond.wait(timeout=wait)
+                wait = self._wait_time()
+            self.in_flight += 1
+
+    def try_acquire(self):
+        '''Acquire a slot only if that needs no waiting, returning whether
+        it did (for callers, like the asyncio client, that must not
+        block)
+
+        '''
+        with self._cond:
+            if self._wait_time():
+                return False
+            self.in_flight += 1
+            return True
+
+    def _decrease(self, now: float):
+        if now - self.last_decrease >= self.cooldown:
+            self.limit = max(self.minimum, self.limit * self.decrease)
+            self.last_decrease = now
+            log.debug(
+                f'[RateLimiter] backing off to {self.limit:.1f} in flight'
+            )
+
+    def release(self, response: requests.Response = None):
+        with self._cond:
+            self.in_flight = max(0, self.in_flight - 1)
+            now = time.monotonic()
+
+            if response is not None:
+                cost = header_float(response, 'X-Request-Cost')
+                if cost is not None:
+                    # Smoothed so one expensive listing does not stall
+                    # everything behind it
+                    self.cost = 0.8 * self.cost + 0.2 * cost
+
+                remaining = header_float(response, 'X-Rate-Limit-Remaining')
+                if remaining is not None:
+                    self.remaining = remaining
+                    self.remaining_at = now
+
+                if is_rate_limited(response):
+                    self.remaining = 0.0
+                    self.remaining_at = now
+                    self._decrease(now)
+                elif remaining is not None and remaining < self.low_water:
+                    self._decrease(now)
+                else:
+                    self.limit = min(
+                        self.maximum, self.limit + 1 / self.limit
+                    )
+
+            self._cond.notify_all()
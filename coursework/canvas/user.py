@@ -1,11 +1,14 @@
 import pprint
 import logging
+import threading
 
-from toolz.curried import pipe, map, merge
+from toolz.curried import pipe, map, merge, groupby, valmap
 from larcutils.rest import (
-    Api, IdResourceEndpoint, get_id_resources, ResourceEndpoint,
+    Api, IdResourceEndpoint, ResourceEndpoint,
 )
 
+from . import codec
+from .resources import get_id_resources
 from .course import course_resource_docstring
 
 log = logging.getLogger(__name__)
@@ -32,59 +35,334 @@ teachers = get_id_resources(
     memo=True,
 )
 
+NAMESPACE = 'com.lowlandresearch.coursework'
+
+_selves = {}
+_selves_lock = threading.Lock()
 def get_self(api: Api):
-    ep = api('users', 'self')
-    return ResourceEndpoint(ep, ep.get().json(), 'user')
+    '''The current user's endpoint, fetched once per Canvas instance and
+    token
+    '''
+    key = (api.base_url, getattr(api.auth, 'token', None))
+    with _selves_lock:
+        if key not in _selves:
+            ep = api('users', 'self')
+            _selves[key] = ResourceEndpoint(ep, ep.get().json(), 'user')
+        return _selves[key]
+
+def reset_self_cache():
+    with _selves_lock:
+        _selves.clear()
+
+def scope_parts(key):
+    '''custom_data scope path parts for a key, which is either a single
+    key or a tuple of nested keys (e.g. ('student-db-0', '1234'))
+    '''
+    return (key,) if isinstance(key, str) else tuple(map(str, key))
 
-def get_data(api: Api, key: str, *, default=None,
-             ns='com.lowlandresearch.coursework'):
+def get_raw_data(api: Api, key, *, default=None, ns=NAMESPACE):
+    '''The value at key as stored (i.e. possibly encoded, see codec)
+    '''
     self = get_self(api)
 
-    resp = self('custom_data', key).get(json={'ns': ns})
+    resp = self('custom_data', *scope_parts(key)).get(json={'ns': ns})
     if resp.status_code in range(200, 300):
         return resp.json()['data']
     else:
         return default
 
-def set_data(api: Api, key, data: dict, *,
-             ns='com.lowlandresearch.coursework'):
+def decode_data(api: Api, key, stored, *, ns=NAMESPACE):
+    return codec.decode(
+        key, stored, lambda chunk_key: get_raw_data(api, chunk_key, ns=ns),
+    )
+
+def get_data(api: Api, key, *, default=None, ns=NAMESPACE):
+    error = None
+    # A second try, in case the value was rewritten (and its old chunks
+    # deleted) between reading its header and its chunks
+    for _ in range(2):
+        stored = get_raw_data(api, key, ns=ns)
+        if stored is None:
+            return default
+        try:
+            return decode_data(api, key, stored, ns=ns)
+        except codec.CodecError as e:
+            error = e
+    log.error(f'Could not decode key {key}: {error}')
+    return default
+
+def get_all_raw_data(api: Api, *, ns=NAMESPACE):
+    '''Every key in the namespace as stored (including chunk keys), in
+    one request
+    '''
     self = get_self(api)
 
-    resp = self('custom_data', key).put(
-        json={'ns': ns, 'data': data},
+    resp = self('custom_data').get(json={'ns': ns})
+    if resp.status_code not in range(200, 300):
+        # Canvas answers 400 for a namespace with no data yet
+        return {}
+    return resp.json()['data'] or {}
+
+def get_all_data(api: Api, *, ns=NAMESPACE):
+    '''Every key in the namespace, in one request
+    '''
+    stored = get_all_raw_data(api, ns=ns)
+
+    def decoded(key):
+        try:
+            return codec.decode(key, stored[key], stored.get)
+        except codec.CodecError as error:
+            log.error(f'Could not decode key {key}: {error}')
+            return None
+
+    return {
+        key: decoded(key) for key in stored if not codec.is_chunk_key(key)
+    }
+
+def encode_data(data: dict):
+    '''Namespace data as stored, with large values encoded (and
+    chunked)
+    '''
+    stored = {}
+    for key, value in data.items():
+        header, chunks = codec.encode(key, value)
+        stored.update(chunks)
+        stored[key] = header
+    return stored
+
+def set_all_data(api: Api, data: dict, *, ns=NAMESPACE):
+    '''Replace the whole namespace with data
+    '''
+    self = get_self(api)
+
+    resp = self('custom_data').put(
+        json={'ns': ns, 'data': encode_data(data)},
+    )
+    if resp.status_code in range(200, 300):
+        return data
+    else:
+        log.error(f'Could not set namespace {ns} ({len(data)} keys)')
+
+def set_raw_data(api: Api, key, stored, *, ns=NAMESPACE):
+    self = get_self(api)
+
+    resp = self('custom_data', *scope_parts(key)).put(
+        json={'ns': ns, 'data': stored},
     )
     if resp.status_code in range(200, 300):
         return resp.json()['data']
     else:
         log.error(f'Could not set key {key} to value:'
-                  f' {pprint.pformat(data)[:1000]}')
+                  f' {pprint.pformat(stored)[:1000]}')
+
+_UNKNOWN = object()
+
+def _stored_chunk_keys(api: Api, key, previous, ns: str):
+    '''The chunk keys of the value stored at key. previous is that value
+    (decoded), if the caller knows it, which saves reading it when it
+    is too small to have been chunked.
+    '''
+    if not isinstance(key, str) or not (
+            previous is _UNKNOWN or codec.may_be_chunked(previous)):
+        return []
+    return codec.chunk_keys(key, get_raw_data(api, key, ns=ns))
+
+def set_data(api: Api, key, data: dict, *, ns=NAMESPACE,
+             previous=_UNKNOWN):
+    '''Set the value at key, encoding it if it is large (see codec).
+    Values set within a key (i.e. with a tuple key) are never encoded.
+
+    The chunks of the value it replaces (see _stored_chunk_keys for
+    previous) are deleted once the new value is written.
 
-_STUDENT_DB_KEY = 'student-db'
-def _get_student_db(api: Api):
-    student_db = get_data(api, _STUDENT_DB_KEY)
-    if student_db is None:
-        student_db = {}
-        _set_student_db(api, student_db)
-    return student_db
+    '''
+    if not isinstance(key, str):
+        return set_raw_data(api, key, data, ns=ns)
 
-def _set_student_db(api: Api, student_db: dict):
-    set_data(api, _STUDENT_DB_KEY, student_db)
+    stale = _stored_chunk_keys(api, key, previous, ns)
+    header, chunks = codec.encode(key, data)
+    # The chunks go first, so the header never refers to missing ones
+    for chunk_key, chunk in chunks.items():
+        if set_raw_data(api, chunk_key, chunk, ns=ns) is None:
+            return None
+    if set_raw_data(api, key, header, ns=ns) is None:
+        return None
+    for chunk_key in stale:
+        if chunk_key not in chunks:
+            delete_data(api, chunk_key, ns=ns, previous=None)
+    return data
+
+def delete_data(api: Api, key, *, ns=NAMESPACE, previous=_UNKNOWN):
+    '''Delete the value at key along with its chunks (see
+    _stored_chunk_keys for previous)
+    '''
+    stale = _stored_chunk_keys(api, key, previous, ns)
+    self = get_self(api)
+
+    resp = self('custom_data', *scope_parts(key)).delete(json={'ns': ns})
+    for chunk_key in stale:
+        delete_data(api, chunk_key, ns=ns, previous=None)
+    return resp.status_code in range(200, 300)
+
+# The student database is sharded by Canvas user id range, one
+# custom_data key per shard, so that a course's roster only needs the
+# shards its students fall in and a sync only writes what changed. The
+# shards are read and written key by key rather than through the
+# metadata store (which loads and may rewrite the whole namespace),
+# and the store is then told what was written (see
+# metadata.MetadataStore.written).
+_LEGACY_STUDENT_DB_KEY = 'student-db'
+STUDENT_SHARD_SIZE = 1000
+
+# Changing more students than this in a shard rewrites the shard in
+# one request instead of writing each student
+PER_STUDENT_WRITE_LIMIT = 5
+
+def student_shard(student_id) -> int:
+    return int(student_id) // STUDENT_SHARD_SIZE
+
+def student_shard_key(shard: int):
+    return f'{_LEGACY_STUDENT_DB_KEY}-{shard}'
+
+def _store(api: Api):
+    # metadata is built on this module
+    from . import metadata
+    return metadata.store(api)
+
+_migrated = set()
+_migrated_lock = threading.Lock()
+def _migrate_legacy_student_db(api: Api):
+    '''Split the old single-blob student database into shards (once per
+    Canvas instance and token per process)
+    '''
+    key = (api.base_url, getattr(api.auth, 'token', None))
+    with _migrated_lock:
+        if key in _migrated:
+            return
+        _migrated.add(key)
+
+    legacy = get_data(api, _LEGACY_STUDENT_DB_KEY)
+    if not legacy:
+        return
+    log.info(
+        f'Migrating the student database ({len(legacy)} students)'
+        ' to shards'
+    )
+    shards = pipe(
+        legacy.items(),
+        groupby(lambda kv: student_shard(kv[0])),
+        valmap(lambda kvs: {str(k): v for k, v in kvs}),
+    )
+    written = {}
+    for shard, db in sorted(shards.items()):
+        current = get_data(api, student_shard_key(shard), default={})
+        written[student_shard_key(shard)] = merge(db, current)
+        if set_data(api, student_shard_key(shard),
+                    written[student_shard_key(shard)],
+                    previous=current) is None:
+            log.error('Student database migration failed, keeping the'
+                      ' legacy database')
+            _store(api).written(written)
+            return
+    delete_data(api, _LEGACY_STUDENT_DB_KEY, previous=legacy)
+    _store(api).written(written, [_LEGACY_STUDENT_DB_KEY])
+
+def _get_student_shard(api: Api, shard: int):
+    return get_data(api, student_shard_key(shard))
+
+def _get_stored_student_shard(api: Api, shard: int):
+    '''(shard, whether it is stored encoded)
+    '''
+    key = student_shard_key(shard)
+    stored = get_raw_data(api, key)
+    if stored is None:
+        return None, False
+    return decode_data(api, key, stored), codec.is_encoded(stored)
+
+def _get_student_db(api: Api, student_ids):
+    '''Student records (keyed by string id) of the shards holding
+    student_ids
+    '''
+    shards = pipe(student_ids, map(student_shard), set, sorted)
+    found = {shard: _get_student_shard(api, shard) for shard in shards}
+    if any(db is None for db in found.values()):
+        # A missing shard may still be in the legacy database
+        _migrate_legacy_student_db(api)
+        found = merge(found, {
+            shard: _get_student_shard(api, shard)
+            for shard, db in found.items() if db is None
+        })
+    return merge(*[db or {} for db in found.values()], {})
 
 def course_student_db(course: IdResourceEndpoint):
-    all_db = _get_student_db(course.api)
+    course_students = students(course)
+    db = _get_student_db(
+        course.api, [s.data['id'] for s in course_students],
+    )
 
     return pipe(
-        students(course),
-        map(lambda s: all_db.get(str(s.data['id']), {'id': s.data['id']})),
+        course_students,
+        map(lambda s: db.get(str(s.data['id']), {'id': s.data['id']})),
         tuple,
     )
 
+def _write_student_shard(api: Api, shard: int, current, changed: dict,
+                         encoded: bool = False):
+    key = student_shard_key(shard)
+    # An encoded shard can only be written whole
+    if (current is None or encoded or
+            len(changed) > PER_STUDENT_WRITE_LIMIT):
+        return set_data(
+            api, key, merge(current or {}, changed), previous=current,
+        ) is not None
+    return all([
+        set_data(api, (key, sid), s) is not None
+        for sid, s in changed.items()
+    ])
+
+_shard_locks = {}
+_shard_locks_lock = threading.Lock()
+def _shard_lock(api: Api, shard: int):
+    key = (api.base_url, getattr(api.auth, 'token', None), shard)
+    with _shard_locks_lock:
+        return _shard_locks.setdefault(key, threading.Lock())
+
 def sync_students(api: Api, students: tuple):
-    all_db = _get_student_db(api)
-    return _set_student_db(
-        api,
-        merge(
-            all_db,
-            {s['id']: s for s in students},
-        )
+    '''Write the students whose records changed, touching only their
+    shards. Returns the students' (merged) records.
+
+    Each shard is read and written under a lock, so concurrent syncs in
+    this process don't lose each other's students. Changes go out
+    student by student where possible, so concurrent syncs in other
+    processes only race on the same student.
+
+    '''
+    by_shard = pipe(
+        students,
+        map(lambda s: (str(s['id']), s)),
+        groupby(lambda kv: student_shard(kv[0])),
+        valmap(dict),
     )
+
+    written = {}
+    for shard, shard_students in sorted(by_shard.items()):
+        with _shard_lock(api, shard):
+            current, encoded = _get_stored_student_shard(api, shard)
+            if current is None:
+                _migrate_legacy_student_db(api)
+                current, encoded = _get_stored_student_shard(api, shard)
+            db = current or {}
+            changed = {
+                sid: s for sid, s in shard_students.items()
+                if db.get(sid) != s
+            }
+            if not changed:
+                continue
+            if _write_student_shard(api, shard, current, changed, encoded):
+                written[student_shard_key(shard)] = merge(db, changed)
+            else:
+                log.error(f'Could not write student database shard {shard}')
+
+    if written:
+        _store(api).written(written)
+    return merge(*by_shard.values(), {})
@@ -0,0 +1,197 @@
+import os
+import json
+import time
+import tempfile
+import logging
+import contextlib
+from pathlib import Path
+
+import click
+import toolz.curried as _
+
+from larc.common import help_text
+from larc.logging import setup_logging
+from larc.rest import total_cache_reset
+
+from .. import canvas
+from .. import cli
+from .. import hash_cache
+from ..canvas import asset_index, fake
+from . import assignment, module, page, quiz, slide
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+# In the order they are run: slides writes pages, and modules refer
+# to the pages, assignments and quizzes
+COMMANDS = {
+    'slides': slide.sync_slides,
+    'pages': page.sync_pages,
+    'assignments': assignment.sync_assignments,
+    'quizzes': quiz.sync_quizzes,
+    'modules': module.sync_modules,
+}
+
+@contextlib.contextmanager
+def environment(**env):
+    old = {k: os.environ.get(k) for k in env}
+    os.environ.update(env)
+    try:
+        yield
+    finally:
+        for k, v in old.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+def run_command(fake_canvas: fake.FakeCanvas, name: str, course_dir: Path,
+                loglevel: str):
+    '''Run one coursework-sync-* command in-process, returning its wall
+    time and request counts
+    '''
+    session = canvas.api.get_session()
+    # Start from what is on (fake) Canvas, as a new process would
+    total_cache_reset()
+    canvas.metadata.reset()
+    canvas.user.reset_self_cache()
+    asset_index.reset()
+    hash_cache.reset()
+    session.metrics.reset()
+    fake_canvas.reset_counts()
+
+    start = time.perf_counter()
+    COMMANDS[name].main(
+        [str(course_dir), '--loglevel', loglevel], standalone_mode=False,
+    )
+    wall = time.perf_counter() - start
+
+    return {
+        'command': name,
+        'wall': round(wall, 4),
+        'requests': fake_canvas.total_requests,
+        'endpoints': _.pipe(
+            fake_canvas.requests.most_common(),
+            _.map(lambda kv: (f'{kv[0][0]} {kv[0][1]}', kv[1])),
+            dict,
+        ),
+    }
+
+def bench_size(size: int, commands: list, *, latency: float,
+               rate_limit: bool, loglevel: str):
+    fake_canvas = fake.FakeCanvas(latency=latency, rate_limit=rate_limit)
+    course = fake_canvas.add_course(
+        f'BENCH {size:04d} Benchmark Course 01', students=size,
+    )
+    results = []
+    with tempfile.TemporaryDirectory() as tmp, \
+            fake.serving(canvas.api.get_session(), fake_canvas), \
+            environment(COURSEWORK_BASE_URL=fake_canvas.base_url,
+                        COURSEWORK_TOKEN='bench-token',
+                        # Not the user's own cache of their files' hashes
+                        COURSEWORK_HASH_CACHE=str(
+                            Path(tmp, 'hash-cache.sqlite')
+                        )):
+        course_dir = fake.write_course_dir(
+            Path(tmp, 'course'), course, pages=size, assignments=size,
+            quizzes=max(1, size // 2), questions=5,
+            slides=max(1, size // 10) if 'slides' in commands else 0,
+            images=max(1, size // 10),
+        )
+        for sync in ['initial', 'no-op']:
+            for name in commands:
+                result = run_command(fake_canvas, name, course_dir, loglevel)
+                results.append(_.merge(result, {'size': size, 'sync': sync}))
+                log.info(
+                    f'[bench] size {size:>4} {sync:<7} {name:<11}'
+                    f' {result["wall"]:>8.3f}s {result["requests"]:>6}'
+                    ' requests'
+                )
+    hash_cache.reset()
+    return results
+
+def results_table(results: list):
+    header = (
+        f'{"size":>5} {"sync":<7} {"command":<11} {"wall (s)":>9}'
+        f' {"requests":>8}'
+    )
+    lines = [header, '-' * len(header)]
+    for r in results:
+        lines.append(
+            f'{r["size"]:>5} {r["sync"]:<7} {r["command"]:<11}'
+            f' {r["wall"]:>9.3f} {r["requests"]:>8}'
+        )
+    return '\n'.join(lines)
+
+@click.command()
+@click.option(
+    '--sizes', default='5,20,50', help=help_text('''
+
+    Comma-separated course sizes (number of pages and assignments; half
+    as many quizzes) to benchmark
+
+    ''')
+)
+@click.option(
+    '--commands', default=','.join(COMMANDS), help=help_text(f'''
+
+    Comma-separated sync commands to run, from: {", ".join(COMMANDS)}
+
+    ''')
+)
+@click.option(
+    '--latency', type=float, default=0.0, help=help_text('''
+
+    Seconds the fake Canvas waits before answering each request
+
+    ''')
+)
+@click.option(
+    '--no-rate-limit', is_flag=True, help=help_text('''
+
+    Don't simulate Canvas' rate limiting
+
+    ''')
+)
+@click.option(
+    '--results-json', type=click.Path(dir_okay=False), help=help_text('''
+
+    Path at which to write the results (including per-endpoint request
+    counts) as JSON
+
+    ''')
+)
+@click.option(
+    '--loglevel', default='warning',
+)
+def bench(sizes, commands, latency, no_rate_limit, results_json, loglevel):
+    '''Benchmark the coursework-sync-* commands against an in-process fake
+    Canvas, on synthetic courses of growing size. Each command is run
+    twice per size: an initial sync that creates everything and a
+    no-op sync with nothing changed.
+
+    '''
+    setup_logging(loglevel)
+
+    commands = [c.strip() for c in commands.split(',') if c.strip()]
+    unknown = set(commands) - set(COMMANDS)
+    if unknown:
+        cli.common.exit_with_msg(
+            log, f'Unknown commands: {", ".join(sorted(unknown))}'
+        )
+    commands = [c for c in COMMANDS if c in commands]
+
+    results = _.pipe(
+        sizes.split(','),
+        _.map(int),
+        _.mapcat(lambda size: bench_size(
+            size, commands, latency=latency,
+            rate_limit=not no_rate_limit, loglevel=loglevel,
+        )),
+        tuple,
+    )
+
+    click.echo(results_table(results))
+    if results_json:
+        Path(results_json).write_text(json.dumps(results, indent=2))
+        log.info(f'Wrote benchmark results to {results_json}')
@@ -1,4 +1,5 @@
 import logging
+import functools
 
 import click
 
@@ -97,6 +98,93 @@ config_options = compose(
     )
 )
 
+def reporting_metrics(command):
+    '''Report the request metrics (see report_metrics) when the command
+    ends, whether it finishes, exits with a message or fails
+    '''
+    @functools.wraps(command)
+    def wrapper(*args, **kwargs):
+        try:
+            return command(*args, **kwargs)
+        finally:
+            report_metrics(kwargs.get('metrics_json'))
+    return wrapper
+
+metrics_options = compose(
+    click.option(
+        '--metrics-json', type=click.Path(dir_okay=False),
+        help=help_text('''
+
+        Path at which to write per-endpoint request metrics (counts,
+        latencies, bytes and retries) as JSON. A summary table is always
+        printed to stderr at the end of the command.
+
+        '''),
+    ),
+    reporting_metrics,
+)
+
+cassette_options = compose(
+    click.option(
+        '--record-cassette', type=click.Path(dir_okay=False),
+        help=help_text('''
+
+        Record every HTTP request and response made by this command to a
+        cassette (JSON) at this path, for later offline replay
+
+        '''),
+    ),
+    click.option(
+        '--replay-cassette', type=click.Path(exists=True, dir_okay=False),
+        help=help_text('''
+
+        Answer every HTTP request from a previously recorded cassette
+        instead of Canvas
+
+        '''),
+    ),
+    click.option(
+        '--replay-timing', type=click.Choice(['none', 'original']),
+        default='none', help=help_text('''
+
+        When replaying, answer instantly ("none") or with each response's
+        recorded latency ("original")
+
+        '''),
+    ),
+)
+
+def setup_cassette(record_cassette: str = None, replay_cassette: str = None,
+                   replay_timing: str = 'none'):
+    '''Start recording or replaying the shared Session's traffic for the
+    rest of the process
+    '''
+    import atexit
+    from ..canvas.api import get_session
+    from ..canvas import cassette
+
+    if record_cassette and replay_cassette:
+        _exit_with_msg('Cannot both record and replay a cassette')
+    if record_cassette:
+        context = cassette.recording(get_session(), record_cassette)
+    elif replay_cassette:
+        context = cassette.replaying(
+            get_session(), replay_cassette, timing=replay_timing,
+        )
+    else:
+        return None
+    adapter = context.__enter__()
+    atexit.register(context.__exit__, None, None, None)
+    return adapter
+
+def report_metrics(metrics_json: str = None):
+    from ..canvas.api import get_session
+    metrics = get_session().metrics
+    click.echo(f'Request metrics:\n{metrics.table()}', err=True)
+    if metrics_json:
+        metrics.write_json(metrics_json)
+        log.info(f'Wrote request metrics to {metrics_json}')
+
 def get_config_maybe_die(config_path):
     if config_path is not None:
         valid, reasons = config.validate_config_path(config_path)
@@ -0,0 +1,76 @@
+from pathlib import Path
+import logging
+
+import click
+
+from larc.common import help_text
+from larc.logging import setup_logging
+
+from .. import canvas
+from .. import cli
+from ..canvas import file_mirror
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+exit_with_msg = cli.common.exit_with_msg(log)
+
+@click.command()
+@click.argument(
+    'course-dir', type=click.Path(exists=True), required=True,
+)
+@click.argument(
+    'dest-dir', type=click.Path(file_okay=False), required=True,
+)
+@click.option(
+    '--max-workers', type=int, default=file_mirror.DOWNLOAD_WORKERS,
+    help=help_text('''
+
+    Number of files to download at once
+
+    ''')
+)
+@click.option(
+    '--dry-run', is_flag=True, help=help_text('''
+
+    Only report what would be downloaded
+
+    ''')
+)
+@cli.common.metrics_options
+@click.option(
+    '--loglevel', default='info',
+)
+def mirror_files(course_dir, dest_dir, max_workers, dry_run, metrics_json,
+                 loglevel):
+    '''Download the files of the course(s) for COURSE_DIR into DEST_DIR,
+    mirroring their folders and skipping files whose local copy is
+    already up to date
+
+    '''
+    setup_logging(loglevel)
+
+    api = canvas.api.get_api_from_config()
+    courses = canvas.course.courses_from_path(api, course_dir)
+    if not courses:
+        exit_with_msg('Could not find course information.')
+
+    failed = 0
+    for course in courses:
+        dest = Path(dest_dir)
+        if len(courses) > 1:
+            dest = Path(dest, file_mirror.safe_name(course.data['name']))
+        result = file_mirror.mirror_course_files(
+            course, dest, max_workers=max_workers, dry_run=dry_run,
+        )
+        click.echo(
+            f'{course.data["name"]}:'
+            f' {len(result.downloaded)} files'
+            f' {"to download" if dry_run else "downloaded"}'
+            f' ({result.bytes:,} bytes), {len(result.skipped)} up to date'
+            + (f', {len(result.failed)} failed' if result.failed else '')
+        )
+        failed += len(result.failed)
+
+    if failed:
+        exit_with_msg(f'{failed} files could not be downloaded')
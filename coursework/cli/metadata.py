@@ -0,0 +1,97 @@
+import json
+import logging
+from pathlib import Path
+
+import click
+import toolz.curried as _
+
+from larc.common import help_text
+from larc.logging import setup_logging
+
+from .. import canvas
+from .. import cli
+from ..canvas import metadata_gc
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+def orphans_report(orphans: metadata_gc.Orphans):
+    lines = _.pipe(
+        orphans.keys,
+        _.groupby(lambda o: (o.course_id, o.reason)),
+        lambda groups: [
+            f'- course {course_id}: {len(os)} keys ({reason},'
+            f' {sum(o.bytes for o in os):,} bytes)'
+            for (course_id, reason), os in sorted(groups.items())
+        ],
+    )
+    if orphans.file_hashes:
+        lines.append(
+            f'- file hashes: {len(orphans.file_hashes)} entries'
+            f' ({sum(orphans.file_hashes.values()):,} bytes)'
+        )
+    if orphans.chunk_keys:
+        lines.append(
+            f'- stale chunks: {len(orphans.chunk_keys)} keys'
+            f' ({sum(orphans.chunk_keys.values()):,} bytes)'
+        )
+    return '\n'.join(
+        [f'Orphaned metadata: {orphans.bytes:,} bytes'] + (lines or ['- none'])
+    )
+
+@click.command()
+@click.option(
+    '--dry-run', is_flag=True, help=help_text('''
+
+    Only report what would be pruned (and how many bytes it would
+    reclaim)
+
+    ''')
+)
+@click.option(
+    '--skip-file-hashes', is_flag=True, help=help_text('''
+
+    Don't list every course's files to prune the hashes of deleted
+    files
+
+    ''')
+)
+@click.option(
+    '--report-json', type=click.Path(dir_okay=False), help=help_text('''
+
+    Path at which to write the orphaned keys and file hash entries as
+    JSON
+
+    ''')
+)
+@cli.common.metrics_options
+@click.option(
+    '--loglevel', default='info',
+)
+def gc_metadata(dry_run, skip_file_hashes, report_json, metrics_json,
+                loglevel):
+    '''Prune coursework metadata (in your Canvas user custom_data) of
+    pages, quizzes, assignments, assignment groups, courses and files
+    that no longer exist
+
+    '''
+    setup_logging(loglevel)
+
+    api = canvas.api.get_api_from_config()
+    orphans = metadata_gc.find_orphans(
+        api, file_hashes=not skip_file_hashes,
+    )
+    click.echo(orphans_report(orphans))
+
+    if report_json:
+        Path(report_json).write_text(json.dumps({
+            'bytes': orphans.bytes,
+            'keys': [o._asdict() for o in orphans.keys],
+            'file_hashes': orphans.file_hashes,
+            'chunk_keys': orphans.chunk_keys,
+        }, indent=2))
+
+    if not dry_run and orphans.bytes:
+        if not metadata_gc.prune(api, orphans):
+            cli.common.exit_with_msg(log, 'Could not prune every key')
+        log.info(f'Reclaimed {orphans.bytes:,} bytes')
@@ -31,10 +31,13 @@ exit_with_msg = cli.common.exit_with_msg(log)
     
     ''')
 )
+@cli.common.metrics_options
+@cli.common.cassette_options
 @click.option(
     '--loglevel', default='info',
 )
-def sync_modules(course_dir, dry_run, loglevel):
+def sync_modules(course_dir, dry_run, metrics_json, record_cassette,
+                 replay_cassette, replay_timing, loglevel):
     '''Sync course modules from a modules.yml file.
 
     COURSE_DIR: Path of course directory. Will search given directory
@@ -43,6 +46,9 @@ def sync_modules(course_dir, dry_run, loglevel):
 
     '''
     setup_logging(loglevel)
+    cli.common.setup_cassette(
+        record_cassette, replay_cassette, replay_timing,
+    )
 
     api = canvas.api.get_api_from_config()
     courses = canvas.course.courses_from_path(api, course_dir)
@@ -83,6 +89,8 @@ def sync_modules(course_dir, dry_run, loglevel):
         tuple,
     )
 
+    canvas.metadata.flush_all()
+
     # page_md_paths = _.pipe(
     #     pages_path.glob('page-*.md'),
     #     sorted,
@@ -24,13 +24,19 @@ exit_with_msg = cli.common.exit_with_msg(log)
 @click.argument(
     'course-dir', type=click.Path(exists=True), required=True,
 )
+@cli.common.metrics_options
+@cli.common.cassette_options
 @click.option(
     '--loglevel', default='info',
 )
-def sync_quizzes(course_dir, loglevel):
+def sync_quizzes(course_dir, metrics_json, record_cassette, replay_cassette,
+                 replay_timing, loglevel):
     '''
     '''
     setup_logging(loglevel)
+    cli.common.setup_cassette(
+        record_cassette, replay_cassette, replay_timing,
+    )
 
     api = canvas.api.get_api_from_config()
     courses = canvas.course.courses_from_path(api, course_dir)
@@ -77,3 +83,5 @@ def sync_quizzes(course_dir, loglevel):
         ), max_workers=10),
         tuple,
     )
+
+    canvas.metadata.flush_all()
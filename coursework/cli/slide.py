@@ -14,6 +14,7 @@ from .. import common
 from .. import canvas
 from .. import templates
 from .. import cli
+from ..canvas import asset_index
 
 log = logging.getLogger(__name__)
 log.addHandler(logging.NullHandler())
@@ -60,10 +61,13 @@ def render_slide_html(slide_path, slide_type,
 @click.argument(
     'course-dir', type=click.Path(exists=True), required=True,
 )
+@cli.common.metrics_options
+@cli.common.cassette_options
 @click.option(
     '--loglevel', default='info',
 )
-def sync_slides(course_dir, loglevel):
+def sync_slides(course_dir, metrics_json, record_cassette, replay_cassette,
+                replay_timing, loglevel):
     '''Sync course slides from directory containing slide markdown files
 
     COURSE-DIR: Path of section-specific course directory
@@ -72,6 +76,9 @@ def sync_slides(course_dir, loglevel):
 
     '''
     setup_logging(loglevel)
+    cli.common.setup_cassette(
+        record_cassette, replay_cassette, replay_timing,
+    )
 
     api = canvas.api.get_api_from_config()
     courses = canvas.course.courses_from_path(api, course_dir)
@@ -134,7 +141,7 @@ def sync_slides(course_dir, loglevel):
             log.info(
                 f'Uploading {html_path} to course {course.data["name"]}:'
             )
-            file_ep = canvas.file.upload_course_file(course, html_path)
+            file_ep = asset_index.asset_file(course, html_path)
             log.info(
                 f'  ...done {html_path} -> {course.data["name"]}'
             )
@@ -161,4 +168,5 @@ def sync_slides(course_dir, loglevel):
         )
         log.info(f'Writing page for {md_path}  -->  {page_path}')
         page_path.write_text(page_content)
-    
+
+    canvas.metadata.flush_all()
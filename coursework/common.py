@@ -1,5 +1,4 @@
 import re
-import hashlib
 from pathlib import Path
 import pprint
 from typing import Union
@@ -13,6 +12,8 @@ from larc import yaml
 from larc.rest import Api, Endpoint
 from larc import common
 
+from . import hash_cache, hashing
+
 log = logging.getLogger(__name__)
 log.addHandler(logging.NullHandler())
 
@@ -49,26 +50,41 @@ def find_content_paths(path: (str, Path)):
         f'Could not find any content paths for {path}'
     )
 
-def hash_from_content(content: Union[bytes, str]):
+def hash_from_content(content: Union[bytes, str], algorithm: str = None):
+    '''Digest of the content (see hashing)
+    '''
     return _.pipe(
         content if type(content) is bytes else content.encode(
             'utf-8', errors='ignore'
         ),
-        hashlib.md5,
-        lambda h: h.hexdigest(),
+        lambda b: hashing.digest(b, algorithm),
     )
 
-def hash_from_dict(content: dict):
+def hash_from_dict(content: dict, algorithm: str = None):
     return _.pipe(
         content,
         common.json_dumps(sort_keys=True, default=str),
         common.call('encode', 'utf-8'),
-        hashlib.md5,
-        common.call('hexdigest'),
+        lambda b: hashing.digest(b, algorithm),
     )
 
-def hash_from_path(path: Union[str, Path]):
-    return hash_from_content(Path(path).read_bytes())
+def hash_from_path(path: Union[str, Path], algorithm: str = None):
+    '''Digest of the file's content, cached by the file's stat (see
+    hash_cache)
+    '''
+    algorithm = algorithm or hashing.algorithm()
+    return hashing.prefixed(hash_cache.file_hash(path, algorithm), algorithm)
+
+def text_hash_from_path(path: Union[str, Path], algorithm: str = None):
+    '''Digest of the text file's content with its line endings read as
+    Path.read_text reads them, so that it matches
+    hash_from_content(path.read_text()), the hash page and assignment
+    syncs store
+    '''
+    algorithm = algorithm or hashing.algorithm()
+    return hashing.prefixed(
+        hash_cache.file_hash(path, algorithm, text=True), algorithm,
+    )
 
 def hashed_path(path: Union[str, Path]):
     '''Given a path, return its "hashed" version
@@ -78,9 +94,12 @@ def hashed_path(path: Union[str, Path]):
     >>> hashed_path('/a/b/c.txt')
     Path('/a/b/c-<MD5-hash-of-c.txt>.txt')
 
+    With another hash algorithm configured, the hash is preceded by the
+    algorithm's name (c-blake2b-<hash>.txt).
+
     '''
     path = Path(path).expanduser().resolve()
-    path_hash = hash_from_path(path)
+    path_hash = hash_from_path(path).replace(':', '-')
     return Path(
         path.parent,
         f'{path.stem}-{path_hash}{path.suffix}',
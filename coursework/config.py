@@ -5,7 +5,6 @@ from pathlib import Path
 from typing import Union
 import logging
 
-import requests
 from toolz.curried import (
     pipe, map,
 )
@@ -67,14 +66,15 @@ def validate_config(config: dict):
     if 'base_url' in config:
         bad_url = False
         try:
-            requests.get(config['base_url'])
+            from .canvas.api import get_session
+            get_session().get(config['base_url'])
         except Exception as error:
             bad_url = True
             reasons.append(
                 f'Problem accessing "base_url":\n{error}'
             )
         if 'api_token' in config and not bad_url:
-            from .api import get_api
+            from .canvas.api import get_api
             api = get_api(config['base_url'], config['api_token'])
             try:
                 resp = api('users', 'self').get()
@@ -202,6 +202,128 @@ def get_token(path: str = None):
         ' config.yml file.'
     )
 
+def get_pool_size(path: str = None):
+    config = get_config(path)
+    if 'COURSEWORK_POOL_SIZE' in os.environ:
+        return int(os.environ['COURSEWORK_POOL_SIZE'])
+    elif config and 'pool_size' in config:
+        return int(config['pool_size'])
+
+def get_upload_concurrency(path: str = None):
+    '''(notify, transfer): how many upload API requests and how many
+    transfers to the storage host may run at once (see
+    canvas.file.upload_slots)
+    '''
+    config = get_config(path)
+    if 'COURSEWORK_UPLOAD_CONCURRENCY' in os.environ:
+        notify, transfer = os.environ[
+            'COURSEWORK_UPLOAD_CONCURRENCY'
+        ].split(',')
+        return int(notify), int(transfer)
+    elif config and 'upload_concurrency' in config:
+        return (
+            int(config['upload_concurrency']['notify']),
+            int(config['upload_concurrency']['transfer']),
+        )
+
+def get_retry_post(path: str = None):
+    config = get_config(path)
+    if 'COURSEWORK_RETRY_POST' in os.environ:
+        return os.environ['COURSEWORK_RETRY_POST'].lower() in {
+            '1', 'true', 'yes',
+        }
+    elif config and 'retry_post' in config:
+        return bool(config['retry_post'])
+
+def get_content_fingerprints(path: str = None):
+    config = get_config(path)
+    if 'COURSEWORK_CONTENT_FINGERPRINTS' in os.environ:
+        return os.environ['COURSEWORK_CONTENT_FINGERPRINTS'].lower() in {
+            '1', 'true', 'yes',
+        }
+    elif config and 'content_fingerprints' in config:
+        return bool(config['content_fingerprints'])
+
+def get_hash_algorithm(path: str = None):
+    '''Algorithm for content hashes: md5 (the default), blake2b or xxh3
+    (see hashing)
+    '''
+    config = get_config(path)
+    if os.environ.get('COURSEWORK_HASH_ALGORITHM'):
+        return os.environ['COURSEWORK_HASH_ALGORITHM'].lower()
+    elif config and config.get('hash_algorithm'):
+        return str(config['hash_algorithm']).lower()
+    return 'md5'
+
+def get_hash_cache(path: str = None):
+    '''Path of the persistent cache of local file hashes ('' for the
+    default location), or None if the cache is disabled. The cache is
+    on unless turned off.
+
+    '''
+    config = get_config(path)
+    if 'COURSEWORK_HASH_CACHE' in os.environ:
+        value = os.environ['COURSEWORK_HASH_CACHE']
+        if value.lower() in {'0', 'false', 'no'}:
+            return None
+        if value.lower() in {'', '1', 'true', 'yes'}:
+            return ''
+        return value
+    elif config and 'hash_cache' in config:
+        cache = config['hash_cache']
+        if cache is False:
+            return None
+        return '' if cache in (True, None) else str(cache)
+    return ''
+
+def get_http_cache(path: str = None):
+    '''Keyword arguments for the on-disk HTTP cache, or None if the
+    cache is disabled
+
+    '''
+    config = get_config(path)
+    if 'COURSEWORK_HTTP_CACHE' in os.environ:
+        value = os.environ['COURSEWORK_HTTP_CACHE']
+        if value.lower() in {'', '0', 'false', 'no'}:
+            return None
+        if value.lower() in {'1', 'true', 'yes'}:
+            return {}
+        return {'path': value}
+    elif config and config.get('http_cache'):
+        cache = config['http_cache']
+        if not isinstance(cache, dict):
+            return {}
+        return {
+            k: v for k, v in {
+                'path': cache.get('path'),
+                'max_bytes': (
+                    int(cache['max_mb']) * 2**20
+                    if 'max_mb' in cache else None
+                ),
+                'ttls': (
+                    tuple(cache['ttls'].items())
+                    if 'ttls' in cache else None
+                ),
+            }.items() if v is not None
+        }
+
+def get_metadata_mirror(path: str = None):
+    '''Path of the local SQLite mirror of sync metadata ('' for the
+    default location), or None if the mirror is disabled
+
+    '''
+    config = get_config(path)
+    if 'COURSEWORK_METADATA_MIRROR' in os.environ:
+        value = os.environ['COURSEWORK_METADATA_MIRROR']
+        if value.lower() in {'', '0', 'false', 'no'}:
+            return None
+        if value.lower() in {'1', 'true', 'yes'}:
+            return ''
+        return value
+    elif config and config.get('metadata_mirror'):
+        mirror = config['metadata_mirror']
+        return '' if mirror is True else str(mirror)
+
 CONFIG_TEMPLATE = r'''\
 #----------------------------------------------------------------------
 # Canvas API configuration file
@@ -227,6 +349,69 @@ root_dir: >-
 base_url: >-
   https://<yourinstitution>.instructure.com/api/v1/
 
+# Optional: maximum number of pooled connections kept open per host
+# (Canvas API, file upload and file download hosts). Defaults to 50,
+# which covers the concurrency of the coursework-sync-* commands.
+#
+# pool_size: 50
+
+# Optional: how many file uploads may be announced to the Canvas API
+# (notify) and how many may be sending their content to the storage
+# host (transfer) at once. Defaults to 4 and 8.
+#
+# upload_concurrency:
+#   notify: 4
+#   transfer: 8
+
+# Optional: GET, PUT and DELETE requests that fail transiently (dropped
+# connections, 429 or 5xx responses) are retried with backoff. Set
+# this to true to retry POSTs as well, at the risk of creating
+# duplicate objects if Canvas received the first attempt.
+#
+# retry_post: false
+
+# Optional: embed the hash of each page's and assignment's source file
+# in a hidden element of its Canvas body, so that syncs can tell what
+# changed from one listing of the course's pages or assignments
+# instead of checking each one (and its metadata) separately.
+#
+# content_fingerprints: false
+
+# Optional: algorithm for the content hashes that detect changes: md5,
+# blake2b or xxh3 (requires the xxhash package). Hashes stored with
+# another algorithm are still recognized, and replaced the next time
+# their object is written.
+#
+# hash_algorithm: md5
+
+# Optional: local file hashes are cached (by default under
+# ~/.cache/coursework) by path, size, modification time and inode, so
+# unchanged files are not re-read. Either false or the path of the
+# cache.
+#
+# hash_cache: true
+
+# Optional: keep a persistent cache of Canvas responses under
+# ~/.cache/coursework and revalidate it with conditional requests, so
+# unchanged listings come back as cheap 304s. Either "true" or a
+# mapping with any of: path, max_mb (default 256) and ttls (regex on
+# the URL path -> seconds a response is trusted without revalidating;
+# these replace the defaults).
+#
+# http_cache:
+#   max_mb: 256
+#   ttls:
+#     /users/self$: 3600
+#     /courses$: 300
+
+# Optional: keep a local SQLite mirror (by default under
+# ~/.cache/coursework) of the sync metadata stored in your Canvas user
+# data, so that unchanged content can be checked without downloading
+# it. The mirror is checked against a version stamp on Canvas at the
+# start of each sync. Either "true" or the path of the mirror.
+#
+# metadata_mirror: true
+
 
 # Regexes are how we pull out the institution-specific metadata for a
 # course. Each one is specified as a YAML dictionary. The regular
@@ -0,0 +1,219 @@
+'''Persistent cache of local file content hashes
+
+A file's hash is stored (in SQLite, by default under ~/.cache/coursework)
+along with the path, size, mtime_ns and inode it was computed for, so
+an unchanged file costs a stat() rather than a read. A small in-process
+LRU in front of SQLite makes repeated lookups within a run free, and
+the SQLite table is kept under a size bound by evicting the least
+recently used entries.
+
+Files that do need hashing are streamed through the hasher (large ones
+through mmap) rather than read whole.
+
+>>> file_hash('images/diagram.png')
+'0cc175b9c0f1b6a831c399e269772661'
+
+'''
+import os
+import mmap
+import time
+import sqlite3
+import logging
+import threading
+import collections
+from pathlib import Path
+from typing import Union, Iterable
+
+from .hashing import new_hasher
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+def default_cache_path():
+    return Path('~/.cache/coursework/hash-cache.sqlite').expanduser()
+
+DEFAULT_MAX_ENTRIES = 100_000
+MEMORY_ENTRIES = 4096
+
+# Files at least this large are hashed through mmap
+MMAP_THRESHOLD = 2**20
+CHUNK_SIZE = 2**20
+
+SCHEMA = '''
+create table if not exists hashes (
+    path text not null,
+    algorithm text not null,
+    size integer not null,
+    mtime_ns integer not null,
+    inode integer not null,
+    digest text not null,
+    accessed_at real not null,
+    primary key (path, algorithm)
+);
+create index if not exists hashes_accessed on hashes (accessed_at);
+'''
+
+def stat_key(st: os.stat_result):
+    return (st.st_size, st.st_mtime_ns, st.st_ino)
+
+def universal_newlines(chunks: Iterable[bytes]):
+    '''The chunks with CRLF and CR line endings translated to LF, as
+    reading in text mode does
+    '''
+    carry = b''
+    for chunk in chunks:
+        chunk, carry = carry + chunk, b''
+        if chunk.endswith(b'\r'):
+            # Might be the first half of a CRLF
+            chunk, carry = chunk[:-1], b'\r'
+        yield chunk.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+    if carry:
+        yield b'\n'
+
+def stream_digest(path: Path, algorithm: str = 'md5', *,
+                  chunk_size: int = CHUNK_SIZE, text: bool = False):
+    '''Hex digest of the file's content, read chunk by chunk (with its
+    line endings translated, if text)
+    '''
+    hasher = new_hasher(algorithm)
+    with path.open('rb') as rfp:
+        size = os.fstat(rfp.fileno()).st_size
+        if size >= MMAP_THRESHOLD:
+            mm = mmap.mmap(rfp.fileno(), 0, access=mmap.ACCESS_READ)
+            chunks = (
+                mm[start:start + chunk_size]
+                for start in range(0, size, chunk_size)
+            )
+        else:
+            mm = None
+            chunks = iter(lambda: rfp.read(chunk_size), b'')
+        try:
+            for chunk in universal_newlines(chunks) if text else chunks:
+                hasher.update(chunk)
+        finally:
+            if mm is not None:
+                mm.close()
+    return hasher.hexdigest()
+
+class HashCache:
+    def __init__(self, path=None, *, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = Path(path).expanduser() if path else default_cache_path()
+        self.path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self._lock, self._db:
+            self._db.executescript(SCHEMA)
+
+    def get(self, path: str, algorithm: str, st: os.stat_result):
+        '''The cached digest, if the file is as it was when hashed
+        '''
+        with self._lock:
+            row = self._db.execute(
+                'select size, mtime_ns, inode, digest from hashes'
+                ' where path = ? and algorithm = ?',
+                (path, algorithm),
+            ).fetchone()
+            if row is None or tuple(row[:3]) != stat_key(st):
+                return None
+            with self._db:
+                self._db.execute(
+                    'update hashes set accessed_at = ?'
+                    ' where path = ? and algorithm = ?',
+                    (time.time(), path, algorithm),
+                )
+        return row[3]
+
+    def put(self, path: str, algorithm: str, st: os.stat_result,
+            digest: str):
+        with self._lock, self._db:
+            self._db.execute(
+                'insert or replace into hashes values (?, ?, ?, ?, ?, ?, ?)',
+                (path, algorithm, *stat_key(st), digest, time.time()),
+            )
+            self._evict()
+
+    def _evict(self):
+        count = self._db.execute('select count(*) from hashes').fetchone()[0]
+        if count > self.max_entries:
+            self._db.execute(
+                'delete from hashes where rowid in (select rowid from hashes'
+                ' order by accessed_at limit ?)',
+                (count - self.max_entries,),
+            )
+
+    def clear(self):
+        with self._lock, self._db:
+            self._db.execute('delete from hashes')
+
+# In-process LRU: (path, algorithm) -> (stat key, digest)
+_memory = collections.OrderedDict()
+_memory_lock = threading.Lock()
+
+_cache = None
+_cache_lock = threading.Lock()
+def get_cache():
+    '''The process-wide persistent cache, or None if it is disabled
+    '''
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            from .config import get_hash_cache
+            path = get_hash_cache()
+            _cache = False if path is None else HashCache(path or None)
+        return _cache or None
+
+def reset():
+    global _cache
+    with _memory_lock:
+        _memory.clear()
+    with _cache_lock:
+        _cache = None
+
+def _remember_in_memory(key, st: os.stat_result, digest: str):
+    with _memory_lock:
+        _memory[key] = (stat_key(st), digest)
+        _memory.move_to_end(key)
+        while len(_memory) > MEMORY_ENTRIES:
+            _memory.popitem(last=False)
+
+def file_hash(path: Union[str, Path], algorithm: str = 'md5', *,
+              text: bool = False):
+    '''Hex digest of the file's content, from the cache when the file is
+    unchanged
+
+    If text, CRLF and CR line endings are read as LF (see
+    universal_newlines), which is cached apart from the raw digest.
+
+    '''
+    path = Path(path).expanduser().resolve()
+    st = path.stat()
+    key = (str(path), f'{algorithm}+text' if text else algorithm)
+
+    with _memory_lock:
+        cached = _memory.get(key)
+        if cached and cached[0] == stat_key(st):
+            _memory.move_to_end(key)
+            return cached[1]
+
+    cache = get_cache()
+    digest = cache.get(*key, st) if cache else None
+    if digest is None:
+        digest = stream_digest(path, algorithm, text=text)
+        if cache:
+            cache.put(*key, st, digest)
+
+    _remember_in_memory(key, st, digest)
+    return digest
+
+def remember(path: Union[str, Path], algorithm: str, digest: str):
+    '''Record the digest of a file whose content was just hashed some
+    other way (e.g. as it was downloaded), so it is not read again
+    '''
+    path = Path(path).expanduser().resolve()
+    st = path.stat()
+    cache = get_cache()
+    if cache:
+        cache.put(str(path), algorithm, st, digest)
+    _remember_in_memory((str(path), algorithm), st, digest)
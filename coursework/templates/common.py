@@ -10,22 +10,22 @@ import jinja2
 from pkg_resources import resource_filename as _resource_filename
 import toolz.curried as _
 from toolz.curried import (
-    compose, curry, pipe, filter, mapcat, do, map, first,
+    compose, curry, pipe, filter, mapcat, do, map,
 )
 
 from larc import yaml
 from larc.common import (
     maybe_first, is_int, is_seq, call, vmap, to_pyrsistent,
-    deref, get,
 )
 from larc.rest import (
     Endpoint,
 )
 
 from ..common import (
-    markdown, maybe_markdown_from_path, hashed_path, resolve_path,
+    markdown, maybe_markdown_from_path, resolve_path, hash_from_path,
 )
 from .. import canvas
+from ..canvas import asset_index
 from ..canvas.course import Course
 
 log = logging.getLogger(__name__)
@@ -73,11 +73,7 @@ def slide_link(course: Course, course_root: str,
 def image_hash(course_root: str, path: str):
     path = resolve_path(course_root, path)
     if path.exists():
-        return pipe(
-            path.read_bytes(),
-            hashlib.md5,
-            call('hexdigest'),
-        )
+        return hash_from_path(path)
     log.error(
         f'No image at {path}'
     )
@@ -256,42 +252,21 @@ def to_yaml(obj):
 
 def file_url(course: Course, func_name: str,
              path: Path, force_upload: bool, dry_run: bool):
-    matching_files = canvas.file.course_files_matching_path(
-        course, hashed_path(path)
-    )
-
     if dry_run:
         log.info(
             f'[{func_name}] DRY RUN{" -FORCE-" if force_upload else ""}'
             f' uploading file: {path}'
         )
-        url = 'PLACEHOLDER_URL'
-    else:
-        if not matching_files or force_upload:
-            log.info(
-                f'[{func_name}]{" -FORCE-" if force_upload else ""}'
-                f' uploading file: {path}'
-            )
-            canvas.file.upload_course_file(course, path, hashed=True)
-            file_ep = canvas.file.upload_course_file(course, path)
-            if file_ep:
-                canvas.file.files.reset_cache(course)
-                url = file_ep.data['url']
-            else:
-                log.error(
-                    f'[{func_name}]{" -FORCE-" if force_upload else ""}'
-                    f' uploading file... Could not get URL for uploaded'
-                    f' file: {path}'
-                )
-                url = 'BAD_URL_FAILED_UPLOAD'
-        else:
-            url = pipe(
-                canvas.file.course_files_matching_path(course, path),
-                first,
-                deref('data'),
-                get('url'),
-            )
-
+        return 'PLACEHOLDER_URL'
+
+    url = asset_index.asset_url(course, path, force_upload=force_upload)
+    if not url:
+        log.error(
+            f'[{func_name}]{" -FORCE-" if force_upload else ""}'
+            f' uploading file... Could not get URL for uploaded'
+            f' file: {path}'
+        )
+        return 'BAD_URL_FAILED_UPLOAD'
     return url
 
 @curry
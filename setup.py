@@ -31,6 +31,12 @@ setup(
         'pyrsistent',
     ],
 
+    extras_require={
+        'async': ['aiohttp'],
+        'zstd': ['zstandard'],
+        'xxhash': ['xxhash'],
+    },
+
     version=version(),
     description=('Python API for course materials using Canvas LMS'),
     long_description=long_description,
@@ -65,6 +71,9 @@ setup(
             'coursework-sync-pages=coursework.cli.page:sync_pages',
             'coursework-sync-quizzes=coursework.cli.quiz:sync_quizzes',
             'coursework-sync-assignments=coursework.cli.assignment:sync_assignments',
+            'coursework-bench=coursework.cli.bench:bench',
+            'coursework-gc-metadata=coursework.cli.metadata:gc_metadata',
+            'coursework-mirror-files=coursework.cli.file:mirror_files',
         ],
     },
 )
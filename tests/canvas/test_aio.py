@@ -0,0 +1,144 @@
+import time
+import asyncio
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from larc.rest import total_cache_reset
+
+from coursework import canvas
+from coursework.canvas import aio
+from coursework.canvas.api import RATE_LIMITED_ATTEMPTS
+from coursework.canvas.retry import RetryPolicy
+from coursework.canvas.throttle import RateLimiter
+
+RATE_LIMITED = '403 Forbidden (Rate Limit Exceeded)'
+
+def serve(routes, test, **client_kw):
+    '''Run test(course, client) against an aiohttp test server with the
+    given routes, through an AsyncClient that neither throttles nor
+    backs off
+    '''
+    app = web.Application()
+    app.add_routes(routes)
+
+    async def main():
+        async with TestServer(app) as server:
+            api = canvas.api.get_api(str(server.make_url('/api/v1')), 'token')
+            client_kw.setdefault('limiter', RateLimiter(low_water=0))
+            async with aio.AsyncClient(
+                    api, retry=RetryPolicy(backoff=0), **client_kw) as client:
+                return await test(api('courses', 1), client)
+
+    total_cache_reset()
+    try:
+        return asyncio.run(main())
+    finally:
+        total_cache_reset()
+
+def paged(request, pages: int, link):
+    page = int(request.query.get('page', 1))
+    links = [f'<{link(page + 1)}>; rel="next"'] if page < pages else []
+    return web.json_response(
+        [{'url': f'page-{page}'}],
+        headers={'Link': ', '.join(links + [f'<{link(pages)}>; rel="last"'])},
+    )
+
+def test_pages_fetches_numbered_pages():
+    requested = []
+
+    async def handler(request):
+        requested.append(request.query_string)
+        return paged(
+            request, 3, lambda n: request.url.with_query(page=n, per_page=100)
+        )
+
+    async def test(course, client):
+        return await aio.pages(course)
+
+    pages = serve([web.get('/api/v1/courses/1/pages', handler)], test)
+    assert [p.data['url'] for p in pages] == ['page-1', 'page-2', 'page-3']
+    assert requested[0] == 'per_page=100'
+    assert len(requested) == 3
+
+def test_pages_follows_next_links():
+    async def handler(request):
+        page = int(request.query.get('page', 1))
+        next_url = request.url.with_query(page=page + 1)
+        return web.json_response(
+            [{'url': f'page-{page}'}],
+            headers={'Link': f'<{next_url}>; rel="next"'} if page < 3 else {},
+        )
+
+    async def test(course, client):
+        return await aio.pages(course)
+
+    pages = serve([web.get('/api/v1/courses/1/pages', handler)], test)
+    assert [p.data['url'] for p in pages] == ['page-1', 'page-2', 'page-3']
+
+def test_rate_limited_post_is_requeued_after_retry_after():
+    posts = []
+
+    async def post(request):
+        posts.append(time.monotonic())
+        if len(posts) == 1:
+            return web.Response(
+                status=403, text=RATE_LIMITED, headers={'Retry-After': '0.2'},
+            )
+        return web.json_response({'url': 'new-page'})
+
+    async def get(request):
+        return web.json_response({'url': 'new-page', 'title': 'New'})
+
+    async def test(course, client):
+        return await aio.new_page(course, {'title': 'New'})
+
+    page = serve([
+        web.post('/api/v1/courses/1/pages', post),
+        web.get('/api/v1/courses/1/pages/new-page', get),
+    ], test)
+    assert page.data['title'] == 'New'
+    assert len(posts) == 2
+    assert posts[1] - posts[0] >= 0.2
+
+def test_rate_limited_requests_give_up():
+    posts = []
+
+    async def post(request):
+        posts.append(request)
+        return web.Response(status=429)
+
+    async def test(course, client):
+        return await client.post(course('pages').url, json={})
+
+    response = serve([web.post('/api/v1/courses/1/pages', post)], test)
+    assert response.status_code == 429
+    assert len(posts) == RATE_LIMITED_ATTEMPTS
+
+def test_requests_in_flight_are_bounded():
+    in_flight = []
+    peak = []
+
+    async def handler(request):
+        in_flight.append(request)
+        peak.append(len(in_flight))
+        await asyncio.sleep(0.02)
+        in_flight.remove(request)
+        return web.json_response({})
+
+    async def test(course, client):
+        return await aio.amap(
+            lambda i: client.get(course('pages', i).url), range(12)
+        )
+
+    responses = serve(
+        [web.get('/api/v1/courses/1/pages/{page}', handler)], test,
+        max_in_flight=3,
+    )
+    assert [r.status_code for r in responses] == [200] * 12
+    assert max(peak) == 3
+
+def test_get_kw_is_limited_to_data_and_json():
+    aio.new_id_resource('pages', get_kw={'data': {'include[]': ['body']}})
+    with pytest.raises(TypeError):
+        aio.new_id_resource('pages', get_kw={'params': {'a': 1}})
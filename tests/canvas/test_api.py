@@ -0,0 +1,16 @@
+from coursework import canvas
+
+def test_one_session_is_shared():
+    api = canvas.api.get_api('https://canvas.test/api/v1', 'token')
+    other = canvas.api.get_api('https://canvas.test/api/v1', 'other')
+    assert api.session is other.session is canvas.api.get_session()
+
+def test_session_pools_are_sized_for_concurrency():
+    session = canvas.api.new_session(20)
+    adapter = session.get_adapter('https://canvas.test')
+    assert adapter._pool_maxsize == 20
+    assert adapter._pool_block
+    assert session.limiter('https://canvas.test/a').maximum == 20
+    assert session.limiter('https://canvas.test/b') is session.limiter(
+        'https://canvas.test/c'
+    )
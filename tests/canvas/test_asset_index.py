@@ -0,0 +1,86 @@
+import threading
+from pathlib import Path
+
+from coursework import canvas, templates, hashing
+from coursework.canvas import asset_index, fake
+
+from ..helpers import requests_made
+
+def test_image_uploads_are_deduplicated(fake_canvas, fake_course, tmp_path):
+    root = fake.write_course_dir(tmp_path, fake_course.data, pages=1, images=1)
+    copy = Path(root, 'images', 'copy-of-image-001.png')
+    copy.write_bytes(Path(root, 'images', 'image-001.png').read_bytes())
+    content = '\n'.join([
+        "{{ image_link('images/image-001.png') }}",
+        "{{ image_anchor('images/copy-of-image-001.png', 'x') }}",
+        "{{ file_link('images/image-001.png') }}",
+    ])
+    render = templates.common.render_content
+
+    # One upload for the three links to the same content
+    assert requests_made(fake_canvas, render, fake_course, root, content) == {
+        'GET courses/:id/files': 1,
+        'GET courses/:id/folders': 1,
+        'GET users/self': 1,
+        'GET users/self/custom_data': 2,
+        'GET users/self/custom_data/:id': 1,
+        'POST canvas.fake': 1,
+        'POST courses/:id/files': 1,
+        'PUT users/self/custom_data/:id': 2,
+    }
+    # Later renders resolve it from the fake_course's file listing
+    assert requests_made(fake_canvas, render, fake_course, root, content) == {
+        'GET courses/:id/files': 1,
+        'GET users/self': 1,
+        'GET users/self/custom_data': 1,
+    }
+
+def test_shared_assets_are_copied_between_sections(fake_canvas, fake_course,
+                                                  tmp_path):
+    root = fake.write_course_dir(tmp_path, fake_course.data, pages=1, images=1)
+    data = fake_canvas.add_course('CSC 101 Request Counting 02')
+    section = canvas.course.course_by_id(fake_course.api(), data['id'])
+    content = "{{ image_link('images/image-001.png') }}"
+    render = templates.common.render_content
+
+    render(fake_course, root, content)
+    fake_canvas.reset_counts()
+    render(section, root, content)
+    canvas.metadata.flush_all()
+
+    # Canvas copies the file across: no bytes are uploaded
+    copied = {f'{m} {p}': n for (m, p), n in fake_canvas.requests.items()}
+    assert copied == {
+        'GET courses/:id/files': 1,
+        'GET courses/:id/folders': 1,
+        'GET users/self/custom_data': 1,
+        'GET users/self/custom_data/:id': 1,
+        'POST folders/:id/copy_file': 1,
+        'PUT users/self/custom_data/:id': 2,
+    }
+    assert sorted(
+        fake_canvas.file_courses[f['id']] for f in fake_canvas.files.values()
+    ) == sorted([fake_course.data['id'], section.data['id']])
+
+def test_uploads_reset_the_file_listing(fake_canvas, fake_course, tmp_path):
+    root = fake.write_course_dir(tmp_path, fake_course.data, pages=1,
+                                 images=1)
+    content = "{{ image_link('images/image-001.png') }}"
+    templates.common.render_content(fake_course, root, content)
+    assert [f.data['display_name']
+            for f in canvas.file.files(fake_course)] == ['image-001.png']
+
+def test_find_while_adding(fake_canvas, fake_course, tmp_path):
+    path = Path(tmp_path, 'image.png')
+    path.write_bytes(b'image')
+    index = asset_index.course_index(fake_course)
+    index.by_hash
+
+    def add():
+        for i in range(2000):
+            index.add(f'blake2b:{i:032x}', {'display_name': f'{i}.png'})
+    thread = threading.Thread(target=add)
+    thread.start()
+    while thread.is_alive():
+        assert index.find(path, hashing.digest(b'other')) is None
+    thread.join()
@@ -0,0 +1,82 @@
+from pathlib import Path
+
+import pytest
+from larc.rest import total_cache_reset
+
+from coursework import canvas
+from coursework.canvas import cassette
+
+from ..helpers import scripted_session
+
+HERE = Path(__file__).resolve().parent
+CASSETTE = Path(HERE, 'cassettes', 'test.json')
+
+def test_replay():
+    session = canvas.api.new_session()
+    with cassette.replaying(session, CASSETTE) as adapter:
+        # Matched on the path, whatever the host
+        response = session.get('https://canvas.test/api/v1/courses/15882')
+    assert response.status_code == 200
+    assert response.json()['id'] == 15882
+    assert not adapter.misses
+
+def test_replay_miss_fails_at_once():
+    session = canvas.api.new_session()
+    url = 'https://canvas.test/api/v1/courses/1/pages'
+    with cassette.replaying(session, CASSETTE) as adapter:
+        for _ in range(6):
+            with pytest.raises(cassette.CassetteMiss):
+                session.get(url)
+    # Not retried, and not counted against the host
+    assert adapter.misses == [('GET', url)] * 6
+    assert not session.breaker(url).is_open
+
+def test_record_and_replay_sync(fake_canvas, fake_course, fake_course_root,
+                                tmp_path):
+    session = canvas.api.get_session()
+    path = Path(fake_course_root, 'pages', 'page-001.md')
+    recorded = Path(tmp_path, 'sync-page.json')
+
+    def sync():
+        total_cache_reset()
+        canvas.metadata.reset()
+        canvas.user.reset_self_cache()
+        page = canvas.page.sync_page_from_path(
+            fake_course, fake_course_root, path,
+        )
+        canvas.metadata.flush_all()
+        return page.data
+
+    with cassette.recording(session, recorded):
+        data = sync()
+    entries = cassette.load(recorded)
+    assert all(
+        e['request']['headers']['Authorization'] == cassette.REDACTED
+        for e in entries
+    )
+
+    fake_canvas.reset_counts()
+    with cassette.replaying(session, recorded) as adapter:
+        assert sync() == data
+    assert not adapter.misses
+    assert fake_canvas.total_requests == 0
+
+def test_recording_redacts_and_skips_large_streams(tmp_path):
+    big = b'x' * (cassette.MAX_STREAMED_BODY + 1)
+    session, _ = scripted_session(
+        (200, {'Set-Cookie': 'canvas_session=abc', 'X-Session-Id': 'def',
+               'Content-Type': 'application/json'}, b'{"id": 1}'),
+        (200, {'Content-Length': str(len(big))}, big),
+    )
+    url = 'https://canvas.test/api/v1/users/self'
+    with cassette.recording(session, tmp_path / 'c.json') as adapter:
+        session.get(url, headers={'Cookie': 'canvas_session=abc'})
+        session.get('https://canvas.test/files/1/download', stream=True)
+
+    user, download = adapter.entries
+    assert user['request']['headers']['Cookie'] == cassette.REDACTED
+    assert user['response']['headers']['Set-Cookie'] == cassette.REDACTED
+    assert user['response']['headers']['X-Session-Id'] == cassette.REDACTED
+    assert user['response']['body'] == {'id': 1}
+    assert download['response']['body'] is None
+    assert download['response']['streamed']
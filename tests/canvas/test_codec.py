@@ -0,0 +1,88 @@
+import json
+
+from coursework import canvas
+
+from ..helpers import requests_made
+
+def test_large_custom_data_is_compressed_and_chunked(fake_canvas, fake_course,
+                                                      monkeypatch):
+    monkeypatch.setattr(canvas.codec, 'CHUNK_SIZE', 1024)
+    api = fake_course.api
+    hashes = {f'uuid-{i}': f'{i:032x}' for i in range(2000)}
+
+    assert requests_made(
+        fake_canvas, canvas.user.set_data, api, 'file-hashes', hashes,
+    ) == {
+        'GET users/self': 1,
+        # The header it replaces, for chunks to delete
+        'GET users/self/custom_data/:id': 1,
+        'PUT users/self/custom_data/:id': 15,
+    }
+    stored = fake_canvas.custom_data[canvas.user.NAMESPACE]
+    assert stored['file-hashes']['codec'] == canvas.codec.MARKER
+    assert len(json.dumps(stored)) < len(json.dumps(hashes)) / 2
+
+    assert canvas.user.get_data(api, 'file-hashes') == hashes
+    assert canvas.user.get_all_data(api) == {'file-hashes': hashes}
+
+def chunked_keys(fake_canvas, key):
+    return sorted(
+        k for k in fake_canvas.custom_data[canvas.user.NAMESPACE]
+        if canvas.codec.is_chunk_key(k) and
+        canvas.codec.chunk_owner(k) == key
+    )
+
+def test_rewrites_delete_stale_chunks(fake_canvas, fake_course, monkeypatch):
+    monkeypatch.setattr(canvas.codec, 'CHUNK_SIZE', 1024)
+    api = fake_course.api
+    hashes = {f'uuid-{i}': f'{i:032x}' for i in range(2000)}
+    canvas.user.set_data(api, 'file-hashes', hashes)
+    first = chunked_keys(fake_canvas, 'file-hashes')
+
+    fewer = dict(list(hashes.items())[:1000])
+    canvas.user.set_data(api, 'file-hashes', fewer)
+    second = chunked_keys(fake_canvas, 'file-hashes')
+    # A new generation of chunk keys, and none of the old ones left
+    assert second and len(second) < len(first)
+    assert not set(first) & set(second)
+    assert second == sorted(canvas.codec.chunk_keys(
+        'file-hashes', canvas.user.get_raw_data(api, 'file-hashes'),
+    ))
+
+    canvas.user.set_data(api, 'file-hashes', {'small': 'value'})
+    assert chunked_keys(fake_canvas, 'file-hashes') == []
+    assert canvas.user.get_data(api, 'file-hashes') == {'small': 'value'}
+
+    canvas.user.set_data(api, 'file-hashes', hashes)
+    canvas.user.delete_data(api, 'file-hashes')
+    assert chunked_keys(fake_canvas, 'file-hashes') == []
+
+def test_reader_of_a_replaced_header(fake_canvas, fake_course, monkeypatch):
+    monkeypatch.setattr(canvas.codec, 'CHUNK_SIZE', 1024)
+    api = fake_course.api
+    old = {f'uuid-{i}': f'{i:032x}' for i in range(2000)}
+    new = dict(old, extra='0' * 32)
+    canvas.user.set_data(api, 'file-hashes', old)
+    old_header = canvas.user.get_raw_data(api, 'file-hashes')
+
+    # Writing the new chunks leaves the old header's chunks readable
+    set_raw_data = canvas.user.set_raw_data
+    def write(api, key, stored, **kw):
+        if key == 'file-hashes':
+            assert canvas.user.decode_data(api, key, old_header) == old
+        return set_raw_data(api, key, stored, **kw)
+    monkeypatch.setattr(canvas.user, 'set_raw_data', write)
+    canvas.user.set_data(api, 'file-hashes', new)
+
+    # A reader that got the old header just before its chunks were
+    # deleted reads again
+    get_raw_data = canvas.user.get_raw_data
+    headers = [old_header]
+    monkeypatch.setattr(
+        canvas.user, 'get_raw_data',
+        lambda api, key, **kw: (
+            headers.pop() if key == 'file-hashes' and headers
+            else get_raw_data(api, key, **kw)
+        ),
+    )
+    assert canvas.user.get_data(api, 'file-hashes') == new
@@ -0,0 +1,85 @@
+from pathlib import Path
+
+import requests
+
+from larc.rest import total_cache_reset
+
+from coursework import canvas
+from coursework.canvas import cassette, fake
+from coursework.canvas.retry import RetryPolicy
+
+from ..helpers import requests_made, ScriptedAdapter
+
+def test_upload_course_files_follows_confirmation(tmp_path):
+    fake_canvas = fake.FakeCanvas(rate_limit=False, upload_redirect=True)
+    with fake.serving(canvas.api.get_session(), fake_canvas):
+        data = fake_canvas.add_course('CSC 101 Uploads 01')
+        api = canvas.api.get_api(fake_canvas.base_url, 'token')
+        course = canvas.course.course_by_id(api(), data['id'])
+        paths = [Path(tmp_path, f'lecture-{i}.bin') for i in range(3)]
+        for i, path in enumerate(paths):
+            path.write_bytes(bytes([i]) * (5000 + i))
+
+        uploaded = requests_made(
+            fake_canvas, canvas.file.upload_course_files, course, paths,
+        )
+        # Re-uploading replaces the files, confirmed with credentials
+        assert all(canvas.file.upload_course_files(course, paths))
+    total_cache_reset()
+
+    assert uploaded == {
+        'GET courses/:id/folders': 1,
+        'GET files/:id/create_success': 3,
+        'POST courses/:id/files': 3,
+        'POST uploads.canvas.fake': 3,
+    }
+    assert sorted(
+        fake_canvas.file_content[f['id']]
+        for f in fake_canvas.files.values()
+    ) == sorted(path.read_bytes() for path in paths)
+
+def test_failed_transfers_are_retried(tmp_path, monkeypatch):
+    fake_canvas = fake.FakeCanvas(rate_limit=False, upload_redirect=True)
+    handle = fake_canvas.handle
+    refused = []
+    def flaky_storage(request):
+        if '/files_api/' in request.url and not refused:
+            # Read the whole body before failing, as a real host would
+            refused.append(fake.body_bytes(request.body))
+            raise fake.HttpError(503, 'service unavailable')
+        return handle(request)
+    monkeypatch.setattr(fake_canvas, 'handle', flaky_storage)
+    monkeypatch.setattr(
+        canvas.file, 'TRANSFER_RETRY', RetryPolicy(retry_post=True, backoff=0),
+    )
+
+    with fake.serving(canvas.api.get_session(), fake_canvas):
+        data = fake_canvas.add_course('CSC 101 Uploads 01')
+        api = canvas.api.get_api(fake_canvas.base_url, 'token')
+        course = canvas.course.course_by_id(api(), data['id'])
+        path = Path(tmp_path, 'lecture.bin')
+        path.write_bytes(b'lecture' * 1000)
+        uploaded = canvas.file.upload_course_file(course, path)
+    total_cache_reset()
+
+    assert uploaded is not None
+    assert fake_canvas.requests[('POST', 'uploads.canvas.fake')] == 2
+    assert len(refused) == 1
+    assert fake_canvas.file_content[uploaded.data['id']] == path.read_bytes()
+
+def test_confirmation_credentials_stay_on_api_host():
+    api = canvas.api.get_api('https://canvas.test/api/v1', 'token')
+    adapter = ScriptedAdapter((200, {}, b'{"id": 1}'))
+    with cassette.mounted(canvas.api.get_session(), lambda _: adapter):
+        for location in ['https://canvas.test/api/v1/files/1/create_success',
+                         'https://elsewhere.test/files/1/create_success']:
+            redirect = requests.Response()
+            redirect.status_code = 303
+            redirect.headers['Location'] = location
+            assert canvas.file.confirm_upload(
+                api('courses', 1), redirect,
+            ) == {'id': 1}
+
+    api_host, elsewhere = adapter.sent
+    assert api_host.headers['Authorization'] == 'Bearer token'
+    assert 'Authorization' not in elsewhere.headers
@@ -0,0 +1,46 @@
+import hashlib
+
+from coursework.canvas import file_hash
+
+from ..helpers import requests_made
+
+def test_set_hashes_for_courses_resumes(fake_canvas, fake_course):
+    folder = fake_canvas.root_folder(fake_course.data['id'])
+    contents = [bytes([i]) * (3000 + i) for i in range(4)]
+    for i, content in enumerate(contents):
+        fake_canvas.add_file(
+            fake_course.data['id'], folder['id'], f'file-{i}.bin', content,
+        )
+
+    hashed = file_hash.set_hashes_for_courses(
+        [fake_course], chunk_size=1024, batch_size=3,
+    )
+    assert sorted(hashed.values()) == sorted(
+        hashlib.md5(c).hexdigest() for c in contents
+    )
+
+    # Everything is already hashed, so nothing is downloaded
+    assert requests_made(
+        fake_canvas, file_hash.set_hashes_for_courses, [fake_course],
+    ) == {
+        'GET courses/:id/files': 1,
+        'GET users/self': 1,
+        'GET users/self/custom_data': 1,
+    }
+
+def test_set_hashes_for_courses_checkpoints_by_interval(fake_canvas,
+                                                        fake_course):
+    folder = fake_canvas.root_folder(fake_course.data['id'])
+    for i in range(4):
+        fake_canvas.add_file(
+            fake_course.data['id'], folder['id'], f'file-{i}.bin',
+            bytes([i]) * 100,
+        )
+
+    # Four batches, but the blob of hashes is written only once
+    made = requests_made(
+        fake_canvas, file_hash.set_hashes_for_courses, [fake_course],
+        batch_size=1, checkpoint_interval=3600,
+    )
+    # One flush: the key and the store's version stamp
+    assert made['PUT users/self/custom_data/:id'] == 2
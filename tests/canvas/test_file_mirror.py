@@ -0,0 +1,39 @@
+from pathlib import Path
+
+from coursework.canvas import file_mirror
+
+from ..helpers import requests_made
+
+def test_mirror_course_files(fake_canvas, fake_course, tmp_path):
+    cid = fake_course.data['id']
+    root = fake_canvas.root_folder(cid)
+    sub = fake_canvas.add_folder(cid, 'images', root['id'])
+    fake_canvas.add_file(cid, root['id'], 'syllabus.pdf', b'syllabus')
+    fake_canvas.add_file(cid, sub['id'], 'diagram.png', b'diagram' * 500)
+    dest = Path(tmp_path, 'mirror')
+
+    result = file_mirror.mirror_course_files(
+        fake_course, dest, chunk_size=1024,
+    )
+    assert len(result.downloaded) == 2
+    assert Path(dest, 'syllabus.pdf').read_bytes() == b'syllabus'
+    assert Path(dest, 'images', 'diagram.png').read_bytes() == (
+        b'diagram' * 500
+    )
+    assert not list(dest.rglob('*.part'))
+
+    # Up to date: only the listings
+    assert requests_made(
+        fake_canvas, file_mirror.mirror_course_files, fake_course, dest,
+    ) == {
+        'GET courses/:id/files': 1,
+        'GET courses/:id/folders': 1,
+        'GET users/self': 1,
+        'GET users/self/custom_data': 1,
+    }
+
+    fake_canvas.add_file(cid, sub['id'], 'diagram.png', b'new diagram')
+    result = file_mirror.mirror_course_files(fake_course, dest)
+    assert result.downloaded == (Path(dest, 'images', 'diagram.png'),)
+    assert len(result.skipped) == 1
+    assert Path(dest, 'images', 'diagram.png').read_bytes() == b'new diagram'
@@ -0,0 +1,40 @@
+from pathlib import Path
+
+from coursework import canvas
+
+from ..helpers import requests_made, edit
+
+def test_sync_fingerprinted_page_and_assignment(fake_canvas, fake_course,
+                                                fake_course_root, monkeypatch):
+    monkeypatch.setenv('COURSEWORK_CONTENT_FINGERPRINTS', 'true')
+    page_path = Path(fake_course_root, 'pages', 'page-002.md')
+    sync_page = canvas.page.sync_page_from_path(fake_course, fake_course_root)
+    sync_page(page_path)
+    assign_path = Path(fake_course_root, 'assignments', 'assign-002.md')
+    sync_assign = canvas.assignment.sync_assignment_from_path(
+        fake_course, fake_course_root,
+    )
+    sync_assign(assign_path)
+
+    # Unchanged: read off the listings alone
+    assert requests_made(fake_canvas, sync_page, page_path) == {
+        'GET courses/:id/pages': 1,
+    }
+    assert requests_made(fake_canvas, sync_assign, assign_path) == {
+        'GET courses/:id/assignment_groups': 1,
+        'GET courses/:id/assignments': 1,
+    }
+
+    edit(page_path, 'Some *content*', 'Some *new content*')
+    assert requests_made(fake_canvas, sync_page, page_path) == {
+        'GET courses/:id/pages': 1,
+        'GET courses/:id/pages/:id': 1,
+        'PUT courses/:id/pages/:id': 1,
+    }
+    edit(assign_path, 'Instructions', 'New instructions')
+    assert requests_made(fake_canvas, sync_assign, assign_path) == {
+        'GET courses/:id/assignment_groups': 1,
+        'GET courses/:id/assignments': 1,
+        'GET courses/:id/assignments/:id': 1,
+        'PUT courses/:id/assignments/:id': 1,
+    }
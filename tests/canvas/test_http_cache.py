@@ -0,0 +1,96 @@
+import pytest
+
+from coursework import canvas
+from coursework.canvas import fake
+from coursework.canvas.http_cache import (
+    HttpCache, collection_path, invalidated_paths,
+)
+
+@pytest.fixture
+def cached_canvas(tmp_path):
+    '''A fake Canvas served through a session with an HTTP cache
+    '''
+    fake_canvas = fake.FakeCanvas(rate_limit=False)
+    session = canvas.api.new_session(
+        cache=HttpCache(tmp_path / 'http-cache.sqlite'),
+    )
+    with fake.serving(session, fake_canvas):
+        yield fake_canvas, session
+
+def test_collection_path():
+    assert collection_path(
+        'https://x/api/v1/courses/1/pages/intro?a=1'
+    ) == '/api/v1/courses/1/pages'
+    assert collection_path(
+        'https://x/api/v1/courses/1/pages'
+    ) == '/api/v1/courses/1/pages'
+
+def test_invalidated_paths():
+    assert invalidated_paths('https://x/api/v1/courses/1?a=1') == (
+        '/api/v1/courses/1', '/api/v1/courses',
+    )
+    assert invalidated_paths('https://x/api/v1/courses/1/pages') == (
+        '/api/v1/courses/1/pages',
+    )
+
+def test_unchanged_listings_are_revalidated(cached_canvas):
+    fake_canvas, session = cached_canvas
+    course = fake_canvas.add_course('CSC 101 Caching 01')
+    url = f'{fake_canvas.base_url}/courses/{course["id"]}/pages'
+
+    first = session.get(url)
+    second = session.get(url)
+    assert second.json() == first.json()
+    assert second.from_cache and second.revalidated
+    assert session.metrics.rows()[0][2]['statuses'] == {'200': 1, '304': 1}
+
+def test_writes_invalidate_the_collection(cached_canvas):
+    fake_canvas, session = cached_canvas
+    course = fake_canvas.add_course('CSC 101 Caching 01')
+    url = f'{fake_canvas.base_url}/courses/{course["id"]}/pages'
+
+    assert session.get(url).json() == []
+    session.post(url, data={'wiki_page[title]': 'Intro'})
+    fake_canvas.reset_counts()
+
+    pages = session.get(url)
+    assert not getattr(pages, 'from_cache', False)
+    assert [p['title'] for p in pages.json()] == ['Intro']
+    assert fake_canvas.total_requests == 1
+
+def test_writes_leave_other_resources_cached(cached_canvas):
+    fake_canvas, session = cached_canvas
+    course = fake_canvas.add_course('CSC 101 Caching 01')
+    urls = {
+        'courses': f'{fake_canvas.base_url}/courses',
+        'course': f'{fake_canvas.base_url}/courses/{course["id"]}',
+        'pages': f'{fake_canvas.base_url}/courses/{course["id"]}/pages',
+    }
+    for url in urls.values():
+        session.get(url)
+
+    session.put(urls['course'], data={'course[name]': 'CSC 101 Renamed'})
+    cached = {
+        name: getattr(session.get(url), 'from_cache', False)
+        for name, url in urls.items()
+    }
+    assert cached == {'courses': False, 'course': False, 'pages': True}
+
+def test_fresh_responses_skip_the_network(cached_canvas):
+    fake_canvas, session = cached_canvas
+    url = f'{fake_canvas.base_url}/users/self'
+    session.get(url)
+    fake_canvas.reset_counts()
+    assert session.get(url).from_cache
+    assert fake_canvas.total_requests == 0
+
+def test_eviction_keeps_cache_under_bound(cached_canvas):
+    fake_canvas, session = cached_canvas
+    session.cache.max_bytes = 1
+    course = fake_canvas.add_course('CSC 101 Caching 01')
+    session.get(f'{fake_canvas.base_url}/courses/{course["id"]}/pages')
+    session.get(f'{fake_canvas.base_url}/courses')
+    total = session.cache._db.execute(
+        'select count(*) from responses'
+    ).fetchone()[0]
+    assert total <= 1
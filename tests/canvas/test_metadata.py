@@ -0,0 +1,94 @@
+import threading
+
+from coursework import canvas
+
+def test_metadata_update_merges_remote_changes(fake_canvas, fake_course):
+    api = fake_course.api
+    store = canvas.metadata.MetadataStore(api)
+    store.set('metadata-test', {'a': 1})
+    store.flush()
+
+    # Another process changes the key after we loaded it
+    canvas.user.set_data(api, 'metadata-test', {'a': 1, 'b': 2})
+    canvas.user.set_data(api, canvas.metadata.VERSION_KEY, 'elsewhere')
+
+    store.update('metadata-test', lambda md: dict(md, c=3))
+    fake_canvas.reset_counts()
+    assert store.flush()
+    # The version stamp has changed, so the namespace is re-read and the
+    # update replayed on the remote value, then the stamp read back
+    assert fake_canvas.total_requests == 4
+
+    merged = canvas.user.get_data(api, 'metadata-test')
+    assert merged == {'a': 1, 'b': 2, 'c': 3}
+
+def test_changes_made_during_a_flush_stay_dirty(fake_canvas, fake_course,
+                                                monkeypatch):
+    api = fake_course.api
+    store = canvas.metadata.MetadataStore(api)
+    store.set('metadata-a', {'n': 1})
+    store.set('metadata-b', {'n': 1})
+
+    # While the flush is out, another thread changes a key it is
+    # writing (which would deadlock if the flush held the store's lock)
+    set_all_data = canvas.metadata.set_all_data
+    def set_all_data_meanwhile(*args, **kwargs):
+        done = threading.Thread(
+            target=store.update,
+            args=('metadata-a', lambda md: dict(md, n=2)),
+        )
+        done.start()
+        done.join(timeout=5)
+        assert not done.is_alive()
+        return set_all_data(*args, **kwargs)
+    monkeypatch.setattr(
+        canvas.metadata, 'set_all_data', set_all_data_meanwhile,
+    )
+    assert store.flush()
+    assert canvas.user.get_data(api, 'metadata-a') == {'n': 1}
+    assert store.get('metadata-a') == {'n': 2}
+
+    monkeypatch.setattr(canvas.metadata, 'set_all_data', set_all_data)
+    assert store.flush()
+    assert canvas.user.get_data(api, 'metadata-a') == {'n': 2}
+    assert canvas.user.get_data(api, 'metadata-b') == {'n': 1}
+    assert not store.pending
+
+def test_flush_rewrites_changes_lost_to_a_concurrent_write(
+        fake_canvas, fake_course, monkeypatch):
+    api = fake_course.api
+    store = canvas.metadata.MetadataStore(api)
+    store.set('metadata-a', {'n': 1})
+    store.set('metadata-b', {'n': 1})
+
+    # Another process's whole-namespace write (from what it read before
+    # ours) lands right after ours, the first `overwrites` times
+    overwrites = [1]
+    set_all_data = canvas.metadata.set_all_data
+    def set_all_data_and_lose_it(api, data, **kwargs):
+        written = set_all_data(api, data, **kwargs)
+        if overwrites[0]:
+            overwrites[0] -= 1
+            set_all_data(api, {
+                'metadata-c': {'n': 1},
+                canvas.metadata.VERSION_KEY: 'elsewhere',
+            }, **kwargs)
+        return written
+    monkeypatch.setattr(
+        canvas.metadata, 'set_all_data', set_all_data_and_lose_it,
+    )
+
+    assert store.flush()
+    assert canvas.user.get_all_data(api) == {
+        'metadata-a': {'n': 1},
+        'metadata-b': {'n': 1},
+        'metadata-c': {'n': 1},
+        canvas.metadata.VERSION_KEY: store.data[canvas.metadata.VERSION_KEY],
+    }
+
+    # Given up on after FLUSH_ATTEMPTS writes, and kept dirty
+    store.set('metadata-a', {'n': 2})
+    store.set('metadata-b', {'n': 2})
+    overwrites[0] = canvas.metadata.FLUSH_ATTEMPTS
+    assert not store.flush()
+    assert set(store.pending) == {'metadata-a', 'metadata-b'}
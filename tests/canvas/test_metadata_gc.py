@@ -0,0 +1,39 @@
+from pathlib import Path
+
+from coursework import canvas
+from coursework.canvas import metadata_gc
+
+from ..helpers import requests_made
+
+def test_gc_metadata(fake_canvas, fake_course, fake_course_root):
+    for path in sorted(Path(fake_course_root, 'pages').glob('page-*.md')):
+        canvas.page.sync_page_from_path(fake_course, fake_course_root, path)
+    gone_page, *_ = canvas.page.pages(fake_course)
+    gone_page.delete()
+    store = canvas.metadata.store(fake_course.api)
+    store.set('metadata-courses-999999-quizzes-1', {'hash': 'x'})
+    store.update('file-hashes', lambda h: dict(h, gone='x'), {})
+    canvas.metadata.flush_all()
+    # Left by a write that was interrupted
+    stored = fake_canvas.custom_data[canvas.user.NAMESPACE]
+    stored['file-hashes--chunk-0123456789ab-0'] = 'x' * 100
+
+    orphans = metadata_gc.find_orphans(fake_course.api)
+    orphan_keys = {o.key for o in orphans.keys}
+    gone_keys = {
+        'metadata-courses-999999-quizzes-1',
+        canvas.metadata.md_key(gone_page),
+    }
+    assert orphan_keys == gone_keys
+    assert set(orphans.file_hashes) == {'gone'}
+    assert set(orphans.chunk_keys) == {'file-hashes--chunk-0123456789ab-0'}
+
+    assert requests_made(
+        fake_canvas, metadata_gc.prune, fake_course.api, orphans,
+    ) == {
+        'GET users/self': 1,
+        'GET users/self/custom_data': 2,
+        'GET users/self/custom_data/:id': 1,
+        'PUT users/self/custom_data': 1,
+    }
+    assert not metadata_gc.find_orphans(fake_course.api).bytes
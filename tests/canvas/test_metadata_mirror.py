@@ -0,0 +1,38 @@
+from pathlib import Path
+
+from coursework import canvas
+from coursework.canvas.metadata_mirror import MetadataMirror
+
+from ..helpers import requests_made
+
+def test_sync_page_with_metadata_mirror(fake_canvas, fake_course,
+                                        fake_course_root, tmp_path,
+                                        monkeypatch):
+    monkeypatch.setattr(
+        canvas.metadata, '_mirror', MetadataMirror(tmp_path / 'mirror.sqlite'),
+    )
+    path = Path(fake_course_root, 'pages', 'page-002.md')
+    sync = canvas.page.sync_page_from_path(fake_course, fake_course_root)
+    sync(path)
+    canvas.metadata.flush_all()
+
+    # The mirror is current, so only the version stamp is read
+    assert requests_made(fake_canvas, sync, path) == {
+        'GET courses/:id/pages': 1,
+        'GET courses/:id/pages/:id': 1,
+        'GET users/self': 1,
+        'GET users/self/custom_data/:id': 1,
+    }
+
+    # Another process writes: the mirror is stale and the namespace is
+    # read again
+    canvas.user.set_data(
+        fake_course.api, canvas.metadata.VERSION_KEY, 'elsewhere',
+    )
+    assert requests_made(fake_canvas, sync, path) == {
+        'GET courses/:id/pages': 1,
+        'GET courses/:id/pages/:id': 1,
+        'GET users/self': 1,
+        'GET users/self/custom_data': 1,
+        'GET users/self/custom_data/:id': 1,
+    }
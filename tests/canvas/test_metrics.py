@@ -0,0 +1,60 @@
+import json
+
+from click.testing import CliRunner
+
+from coursework import canvas
+from coursework.canvas import fake
+from coursework.canvas.metrics import Metrics, path_template
+from coursework.cli import page
+
+def test_path_template():
+    assert path_template(
+        'https://x.instructure.com/api/v1/courses/1/quizzes/2/questions'
+    ) == 'courses/:id/quizzes/:id/questions'
+    assert path_template(
+        'https://x.instructure.com/api/v1/users/self/custom_data/a'
+    ) == 'users/self/custom_data/:id'
+    assert path_template(
+        'https://uploads.x.com/files_api/abc?x=1'
+    ) == 'uploads.x.com'
+
+def test_metrics_by_endpoint(tmp_path):
+    metrics = Metrics()
+    for i in range(3):
+        metrics.record('get', f'https://x/api/v1/courses/{i}/pages', 200,
+                       0.01, nbytes=100)
+    metrics.record('GET', 'https://x/api/v1/courses/1/pages', 503, 2.0,
+                   retries=1)
+    metrics.record('PUT', 'https://x/api/v1/courses/1/pages/a', 'error', 0.3)
+
+    assert metrics.total == 5
+    (method, path, pages), (_, _, put) = metrics.rows()
+    assert (method, path) == ('GET', 'courses/:id/pages')
+    assert pages['statuses'] == {'200': 3, '503': 1}
+    assert pages['bytes'] == 300
+    assert pages['retries'] == 1
+    assert pages['latency_p50'] == 0.025
+    assert pages['latency_max'] == 2.0
+    assert put['statuses'] == {'error': 1}
+
+    metrics.write_json(tmp_path / 'metrics.json')
+    data = json.loads((tmp_path / 'metrics.json').read_text())
+    assert data['total_requests'] == 5
+    assert 'courses/:id/pages' in metrics.table()
+
+def test_commands_report_metrics_when_they_fail(fake_canvas, tmp_path,
+                                                monkeypatch):
+    monkeypatch.setenv('COURSEWORK_BASE_URL', fake_canvas.base_url)
+    monkeypatch.setenv('COURSEWORK_TOKEN', 'token')
+    course = fake_canvas.add_course('CSC 101 Metrics 01')
+    course_dir = fake.write_course_dir(tmp_path / 'course', course, pages=0)
+    canvas.api.get_session().metrics.reset()
+
+    result = CliRunner().invoke(page.sync_pages, [
+        str(course_dir), '--metrics-json', str(tmp_path / 'metrics.json'),
+    ])
+    # No pages to sync
+    assert result.exit_code
+    data = json.loads((tmp_path / 'metrics.json').read_text())
+    assert data['total_requests'] > 0
+    assert 'total requests' in result.stderr
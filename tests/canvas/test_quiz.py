@@ -1,9 +1,13 @@
+from pathlib import Path
+
 import pytest
 
 from larcutils.common import Null
 
 from coursework import canvas
 
+from ..helpers import edit
+
 def test_map_answer_keys():
     assert canvas.quiz.map_answer_keys({'comments': ''}) == {
         'answer_comments': ''
@@ -45,5 +49,32 @@ def test_map_answer_keys():
 def test_no_text_or_html():
     assert not canvas.quiz.process_answer(None, None, {})
 
+def test_question_checkpoints_survive_a_crash(fake_canvas, fake_course,
+                                              fake_course_root, monkeypatch):
+    path = Path(fake_course_root, 'quizzes', 'quiz-002.yml')
+    sync = canvas.quiz.sync_quiz_from_path(fake_course, fake_course_root)
+    sync(path)
+    canvas.metadata.flush_all()
+
+    edit(path, 'Question 2 of quiz 2?', 'Question two of quiz 2?')
+    created = []
+    new_question = canvas.quiz.new_question
+    def create_one(quiz_ep, data):
+        if created:
+            return None
+        created.append(new_question(quiz_ep, data))
+        return created[-1]
+    monkeypatch.setattr(canvas.quiz, 'new_question', create_one)
+    sync(path)
+    # The process dies without flushing the metadata store
+    canvas.metadata._stores.clear()
+
+    question_md = [
+        md['questions'] for key, md in
+        canvas.user.get_all_data(fake_course.api).items()
+        if key.startswith('metadata-') and 'questions' in md
+    ]
+    assert [len(md['hashes']) for md in question_md] == [1]
+
 # def test_get_quizzes(quizzes):
 #     assert len(quizzes) == 12
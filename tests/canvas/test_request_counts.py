@@ -0,0 +1,161 @@
+'''Request budgets for the sync functions
+
+Each sync runs against the in-process fake Canvas with an empty
+memoization cache (as it would in a fresh coursework-sync-* process),
+and the requests it makes are counted per endpoint. A change that
+makes a sync cost more requests should show up here as a failure (and
+a change that makes it cost fewer should tighten the budget).
+
+'''
+from pathlib import Path
+
+from larc import yaml
+
+from coursework import canvas
+
+from ..helpers import requests_made, edit
+
+def test_sync_page_from_path(fake_canvas, fake_course, fake_course_root):
+    path = Path(fake_course_root, 'pages', 'page-002.md')
+    sync = canvas.page.sync_page_from_path(fake_course, fake_course_root)
+    sync(path)
+
+    assert requests_made(fake_canvas, sync, path) == {
+        'GET courses/:id/pages': 1,
+        'GET courses/:id/pages/:id': 1,
+        'GET users/self': 1,
+        'GET users/self/custom_data': 1,
+    }
+
+    edit(path, 'Some *content*', 'Some *new content*')
+    assert requests_made(fake_canvas, sync, path) == {
+        'GET courses/:id/pages': 1,
+        'GET courses/:id/pages/:id': 2,
+        'GET users/self': 1,
+        'GET users/self/custom_data': 2,
+        'GET users/self/custom_data/:id': 1,
+        'PUT courses/:id/pages/:id': 1,
+        'PUT users/self/custom_data/:id': 2,
+    }
+
+def test_sync_assignment_from_path(fake_canvas, fake_course, fake_course_root):
+    path = Path(fake_course_root, 'assignments', 'assign-002.md')
+    sync = canvas.assignment.sync_assignment_from_path(
+        fake_course, fake_course_root,
+    )
+    sync(path)
+
+    assert requests_made(fake_canvas, sync, path) == {
+        'GET courses/:id/assignment_groups': 1,
+        'GET courses/:id/assignments': 1,
+        'GET courses/:id/assignments/:id': 1,
+        'GET users/self': 1,
+        'GET users/self/custom_data': 1,
+    }
+
+    edit(path, 'Instructions', 'New instructions')
+    assert requests_made(fake_canvas, sync, path) == {
+        'GET courses/:id/assignment_groups': 1,
+        'GET courses/:id/assignments': 1,
+        'GET courses/:id/assignments/:id': 2,
+        'GET users/self': 1,
+        'GET users/self/custom_data': 2,
+        'GET users/self/custom_data/:id': 1,
+        'PUT courses/:id/assignments/:id': 1,
+        'PUT users/self/custom_data/:id': 2,
+    }
+
+def test_sync_quiz_from_path(fake_canvas, fake_course, fake_course_root):
+    path = Path(fake_course_root, 'quizzes', 'quiz-002.yml')
+    sync = canvas.quiz.sync_quiz_from_path(fake_course, fake_course_root)
+    sync(path)
+
+    assert requests_made(fake_canvas, sync, path) == {
+        'GET courses/:id/assignment_groups': 1,
+        'GET courses/:id/quizzes': 3,
+        'GET courses/:id/quizzes/:id/questions': 1,
+        'GET users/self': 1,
+        'GET users/self/custom_data': 1,
+    }
+
+    edit(path, 'Question 2 of quiz 2?', 'Question two of quiz 2?')
+    assert requests_made(fake_canvas, sync, path) == {
+        'DELETE courses/:id/quizzes/:id/questions/:id': 3,
+        'GET courses/:id/assignment_groups': 1,
+        'GET courses/:id/quizzes': 3,
+        'GET courses/:id/quizzes/:id': 1,
+        'GET courses/:id/quizzes/:id/questions': 1,
+        'GET courses/:id/quizzes/:id/questions/:id': 3,
+        'GET users/self': 1,
+        'GET users/self/custom_data': 3,
+        # Checkpoints of the question hashes: once the questions are
+        # deleted, and once they are created
+        'GET users/self/custom_data/:id': 2,
+        'POST courses/:id/quizzes/:id/questions': 3,
+        'PUT courses/:id/quizzes/:id': 1,
+        'PUT users/self/custom_data/:id': 4,
+    }
+
+def test_sync_assignment_groups_from_path(fake_canvas, fake_course, tmp_path):
+    path = Path(tmp_path, 'groups.yml')
+    path.write_text(yaml.dump({'assignment': [
+        {'name': 'Assignments', 'weight': 40},
+        {'name': 'Quizzes', 'weight': 30},
+        {'name': 'Exams', 'weight': 30},
+    ]}))
+    sync = canvas.assignment.sync_assignment_groups_from_path(fake_course)
+    sync(path)
+
+    assert requests_made(fake_canvas, sync, path) == {
+        'GET courses/:id/assignment_groups': 2,
+        'GET users/self': 1,
+        'GET users/self/custom_data': 1,
+    }
+
+    edit(path, 'weight: 40', 'weight: 50')
+    assert requests_made(fake_canvas, sync, path) == {
+        'GET courses/:id/assignment_groups': 2,
+        'GET courses/:id/assignment_groups/:id': 1,
+        'GET users/self': 1,
+        'GET users/self/custom_data': 2,
+        'GET users/self/custom_data/:id': 1,
+        'PUT courses/:id/assignment_groups/:id': 1,
+        'PUT users/self/custom_data/:id': 2,
+    }
+
+def test_sync_modules(fake_canvas, fake_course, fake_course_root):
+    # The module items refer to these
+    for path in sorted(Path(fake_course_root, 'pages').glob('page-*.md')):
+        canvas.page.sync_page_from_path(fake_course, fake_course_root, path)
+    assignments = Path(fake_course_root, 'assignments')
+    for path in sorted(assignments.glob('assign-*.md')):
+        canvas.assignment.sync_assignment_from_path(
+            fake_course, fake_course_root, path,
+        )
+    for path in sorted(Path(fake_course_root, 'quizzes').glob('quiz-*.yml')):
+        canvas.quiz.sync_quiz_from_path(fake_course, fake_course_root, path)
+
+    path = Path(fake_course_root, 'modules.yml')
+    module_data = canvas.module.module_data_from_yaml_path(fake_course, path)
+    canvas.module.sync_modules(fake_course, module_data)
+
+    assert requests_made(
+        fake_canvas, canvas.module.sync_modules, fake_course, module_data,
+    ) == {
+        'GET courses/:id/modules': 1,
+        'GET courses/:id/modules/:id/items': 4,
+    }
+
+    # Move the first item of the first module to the end of the second
+    moved, *rest = module_data[0]['items']
+    module_data = (
+        dict(module_data[0], items=tuple(rest)),
+        dict(module_data[1], items=module_data[1]['items'] + (moved,)),
+    ) + module_data[2:]
+    assert requests_made(
+        fake_canvas, canvas.module.sync_modules, fake_course, module_data,
+    ) == {
+        'GET courses/:id/modules': 2,
+        'GET courses/:id/modules/:id/items': 8,
+        'PUT courses/:id/modules/:id/items/:id': 3,
+    }
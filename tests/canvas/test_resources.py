@@ -0,0 +1,81 @@
+import time
+import threading
+
+from coursework import canvas
+from coursework.canvas import fake, resources
+
+def test_numbered_pages_are_fetched_in_order():
+    fake_canvas = fake.FakeCanvas(rate_limit=False, max_per_page=10)
+    with fake.serving(canvas.api.get_session(), fake_canvas):
+        data = fake_canvas.add_course('CSC 101 Paging 01')
+        for i in range(35):
+            fake_canvas.create(('courses', str(data['id']), 'pages'),
+                               {'title': f'Page {i:02d}'})
+        api = canvas.api.get_api(fake_canvas.base_url, 'token')
+        course = canvas.course.course_by_id(api(), data['id'])
+        fake_canvas.reset_counts()
+        pages = canvas.page.pages(course, do_memo=False)
+
+    assert [p.data['title'] for p in pages] == sorted(
+        f'Page {i:02d}' for i in range(35)
+    )
+    assert fake_canvas.requests[('GET', 'courses/:id/pages')] == 4
+
+def test_bookmarked_pages_follow_next_links():
+    fake_canvas = fake.FakeCanvas(
+        rate_limit=False, max_per_page=10, numbered_last=False,
+    )
+    with fake.serving(canvas.api.get_session(), fake_canvas):
+        data = fake_canvas.add_course('CSC 101 Paging 01')
+        for i in range(25):
+            fake_canvas.create(('courses', str(data['id']), 'pages'),
+                               {'title': f'Page {i:02d}'})
+        api = canvas.api.get_api(fake_canvas.base_url, 'token')
+        course = canvas.course.course_by_id(api(), data['id'])
+        pages = canvas.page.pages(course, do_memo=False)
+    assert len(pages) == 25
+
+def test_single_flight_shares_one_fetch():
+    calls = []
+    def fetch():
+        calls.append(1)
+        time.sleep(0.1)
+        return len(calls)
+
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(
+                resources.single_flight('key', fetch)
+            ),
+        )
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert calls == [1]
+    assert results == [1] * 5
+
+    # Once done, the next call fetches again
+    assert resources.single_flight('key', fetch) == 2
+
+def test_single_flight_shares_errors():
+    def fetch():
+        time.sleep(0.1)
+        raise ValueError('nope')
+
+    errors = []
+    def call():
+        try:
+            resources.single_flight('error-key', fetch)
+        except ValueError as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(errors) == 3
@@ -0,0 +1,177 @@
+import io
+
+import pytest
+import requests
+
+from coursework import canvas
+from coursework.canvas.retry import (
+    RetryPolicy, CircuitBreaker, CircuitOpenError, retry_after, rewind_body,
+)
+
+from ..helpers import scripted_session
+
+URL = 'https://canvas.test/api/v1/courses'
+
+def test_transient_failures_are_retried():
+    session, adapter = scripted_session(
+        (503, {}, b''), (502, {}, b''), (200, {}, b'[]'),
+    )
+    response = session.get(URL)
+    assert response.status_code == 200
+    assert response.retries == 2
+    assert len(adapter.sent) == 3
+
+def test_connection_errors_are_retried():
+    session, adapter = scripted_session(
+        requests.exceptions.ConnectionError('reset'), (200, {}, b'[]'),
+    )
+    assert session.get(URL).status_code == 200
+    assert len(adapter.sent) == 2
+
+def test_posts_are_not_retried_by_default():
+    session, adapter = scripted_session((503, {}, b''), (201, {}, b'{}'))
+    assert session.post(URL, data={'a': 1}).status_code == 503
+    assert len(adapter.sent) == 1
+
+    session, adapter = scripted_session(
+        (503, {}, b''), (201, {}, b'{}'),
+        retry=RetryPolicy(backoff=0, retry_post=True),
+    )
+    assert session.post(URL, data={'a': 1}).status_code == 201
+
+def test_retries_are_bounded():
+    session, adapter = scripted_session(
+        (500, {}, b''), retry=RetryPolicy(backoff=0, max_retries=2),
+    )
+    assert session.get(URL).status_code == 500
+    assert len(adapter.sent) == 3
+
+def test_breaker_opens_and_recovers():
+    breaker = CircuitBreaker('canvas.test', failure_threshold=2,
+                             reset_timeout=30)
+    for _ in range(2):
+        breaker.before()
+        breaker.record(False)
+    assert breaker.is_open
+    with pytest.raises(CircuitOpenError):
+        breaker.before()
+
+    # Half-open after the cool-off: a single trial goes through
+    breaker.opened_at -= 30
+    breaker.before()
+    with pytest.raises(CircuitOpenError):
+        breaker.before()
+    breaker.record(True)
+    assert not breaker.is_open
+    breaker.before()
+
+def test_breaker_reopens_on_failed_trial():
+    breaker = CircuitBreaker('canvas.test', failure_threshold=1,
+                             reset_timeout=30)
+    breaker.before()
+    breaker.record(False)
+    breaker.opened_at -= 30
+    breaker.before()
+    breaker.record(False)
+    with pytest.raises(CircuitOpenError):
+        breaker.before()
+
+def test_session_fails_fast_while_breaker_is_open():
+    session, adapter = scripted_session(
+        (503, {}, b''), retry=RetryPolicy(backoff=0, max_retries=0),
+    )
+    session.breakers['canvas.test'] = CircuitBreaker(
+        'canvas.test', failure_threshold=2,
+    )
+    for _ in range(2):
+        assert session.get(URL).status_code == 503
+    with pytest.raises(CircuitOpenError):
+        session.get(URL)
+    assert len(adapter.sent) == 2
+
+    # The half-open trial succeeds and closes the breaker
+    adapter.script = [(200, {}, b'[]')]
+    session.breakers['canvas.test'].opened_at -= 30
+    assert session.get(URL).status_code == 200
+    assert session.get(URL).status_code == 200
+
+def test_retry_after():
+    def response(value):
+        r = requests.Response()
+        r.status_code = 503
+        r.headers['Retry-After'] = value
+        return r
+    assert retry_after(response('3')) == 3
+    assert retry_after(response('Wed, 21 Oct 2015 07:28:00 GMT')) == 0
+    assert retry_after(response('soon')) is None
+    assert retry_after(requests.Response()) is None
+    assert RetryPolicy(max_backoff=5).delay(1, response('120')) == 5
+    # Malformed: the policy's own backoff
+    assert 0 <= RetryPolicy(backoff=1).delay(1, response('soon')) <= 1
+
+def test_rewind_body(tmp_path):
+    path = tmp_path / 'body.bin'
+    path.write_bytes(b'content')
+    with path.open('rb') as rfp:
+        rfp.read()
+        assert rewind_body({'data': rfp})
+        assert rfp.tell() == 0
+        rfp.read()
+        assert rewind_body({'files': {'file': ('body.bin', rfp)}})
+        assert rfp.tell() == 0
+
+    assert rewind_body({'data': {'a': 1}, 'files': None})
+    assert rewind_body({'data': b'raw'})
+    assert not rewind_body({'data': (chunk for chunk in [b'a', b'b'])})
+    assert not rewind_body({'data': iter([b'a'])})
+
+def test_file_bodies_are_resent_whole_on_retry():
+    session, adapter = scripted_session((503, {}, b''), (200, {}, b'{}'))
+    body = io.BytesIO(b'0123456789')
+    assert session.put(URL, data=body).status_code == 200
+    assert adapter.bodies == [b'0123456789', b'0123456789']
+
+def test_rate_limited_trial_closes_breaker():
+    session, adapter = scripted_session(
+        (403, {}, b'403 Forbidden (Rate Limit Exceeded)'), (200, {}, b'[]'),
+        retry=RetryPolicy(backoff=0, max_retries=0),
+    )
+    breaker = session.breakers['canvas.test'] = CircuitBreaker(
+        'canvas.test', failure_threshold=1,
+    )
+    breaker.record(False)
+    breaker.opened_at -= 30
+    # Refused for the rate limit, then let through at once
+    session.limiter(URL).low_water = 0
+
+    assert session.get(URL).status_code == 200
+    assert not breaker.is_open and not breaker.trial_in_flight
+
+def test_trial_that_raises_is_given_up():
+    session, adapter = scripted_session(ValueError('bad adapter'))
+    breaker = session.breakers['canvas.test'] = CircuitBreaker(
+        'canvas.test', failure_threshold=1,
+    )
+    breaker.record(False)
+    breaker.opened_at -= 30
+
+    with pytest.raises(ValueError):
+        session.get(URL)
+    assert not breaker.trial_in_flight
+    # The next request is let through as a new trial
+    adapter.script = [(200, {}, b'[]')]
+    assert session.get(URL).status_code == 200
+    assert not breaker.is_open
+
+def test_rate_limited_requests_honour_retry_after(monkeypatch):
+    session, adapter = scripted_session(
+        (429, {'Retry-After': '2'}, b''), (200, {}, b'[]'),
+    )
+    session.limiter(URL).low_water = 0
+    sleeps = []
+    monkeypatch.setattr(canvas.api.time, 'sleep', sleeps.append)
+
+    # Requeued whatever the method
+    assert session.post(URL, data={'a': 1}).status_code == 200
+    assert sleeps == [2]
+    assert len(adapter.sent) == 2
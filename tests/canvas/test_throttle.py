@@ -0,0 +1,68 @@
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from coursework.canvas.throttle import RateLimiter, is_rate_limited
+
+def response(status: int, text: str = '', **headers):
+    r = requests.Response()
+    r.status_code = status
+    r.headers = CaseInsensitiveDict(headers)
+    r._content = text.encode()
+    r.encoding = 'utf-8'
+    return r
+
+def test_is_rate_limited():
+    assert is_rate_limited(response(429))
+    assert is_rate_limited(
+        response(403, '403 Forbidden (Rate Limit Exceeded)')
+    )
+    assert not is_rate_limited(response(403, 'user not authorized'))
+    assert not is_rate_limited(response(200))
+
+def test_limiter_backs_off_when_rate_limited():
+    limiter = RateLimiter(initial=16, cooldown=0)
+    limiter.acquire()
+    limiter.release(response(429))
+    assert limiter.limit == 8
+    assert limiter.remaining == 0
+
+    limiter.release(
+        response(403, 'Rate Limit Exceeded', **{'X-Rate-Limit-Remaining': '0'})
+    )
+    assert limiter.limit == 4
+
+def test_limiter_backs_off_once_per_cooldown():
+    limiter = RateLimiter(initial=16, cooldown=60)
+    for _ in range(3):
+        limiter.release(response(429))
+    # A burst of refusals from requests that were all in flight together
+    # is one signal
+    assert limiter.limit == 8
+
+def test_limiter_backs_off_below_low_water():
+    limiter = RateLimiter(initial=16, low_water=150, cooldown=0)
+    limiter.acquire()
+    limiter.release(response(200, **{'X-Rate-Limit-Remaining': '100'}))
+    assert limiter.limit == 8
+
+def test_limiter_grows_additively():
+    limiter = RateLimiter(initial=4, maximum=5)
+    for _ in range(4):
+        limiter.acquire()
+        limiter.release(
+            response(200, **{'X-Rate-Limit-Remaining': '600',
+                             'X-Request-Cost': '1'})
+        )
+    # One more in flight per window of successes
+    assert 4.9 < limiter.limit <= 5
+    for _ in range(20):
+        limiter.acquire()
+        limiter.release(response(200))
+    assert limiter.limit == 5
+    assert limiter.in_flight == 0
+
+def test_limiter_never_drops_below_minimum():
+    limiter = RateLimiter(initial=2, minimum=1, cooldown=0)
+    for _ in range(5):
+        limiter.release(response(429))
+    assert limiter.limit == 1
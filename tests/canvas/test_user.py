@@ -0,0 +1,65 @@
+from coursework import canvas
+
+from ..helpers import requests_made
+
+def test_sync_students(fake_canvas, fake_course, monkeypatch):
+    monkeypatch.setattr(canvas.user, '_migrated', set())
+    api = fake_course.api
+    students = [
+        {'id': 7, 'name': 'Seven'},
+        {'id': 1007, 'name': 'One Thousand Seven'},
+        {'id': 1008, 'name': 'One Thousand Eight'},
+    ]
+    # Left behind by older versions: migrated on first use
+    canvas.user.set_data(api, 'student-db', {'7': {'id': 7, 'name': 'Old'}})
+
+    assert requests_made(
+        fake_canvas, canvas.user.sync_students, api, students,
+    ) == {
+        'DELETE users/self/custom_data/:id': 1,
+        'GET users/self': 1,
+        'GET users/self/custom_data/:id': 8,
+        'PUT users/self/custom_data/:id': 4,
+        'PUT users/self/custom_data/:id/7': 1,
+    }
+    assert canvas.user.get_data(api, 'student-db') is None
+    version = canvas.user.get_data(api, canvas.metadata.VERSION_KEY)
+    assert version
+
+    assert requests_made(
+        fake_canvas, canvas.user.sync_students, api, students,
+    ) == {
+        'GET users/self': 1,
+        'GET users/self/custom_data/:id': 2,
+    }
+
+    students[2] = dict(students[2], name='Eight')
+    assert requests_made(
+        fake_canvas, canvas.user.sync_students, api, students,
+    ) == {
+        'GET users/self': 1,
+        # The two shards, then the version stamp
+        'GET users/self/custom_data/:id': 3,
+        # Only the changed student, then a new version stamp
+        'PUT users/self/custom_data/:id/1008': 1,
+        'PUT users/self/custom_data/:id': 1,
+    }
+    assert canvas.user.get_data(api, canvas.metadata.VERSION_KEY) != version
+    db = canvas.user._get_student_db(api, [1008])
+    assert db == {'1007': students[1], '1008': students[2]}
+
+def test_synced_students_reach_the_metadata_mirror(fake_canvas, fake_course,
+                                                   tmp_path, monkeypatch):
+    monkeypatch.setattr(canvas.user, '_migrated', set())
+    api = fake_course.api
+    mirror = canvas.metadata_mirror.MetadataMirror(tmp_path / 'mirror.db')
+    store = canvas.metadata.MetadataStore(api, mirror=mirror)
+    monkeypatch.setattr(canvas.metadata, 'store', lambda api: store)
+    store.load()
+
+    canvas.user.sync_students(api, [{'id': 7, 'name': 'Seven'}])
+    version = canvas.user.get_data(api, canvas.metadata.VERSION_KEY)
+    assert mirror.version(store.account, store.ns) == version
+    assert mirror.load(store.account, store.ns)['student-db-0'] == {
+        '7': {'id': 7, 'name': 'Seven'},
+    }
@@ -1,35 +1,81 @@
 import pytest
 from pathlib import Path
 
-from coursework import canvas
+from larc.rest import total_cache_reset
 
-HERE = Path(__file__).resolve().parent
+from coursework import canvas, hash_cache, hashing
+from coursework.canvas import asset_index, fake
+
+@pytest.fixture(autouse=True)
+def local_hash_cache(tmp_path_factory, monkeypatch):
+    '''Keep the local hash cache (on by default, under ~/.cache) out of
+    the home directory
+    '''
+    path = Path(tmp_path_factory.mktemp('hash-cache'), 'hash-cache.sqlite')
+    monkeypatch.setenv('COURSEWORK_HASH_CACHE', str(path))
+    hash_cache.reset()
+    yield path
+    hash_cache.reset()
+
+@pytest.fixture
+def fake_canvas():
+    '''An in-process fake Canvas serving the shared session
+    '''
+    fake_canvas = fake.FakeCanvas(rate_limit=False)
+    hashing.reset()
+    with fake.serving(canvas.api.get_session(), fake_canvas):
+        yield fake_canvas
+        canvas.metadata.reset()
+    total_cache_reset()
+    canvas.user.reset_self_cache()
+    asset_index.reset()
+
+@pytest.fixture
+def api(fake_canvas):
+    return canvas.api.get_api(fake_canvas.base_url, 'token')
 
 @pytest.fixture
-def api():
-    return canvas.api.get_api_from_config()
+def fake_course(fake_canvas, api):
+    data = fake_canvas.add_course('CSC 101 Request Counting 01')
+    return canvas.course.course_by_id(api(), data['id'])
 
 @pytest.fixture
-def courses(api, vts):
+def fake_course_root(fake_canvas, fake_course, tmp_path):
+    return fake.write_course_dir(
+        tmp_path, fake_course.data, pages=3, assignments=3, quizzes=2,
+        questions=3,
+    )
+
+# The general purpose fixtures below sit on the fake Canvas too, so
+# the suite runs without credentials or network access
+
+@pytest.fixture
+def courses(api, fake_course):
     return canvas.course.courses(api(), do_memo=False)
 
-@pytest.yield_fixture(scope='session')
-def course_root():
-    return Path(HERE, 'course_root').resolve()
+@pytest.fixture
+def course(fake_course):
+    return fake_course
 
 @pytest.fixture
-def course(api, vts):
-    #canvas.course.find_course(courses, year=2018, code='csc122')
-    return canvas.course.course_by_id(api(), 15882)
+def course_root(fake_course_root):
+    return fake_course_root
 
 @pytest.fixture
-def pages(course, vts):
+def pages(course, course_root):
+    canvas.page.sync_pages_from_path(
+        course, course_root, Path(course_root, 'pages'),
+    )
     return canvas.page.pages(course, do_memo=False)
 
 @pytest.fixture
-def page(course, vts):
-    return canvas.page.find_page(course, "Page For Unit Testing")
+def page(course):
+    canvas.page.new_page(course, {
+        'title': 'Page For Unit Testing', 'body': '<p>For unit testing</p>',
+    })
+    return canvas.page.find_page(course, 'Page For Unit Testing')
 
 @pytest.fixture
-def quizzes(course, vts):
+def quizzes(course):
+    canvas.quiz.new_quiz(course, {'title': 'Quiz For Unit Testing'})
     return canvas.quiz.quizzes(course, do_memo=False)
@@ -0,0 +1,74 @@
+import io
+from pathlib import Path
+
+import requests
+import requests.adapters
+from requests.structures import CaseInsensitiveDict
+
+from larc.rest import total_cache_reset
+
+from coursework import canvas
+from coursework.canvas import asset_index, fake
+from coursework.canvas.retry import RetryPolicy
+
+def requests_made(fake_canvas, func, *args, **kwargs):
+    '''Requests func makes of the fake Canvas, by endpoint, starting from
+    empty caches (as in a fresh process)
+    '''
+    total_cache_reset()
+    canvas.metadata.reset()
+    canvas.user.reset_self_cache()
+    asset_index.reset()
+    fake_canvas.reset_counts()
+    func(*args, **kwargs)
+    canvas.metadata.flush_all()
+    return {f'{m} {p}': n for (m, p), n in fake_canvas.requests.items()}
+
+def edit(path: Path, old: str, new: str):
+    content = path.read_text()
+    assert old in content
+    path.write_text(content.replace(old, new))
+
+class ScriptedAdapter(requests.adapters.BaseAdapter):
+    '''Answers requests with a script of (status, headers, body) tuples
+    or exceptions to raise, in order (the last is repeated)
+    '''
+    def __init__(self, *script):
+        super().__init__()
+        self.script = list(script)
+        self.sent = []
+        self.bodies = []
+
+    def send(self, request: requests.PreparedRequest, **kw):
+        self.sent.append(request)
+        self.bodies.append(fake.body_bytes(request.body))
+        step = self.script.pop(0) if len(self.script) > 1 else self.script[0]
+        if isinstance(step, Exception):
+            raise step
+        status, headers, body = step
+        response = requests.Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict(headers)
+        if kw.get('stream'):
+            # Read on demand, as from a real connection
+            response.raw = io.BytesIO(body)
+        else:
+            response._content = body
+            response._content_consumed = True
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+def scripted_session(*script, **session_kw):
+    '''A CanvasSession (retrying without sleeping) answered by a
+    ScriptedAdapter
+    '''
+    session_kw.setdefault('retry', RetryPolicy(backoff=0))
+    session = canvas.api.new_session(**session_kw)
+    adapter = ScriptedAdapter(*script)
+    session.mount('https://', adapter)
+    return session, adapter
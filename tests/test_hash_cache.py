@@ -0,0 +1,43 @@
+import hashlib
+
+from coursework import hash_cache
+
+def test_hash_cache_skips_unchanged_files(local_hash_cache, tmp_path,
+                                          monkeypatch):
+    digests = []
+    stream_digest = hash_cache.stream_digest
+    monkeypatch.setattr(
+        hash_cache, 'stream_digest',
+        lambda *a, **kw: digests.append(a) or stream_digest(*a, **kw),
+    )
+
+    path = tmp_path / 'image.png'
+    path.write_bytes(b'first')
+    assert hash_cache.file_hash(path) == hashlib.md5(b'first').hexdigest()
+    hash_cache.reset()
+    # A fresh process reads the hash back from SQLite
+    assert hash_cache.file_hash(path) == hashlib.md5(b'first').hexdigest()
+    assert len(digests) == 1
+
+    path.write_bytes(b'second, longer')
+    assert hash_cache.file_hash(path) == hashlib.md5(
+        b'second, longer'
+    ).hexdigest()
+    assert len(digests) == 2
+    assert local_hash_cache.exists()
+
+def test_text_hash_reads_line_endings_as_read_text_does(tmp_path):
+    path = tmp_path / 'page.md'
+    path.write_bytes(b'\xef\xbb\xbf# Title\r\n\r\nBody\rEnd\r')
+    expected = hashlib.md5(path.read_text().encode('utf-8')).hexdigest()
+
+    assert hash_cache.file_hash(path, text=True) == expected
+    # A CRLF split across chunks is one line ending
+    for chunk_size in [1, 2, 9]:
+        assert hash_cache.stream_digest(
+            path, chunk_size=chunk_size, text=True,
+        ) == expected
+    # Cached apart from the raw digest
+    assert hash_cache.file_hash(path) == hashlib.md5(
+        path.read_bytes()
+    ).hexdigest()
@@ -0,0 +1,27 @@
+from pathlib import Path
+
+from coursework import canvas, hashing
+
+from .helpers import requests_made, edit
+
+def test_hash_algorithm_migrates_lazily(fake_canvas, fake_course,
+                                        fake_course_root, monkeypatch):
+    path = Path(fake_course_root, 'pages', 'page-002.md')
+    sync = canvas.page.sync_page_from_path(fake_course, fake_course_root)
+    sync(path)
+
+    monkeypatch.setenv('COURSEWORK_HASH_ALGORITHM', 'blake2b')
+    hashing.reset()
+    # The stored MD5 still matches the unchanged file
+    assert requests_made(fake_canvas, sync, path) == {
+        'GET courses/:id/pages': 1,
+        'GET courses/:id/pages/:id': 1,
+        'GET users/self': 1,
+        'GET users/self/custom_data': 1,
+    }
+
+    edit(path, 'Some *content*', 'Some *new content*')
+    page = sync(path)
+    stored = canvas.metadata.get_metadata(page)['hash']
+    assert stored == hashing.digest(path.read_bytes())
+    assert stored.startswith('blake2b:')